@@ -76,6 +76,13 @@ def clear_clipboard(params):
     except Exception as e:
         return {'status': 'error', 'action': 'clear', 'message': str(e)}
 
+actions = {
+    'copy': copy_text,
+    'paste': paste_text,
+    'get': get_clipboard,
+    'clear': clear_clipboard
+}
+
 def main():
     if len(sys.argv) < 2:
         print(json.dumps({'status': 'error', 'message': 'Usage: python clipboard.py <action> [params]'}))
@@ -93,13 +100,6 @@ def main():
         except:
             params = {}
     
-    actions = {
-        'copy': copy_text,
-        'paste': paste_text,
-        'get': get_clipboard,
-        'clear': clear_clipboard
-    }
-    
     if action in actions:
         result = actions[action](params)
     else:
@@ -1,14 +1,84 @@
-import pyautogui
 import json
 import sys
 import os
 import platform
-from PIL import Image
 import subprocess
 import time
 
-pyautogui.FAILSAFE = True
-pyautogui.PAUSE = 0.1
+_LAZY_IMPORT_DIR = os.path.dirname(os.path.abspath(__file__))
+if _LAZY_IMPORT_DIR not in sys.path:
+    sys.path.insert(0, _LAZY_IMPORT_DIR)
+from lazy_import import LazyModule
+
+def _configure_pyautogui(module):
+    module.FAILSAFE = True
+    module.PAUSE = 0
+
+pyautogui = LazyModule('pyautogui', _configure_pyautogui)
+Image = LazyModule('PIL.Image')
+ImageGrab = LazyModule('PIL.ImageGrab')
+
+# 输入稳定检测：注入事件后先等X服务器处理完，再通过降采样的区域截图判断
+# 画面是否已停止变化，取代固定的sleep。
+SETTLE_TIMEOUT = 1.0
+SETTLE_POLL_INTERVAL = 0.02
+SETTLE_RADIUS = 160
+SETTLE_DOWNSCALE = 4
+SETTLE_FULLSCREEN_DOWNSCALE = 16
+SETTLE_TOLERANCE = 2
+SETTLE_STABLE_FRAMES = 2
+# 按住按键后的移动需要中间的移动事件，瞬移到终点时很多程序不会开始拖放
+DRAG_DURATION = 0.2
+
+def _sync_input():
+    x11 = sys.modules.get('pyautogui._pyautogui_x11')
+    display = getattr(x11, '_display', None)
+    if display is not None:
+        display.sync()
+
+def _settle_region(point):
+    if point is None:
+        return None
+    width, height = pyautogui.size()
+    x, y = int(point[0]), int(point[1])
+    left, top = max(0, x - SETTLE_RADIUS), max(0, y - SETTLE_RADIUS)
+    right, bottom = min(width, x + SETTLE_RADIUS), min(height, y + SETTLE_RADIUS)
+    if right <= left or bottom <= top:
+        return None
+    return (left, top, right, bottom)
+
+def _grab_frame(bbox):
+    img = ImageGrab.grab(bbox=bbox)
+    factor = SETTLE_DOWNSCALE if bbox else SETTLE_FULLSCREEN_DOWNSCALE
+    return img.convert('L').reduce(factor).tobytes()
+
+def _frames_match(a, b):
+    if len(a) != len(b):
+        return False
+    changed = sum(1 for p, q in zip(a, b) if abs(p - q) > 8)
+    return changed <= SETTLE_TOLERANCE
+
+def _settle(params, point=None):
+    """等待注入的输入生效、受影响区域画面稳定，返回实际等待时间(秒)"""
+    timeout = params.get('settle_timeout', SETTLE_TIMEOUT)
+    start = time.perf_counter()
+    if not timeout:
+        return 0.0
+    try:
+        _sync_input()
+        bbox = _settle_region(point)
+        previous = _grab_frame(bbox)
+        stable = 0
+        while time.perf_counter() - start < timeout:
+            time.sleep(SETTLE_POLL_INTERVAL)
+            current = _grab_frame(bbox)
+            stable = stable + 1 if _frames_match(previous, current) else 0
+            if stable >= SETTLE_STABLE_FRAMES:
+                break
+            previous = current
+    except Exception:
+        pass
+    return round(time.perf_counter() - start, 4)
 
 def screenshot(params):
     path = params.get('path', '/tmp/screenshot.png')
@@ -50,10 +120,11 @@ def screenshot(params):
 def move(params):
     x = params.get('x', 0)
     y = params.get('y', 0)
-    duration = params.get('duration', 0.2)
+    duration = params.get('duration', 0)
     try:
         pyautogui.moveTo(x, y, duration=duration)
-        return {'status': 'success', 'action': 'move', 'x': x, 'y': y}
+        settle_time = _settle(params, (x, y))
+        return {'status': 'success', 'action': 'move', 'x': x, 'y': y, 'settle_time': settle_time}
     except Exception as e:
         return {'status': 'error', 'action': 'move', 'message': str(e)}
 
@@ -62,13 +133,16 @@ def click(params):
     y = params.get('y')
     button = params.get('button', 'left')
     clicks = params.get('clicks', 1)
-    duration = params.get('duration', 0.1)
+    duration = params.get('duration', 0)
     try:
         if x is not None and y is not None:
             pyautogui.click(x, y, clicks=clicks, button=button, duration=duration)
+            point = (x, y)
         else:
             pyautogui.click(clicks=clicks, button=button)
-        return {'status': 'success', 'action': 'click', 'x': x, 'y': y, 'button': button, 'clicks': clicks}
+            point = tuple(pyautogui.position())
+        settle_time = _settle(params, point)
+        return {'status': 'success', 'action': 'click', 'x': x, 'y': y, 'button': button, 'clicks': clicks, 'settle_time': settle_time}
     except Exception as e:
         return {'status': 'error', 'action': 'click', 'message': str(e)}
 
@@ -84,11 +158,16 @@ def right_click(params):
 def drag(params):
     start = params.get('start', [0, 0])
     end = params.get('end', [0, 0])
-    duration = params.get('duration', 0.5)
+    duration = params.get('duration', DRAG_DURATION)
     try:
         pyautogui.moveTo(start[0], start[1])
-        pyautogui.drag(end[0] - start[0], end[1] - start[1], duration=duration, button='left')
-        return {'status': 'success', 'action': 'drag', 'start': start, 'end': end}
+        pyautogui.mouseDown(button='left')
+        settle_time = _settle(params, start)
+        pyautogui.moveTo(end[0], end[1], duration=duration)
+        settle_time += _settle(params, end)
+        pyautogui.mouseUp(button='left')
+        settle_time += _settle(params, end)
+        return {'status': 'success', 'action': 'drag', 'start': start, 'end': end, 'settle_time': round(settle_time, 4)}
     except Exception as e:
         return {'status': 'error', 'action': 'drag', 'message': str(e)}
 
@@ -101,9 +180,12 @@ def scroll(params):
         scroll_amount = amount if direction == 'up' else -amount
         if x is not None and y is not None:
             pyautogui.scroll(scroll_amount, x, y)
+            point = (x, y)
         else:
             pyautogui.scroll(scroll_amount)
-        return {'status': 'success', 'action': 'scroll', 'direction': direction, 'amount': amount}
+            point = tuple(pyautogui.position())
+        settle_time = _settle(params, point)
+        return {'status': 'success', 'action': 'scroll', 'direction': direction, 'amount': amount, 'settle_time': settle_time}
     except Exception as e:
         return {'status': 'error', 'action': 'scroll', 'message': str(e)}
 
@@ -124,7 +206,8 @@ def type_text(params):
             pyautogui.hotkey('ctrl', 'v')
         else:
             pyautogui.typewrite(text, interval=interval)
-        return {'status': 'success', 'action': 'type', 'text': text, 'length': len(text)}
+        settle_time = _settle(params)
+        return {'status': 'success', 'action': 'type', 'text': text, 'length': len(text), 'settle_time': settle_time}
     except Exception as e:
         return {'status': 'error', 'action': 'type', 'message': str(e)}
 
@@ -132,7 +215,8 @@ def key(params):
     key = params.get('key', 'enter')
     try:
         pyautogui.press(key)
-        return {'status': 'success', 'action': 'key', 'key': key}
+        settle_time = _settle(params)
+        return {'status': 'success', 'action': 'key', 'key': key, 'settle_time': settle_time}
     except Exception as e:
         return {'status': 'error', 'action': 'key', 'message': str(e)}
 
@@ -140,7 +224,8 @@ def hotkey(params):
     keys = params.get('keys', [])
     try:
         pyautogui.hotkey(*keys)
-        return {'status': 'success', 'action': 'hotkey', 'keys': keys}
+        settle_time = _settle(params)
+        return {'status': 'success', 'action': 'hotkey', 'keys': keys, 'settle_time': settle_time}
     except Exception as e:
         return {'status': 'error', 'action': 'hotkey', 'message': str(e)}
 
@@ -175,19 +260,84 @@ def locate_and_click(params):
         if location:
             center = pyautogui.center(location)
             pyautogui.click(center.x, center.y)
+            settle_time = _settle(params, (center.x, center.y))
             return {
                 'status': 'success',
                 'action': 'locate_and_click',
                 'found': True,
                 'clicked': True,
                 'x': center.x,
-                'y': center.y
+                'y': center.y,
+                'settle_time': settle_time
             }
         else:
             return {'status': 'success', 'action': 'locate_and_click', 'found': False, 'clicked': False}
     except Exception as e:
         return {'status': 'error', 'action': 'locate_and_click', 'message': str(e)}
 
+def batch(params):
+    steps = params.get('steps', [])
+    delay = params.get('delay', 0)
+    stop_on_error = params.get('stop_on_error', True)
+    results = []
+    failed = []
+    batch_start = time.perf_counter()
+    for index, step in enumerate(steps):
+        if index > 0 and delay:
+            time.sleep(delay)
+        step = step if isinstance(step, dict) else {}
+        name = step.get('action', '')
+        step_params = step.get('params')
+        if step_params is None:
+            step_params = {k: v for k, v in step.items() if k != 'action'}
+        step_start = time.perf_counter()
+        if name == 'batch':
+            result = {'status': 'error', 'action': name, 'message': 'Nested batch steps are not allowed'}
+        elif name not in actions:
+            result = {'status': 'error', 'action': name, 'message': f'Unknown action: {name}'}
+        else:
+            result = actions[name](dict(step_params))
+        results.append({
+            'step': index,
+            'action': name,
+            'duration': round(time.perf_counter() - step_start, 4),
+            'result': result
+        })
+        if result.get('status') != 'success':
+            failed.append(index)
+            if stop_on_error:
+                break
+    response = {
+        'status': 'error' if failed else 'success',
+        'action': 'batch',
+        'total_steps': len(steps),
+        'completed': len(results),
+        'failed_steps': failed,
+        'duration': round(time.perf_counter() - batch_start, 4),
+        'steps': results
+    }
+    if failed:
+        first = results[failed[0]]
+        response['message'] = f"Step {failed[0]} ({first['action']}) failed: {first['result'].get('message')}"
+    return response
+
+actions = {
+    'screenshot': screenshot,
+    'move': move,
+    'click': click,
+    'double_click': double_click,
+    'right_click': right_click,
+    'drag': drag,
+    'scroll': scroll,
+    'position': position,
+    'type': type_text,
+    'key': key,
+    'hotkey': hotkey,
+    'locate': locate,
+    'locate_and_click': locate_and_click,
+    'batch': batch
+}
+
 def main():
     if len(sys.argv) < 2:
         print(json.dumps({'status': 'error', 'message': 'Usage: python desktop.py <action> [params]'}))
@@ -205,22 +355,6 @@ def main():
         except:
             params = {}
     
-    actions = {
-        'screenshot': screenshot,
-        'move': move,
-        'click': click,
-        'double_click': double_click,
-        'right_click': right_click,
-        'drag': drag,
-        'scroll': scroll,
-        'position': position,
-        'type': type_text,
-        'key': key,
-        'hotkey': hotkey,
-        'locate': locate,
-        'locate_and_click': locate_and_click
-    }
-    
     if action in actions:
         result = actions[action](params)
     else:
@@ -0,0 +1,293 @@
+"""
+backend_pool.py - 多Ollama实例负载均衡模块
+
+在多个Ollama服务之间分配聊天请求：
+1. 选择健康且负载最低的实例（按进行中的请求数和延迟EWMA综合打分）
+2. 同一对话固定使用同一实例，保持该实例上的提示词KV缓存
+3. 请求失败达到阈值的实例被标记为不健康，之后按间隔用test_connection/list_models重新检查；
+   只有连接错误和5xx计为实例失败，客户端自己的超时、取消和4xx不影响实例状态
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Callable, Iterator
+
+import requests
+
+
+DEFAULT_LATENCY = 1.0
+
+
+class OllamaBackend:
+    """
+    单个Ollama实例的状态
+
+    Attributes:
+        base_url: Ollama API基础URL
+        in_flight: 进行中的请求数
+        latency_ewma: 请求耗时的指数加权移动平均(秒)，尚无数据时为None
+        healthy: 是否健康
+        failures: 连续失败次数
+        requests: 累计请求数
+        errors: 累计失败数
+        last_check: 上次健康检查时间(monotonic)
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        self.healthy = True
+        self.failures = 0
+        self.requests = 0
+        self.errors = 0
+        self.last_check = 0.0
+
+    def load_score(self) -> float:
+        """
+        负载评分，越小越空闲
+
+        Returns:
+            float: (进行中的请求数 + 1) * 平均延迟
+        """
+        latency = self.latency_ewma if self.latency_ewma is not None else DEFAULT_LATENCY
+        return (self.in_flight + 1) * latency
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        转换为字典格式
+
+        Returns:
+            Dict: 实例状态
+        """
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "latency_ewma": round(self.latency_ewma, 4) if self.latency_ewma is not None else None,
+            "requests": self.requests,
+            "errors": self.errors
+        }
+
+
+def default_health_check(base_url: str, model: Optional[str] = None) -> bool:
+    """
+    检查Ollama实例是否可用
+
+    Args:
+        base_url: Ollama API基础URL
+        model: 需要的模型，为None时只检查连接
+
+    Returns:
+        bool: 可用返回True
+    """
+    from ollama_tools import test_connection, list_models
+
+    if not test_connection(base_url):
+        return False
+    return model is None or model in list_models(base_url)
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """
+    判断请求异常是否说明实例本身有问题
+
+    连接失败（包括连接超时和流中途断开）和5xx计为实例失败；读取超时（通常来自调用方
+    按时间预算缩短的超时）、流中的错误分块、取消和4xx是请求本身的问题，不计入。
+
+    Args:
+        error: with块中抛出的异常
+
+    Returns:
+        bool: 应计为实例失败时返回True
+    """
+    if isinstance(error, requests.exceptions.HTTPError):
+        response = error.response
+        return response is None or response.status_code >= 500
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError))
+
+
+class OllamaBackendPool:
+    """
+    Ollama实例池
+
+    用法:
+        pool = OllamaBackendPool(["http://gpu1:11434", "http://gpu2:11434"])
+        with pool.lease("conversation-1") as backend:
+            ...  # 向backend.base_url发送请求
+    """
+
+    def __init__(
+        self,
+        base_urls: List[str],
+        model: Optional[str] = None,
+        ewma_alpha: float = 0.3,
+        max_failures: int = 2,
+        health_interval: float = 30.0,
+        max_conversations: int = 1024,
+        health_check: Optional[Callable[[str], bool]] = None
+    ):
+        """
+        初始化实例池
+
+        Args:
+            base_urls: Ollama API基础URL列表
+            model: 健康检查要求实例上存在的模型，为None时只检查连接
+            ewma_alpha: 延迟EWMA的平滑系数 (0-1)，越大越偏重最近的请求
+            max_failures: 连续失败多少次后标记为不健康
+            health_interval: 不健康实例的重新检查间隔(秒)
+            max_conversations: 最多记住的对话-实例绑定数（按LRU淘汰）
+            health_check: 健康检查函数 f(base_url) -> bool，为None时使用default_health_check
+        """
+        if not base_urls:
+            raise ValueError("At least one Ollama base_url is required")
+        self.backends = [OllamaBackend(url) for url in base_urls]
+        self.model = model
+        self.ewma_alpha = ewma_alpha
+        self.max_failures = max(1, max_failures)
+        self.health_interval = health_interval
+        self.max_conversations = max_conversations
+        self.health_check = health_check or (lambda url: default_health_check(url, self.model))
+        self._sticky: "OrderedDict[str, OllamaBackend]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check_health(self, backend: Optional[OllamaBackend] = None) -> None:
+        """
+        立即检查实例健康状况
+
+        Args:
+            backend: 要检查的实例，为None时检查全部实例
+        """
+        for item in [backend] if backend is not None else list(self.backends):
+            try:
+                healthy = bool(self.health_check(item.base_url))
+            except Exception:
+                healthy = False
+            with self._lock:
+                item.healthy = healthy
+                item.last_check = time.monotonic()
+                if healthy:
+                    item.failures = 0
+
+    def _recheck_unhealthy(self) -> None:
+        """重新检查超过检查间隔的不健康实例"""
+        now = time.monotonic()
+        with self._lock:
+            due = [b for b in self.backends if not b.healthy and now - b.last_check >= self.health_interval]
+            for backend in due:
+                backend.last_check = now
+        for backend in due:
+            self.check_health(backend)
+
+    def acquire(self, conversation_id: Optional[str] = None) -> OllamaBackend:
+        """
+        选择一个实例并计入进行中的请求
+
+        对话已绑定的实例仍健康时继续使用该实例；否则选择负载评分最低的健康实例。
+        所有实例都不健康时选择负载最低的实例（仍然尝试发送）。
+
+        Args:
+            conversation_id: 对话ID，为None时不绑定
+
+        Returns:
+            OllamaBackend: 选中的实例，使用完后需调用release
+        """
+        self._recheck_unhealthy()
+        with self._lock:
+            backend = self._sticky.get(conversation_id) if conversation_id is not None else None
+            if backend is None or not backend.healthy:
+                candidates = [b for b in self.backends if b.healthy] or self.backends
+                backend = min(candidates, key=lambda b: (b.load_score(), b.requests))
+            if conversation_id is not None:
+                self._sticky[conversation_id] = backend
+                self._sticky.move_to_end(conversation_id)
+                while len(self._sticky) > self.max_conversations:
+                    self._sticky.popitem(last=False)
+            backend.in_flight += 1
+            backend.requests += 1
+            return backend
+
+    def release(
+        self,
+        backend: OllamaBackend,
+        latency: Optional[float] = None,
+        success: Optional[bool] = True
+    ) -> None:
+        """
+        结束一次请求并更新实例状态
+
+        Args:
+            backend: acquire返回的实例
+            latency: 请求耗时(秒)
+            success: 请求是否成功；None表示结果与实例无关，只释放占用，不计失败也不更新延迟
+        """
+        with self._lock:
+            backend.in_flight = max(0, backend.in_flight - 1)
+            if success is None:
+                return
+            if success:
+                backend.failures = 0
+                if latency is not None:
+                    if backend.latency_ewma is None:
+                        backend.latency_ewma = latency
+                    else:
+                        backend.latency_ewma += self.ewma_alpha * (latency - backend.latency_ewma)
+                return
+            backend.errors += 1
+            backend.failures += 1
+            if backend.failures >= self.max_failures:
+                backend.healthy = False
+                backend.last_check = time.monotonic()
+
+    @contextmanager
+    def lease(self, conversation_id: Optional[str] = None) -> Iterator[OllamaBackend]:
+        """
+        在with块中占用一个实例，退出时自动释放
+
+        块内抛出的异常按is_backend_failure分类：连接错误和5xx计为实例失败，
+        其余异常（客户端超时、取消、4xx等）只释放占用。
+
+        Args:
+            conversation_id: 对话ID
+
+        Yields:
+            OllamaBackend: 选中的实例
+        """
+        backend = self.acquire(conversation_id)
+        start = time.perf_counter()
+        try:
+            yield backend
+        except BaseException as e:
+            self.release(backend, success=False if is_backend_failure(e) else None)
+            raise
+        self.release(backend, latency=time.perf_counter() - start)
+
+    def forget(self, conversation_id: str) -> None:
+        """
+        解除对话与实例的绑定
+
+        Args:
+            conversation_id: 对话ID
+        """
+        with self._lock:
+            self._sticky.pop(conversation_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取实例池状态
+
+        Returns:
+            Dict: {backends, healthy, conversations}
+        """
+        with self._lock:
+            return {
+                "backends": [backend.to_dict() for backend in self.backends],
+                "healthy": sum(1 for backend in self.backends if backend.healthy),
+                "conversations": len(self._sticky)
+            }
@@ -0,0 +1,156 @@
+"""
+context_window.py - 上下文窗口(num_ctx)自动选择模块
+
+num_ctx设得太大会浪费KV缓存内存和prefill时间，设得太小Ollama会静默截断提示词。
+本模块按估算的提示词token数为每次请求选择options.num_ctx：
+1. 用token_estimator估算系统提示词、工具定义和消息的token数，加上输出预留
+2. 只从少数几个档位中选择：Ollama在num_ctx变化时会重新加载模型，档位越少重新加载越少
+3. 每个模型的档位只增不减，对话变长需要时才升档
+4. 根据响应中的prompt_eval_count校准估算值（只向上校准，避免截断）
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import threading
+from typing import Dict, Any, Optional, Iterable, Tuple
+
+
+DEFAULT_BUCKETS: Tuple[int, ...] = (2048, 4096, 8192, 16384, 32768)
+
+# 估算值的最大校准倍数
+MAX_RATIO = 3.0
+
+
+class ContextWindowSizer:
+    """
+    按提示词长度选择num_ctx档位
+
+    用法:
+        sizer = ContextWindowSizer()
+        caller = OllamaToolCaller(context_window=sizer)
+        caller.chat_with_tool_execution("...")
+        print(sizer.stats())
+    """
+
+    def __init__(
+        self,
+        buckets: Iterable[int] = DEFAULT_BUCKETS,
+        reserve_tokens: int = 1024,
+        headroom: float = 1.1
+    ):
+        """
+        初始化档位选择器
+
+        Args:
+            buckets: 可选的num_ctx档位
+            reserve_tokens: 为模型输出预留的token数（请求设置了num_predict时使用num_predict）
+            headroom: 估算值的安全系数
+        """
+        self.buckets = tuple(sorted(set(buckets)))
+        if not self.buckets:
+            raise ValueError("At least one num_ctx bucket is required")
+        self.reserve_tokens = reserve_tokens
+        self.headroom = headroom
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, model: str) -> Dict[str, Any]:
+        """获取模型的档位状态（调用方需持有self._lock）"""
+        state = self._models.get(model)
+        if state is None:
+            state = self._models[model] = {
+                "num_ctx": 0, "ratio": 1.0, "requests": 0, "grows": 0, "overflows": 0, "max_needed": 0
+            }
+        return state
+
+    def size(self, model: str, prompt_tokens: int, num_predict: Optional[int] = None) -> int:
+        """
+        为一次请求选择num_ctx
+
+        Args:
+            model: 模型名称
+            prompt_tokens: 估算的提示词token数
+            num_predict: 请求的num_predict，为None或不大于0时预留reserve_tokens
+
+        Returns:
+            int: num_ctx（不小于该模型之前选择过的档位；超出最大档位时为最大档位）
+        """
+        reserve = num_predict if num_predict and num_predict > 0 else self.reserve_tokens
+        with self._lock:
+            state = self._state(model)
+            needed = int(prompt_tokens * state["ratio"] * self.headroom) + reserve
+            bucket = next((b for b in self.buckets if b >= needed), self.buckets[-1])
+            state["requests"] += 1
+            state["max_needed"] = max(state["max_needed"], needed)
+            if needed > self.buckets[-1]:
+                state["overflows"] += 1
+            if bucket > state["num_ctx"]:
+                if state["num_ctx"]:
+                    state["grows"] += 1
+                state["num_ctx"] = bucket
+            return state["num_ctx"]
+
+    def observe(self, model: str, estimated_tokens: int, prompt_eval_count: int) -> None:
+        """
+        用实际的提示词token数校准估算值
+
+        Ollama复用KV缓存前缀时prompt_eval_count只包含新计算的token，
+        因此只在实际值大于估算值时向上校准。
+
+        Args:
+            model: 模型名称
+            estimated_tokens: 请求时估算的提示词token数
+            prompt_eval_count: 响应中的prompt_eval_count
+        """
+        if estimated_tokens <= 0 or prompt_eval_count <= estimated_tokens:
+            return
+        with self._lock:
+            state = self._state(model)
+            state["ratio"] = min(MAX_RATIO, max(state["ratio"], prompt_eval_count / estimated_tokens))
+
+    def current(self, model: str) -> Optional[int]:
+        """
+        获取模型当前的档位
+
+        Args:
+            model: 模型名称
+
+        Returns:
+            Optional[int]: num_ctx，尚未选择过时为None
+        """
+        with self._lock:
+            state = self._models.get(model)
+            return state["num_ctx"] or None if state else None
+
+    def reset(self, model: Optional[str] = None) -> None:
+        """
+        清除档位状态（下一次请求重新从最小的合适档位开始）
+
+        Args:
+            model: 模型名称，为None时清除所有模型
+        """
+        with self._lock:
+            if model is None:
+                self._models.clear()
+            else:
+                self._models.pop(model, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取档位统计
+
+        Returns:
+            Dict: {"buckets", "models": {模型: {num_ctx, ratio, requests, grows, overflows, max_needed}}}；
+                overflows为需要的token数超过最大档位（会被截断）的请求数
+        """
+        with self._lock:
+            return {
+                "buckets": list(self.buckets),
+                "models": {
+                    model: {key: round(value, 3) if isinstance(value, float) else value
+                            for key, value in state.items()}
+                    for model, state in self._models.items()
+                }
+            }
@@ -0,0 +1,251 @@
+"""
+conversation_context.py - 对话上下文预算模块
+
+chat_with_tool_execution每轮都会把完整的工具结果追加到对话中，window_list、OCR文本、
+截图Base64等大结果会让之后每一轮的prefill越来越慢。本模块在每次请求前按token预算压缩对话：
+1. 丢弃过期的截图（旧消息中的images和Base64数据）
+2. 超出预算时从旧到新把工具结果压缩为结构化摘要（保留status等关键字段，截断长文本和长列表）
+3. 仍然超出预算时从最旧的轮次开始整轮删除
+系统提示词、最后一条用户消息和最近一轮（最后一条助手消息及其工具结果）始终保持原样。
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import json
+import re
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from token_estimator import estimate_prompt_tokens
+
+
+DEFAULT_TOKEN_BUDGET = 8192
+
+# 摘要中始终保留的字段
+KEY_FIELDS = (
+    "status", "success", "action", "message", "error", "found", "clicked",
+    "x", "y", "width", "height", "path", "count", "title", "window_id", "text_length"
+)
+
+_BASE64_PATTERN = re.compile(r"^[A-Za-z0-9+/]+={0,2}$")
+
+BASE64_MIN_LENGTH = 256
+
+# 已经截断过的字符串/列表的标记，避免重复压缩时再次截断
+_TRUNCATED_PATTERN = re.compile(r"\.\.\.\[\d+ more (chars|items)\]$")
+
+
+def _is_base64(value: str) -> bool:
+    """判断字符串是否像Base64编码的二进制数据"""
+    if len(value) < BASE64_MIN_LENGTH:
+        return False
+    return bool(_BASE64_PATTERN.match(value.replace("\n", "")))
+
+
+def _strip_base64(value: Any) -> Tuple[Any, int]:
+    """
+    把数据中的Base64字符串替换为占位符
+
+    Returns:
+        Tuple[Any, int]: (处理后的数据, 替换的数量)
+    """
+    if isinstance(value, str):
+        if _is_base64(value):
+            return f"[base64 omitted, {len(value)} chars]", 1
+        return value, 0
+    if isinstance(value, dict):
+        result, count = {}, 0
+        for key, item in value.items():
+            result[key], n = _strip_base64(item)
+            count += n
+        return result, count
+    if isinstance(value, list):
+        result, count = [], 0
+        for item in value:
+            stripped, n = _strip_base64(item)
+            result.append(stripped)
+            count += n
+        return result, count
+    return value, 0
+
+
+def summarize_value(value: Any, max_chars: int = 200, max_items: int = 3, depth: int = 0) -> Any:
+    """
+    生成工具结果的结构化摘要
+
+    字典保留KEY_FIELDS和短的标量字段，长字符串截断，长列表只保留前几项并注明省略数量，
+    嵌套超过两层的结构只保留大小。
+
+    Args:
+        value: 工具结果（JSON数据）
+        max_chars: 字符串最大保留长度
+        max_items: 列表最多保留的项数
+        depth: 当前嵌套深度
+
+    Returns:
+        Any: 摘要
+    """
+    if isinstance(value, str):
+        if _is_base64(value):
+            return f"[base64 omitted, {len(value)} chars]"
+        if len(value) > max_chars and not _TRUNCATED_PATTERN.search(value):
+            return f"{value[:max_chars]}...[{len(value) - max_chars} more chars]"
+        return value
+    if isinstance(value, list):
+        if depth >= 2:
+            return f"[{len(value)} items]"
+        already_truncated = (
+            len(value) == max_items + 1
+            and isinstance(value[-1], str)
+            and _TRUNCATED_PATTERN.search(value[-1])
+        )
+        limit = len(value) if already_truncated else max_items
+        items = [summarize_value(item, max_chars, max_items, depth + 1) for item in value[:limit]]
+        if len(value) > limit:
+            items.append(f"...[{len(value) - limit} more items]")
+        return items
+    if isinstance(value, dict):
+        if depth >= 2:
+            kept = {
+                key: summarize_value(value[key], max_chars, max_items, depth + 1)
+                for key in KEY_FIELDS
+                if key in value and not isinstance(value[key], (dict, list))
+            }
+            return kept or f"{{{len(value)} keys}}"
+        summary = {}
+        for key, item in value.items():
+            limit = max_chars if key in KEY_FIELDS else max_chars // 2
+            summary[key] = summarize_value(item, limit, max_items, depth + 1)
+        return summary
+    return value
+
+
+def summarize_tool_content(content: str, max_chars: int = 200) -> str:
+    """
+    压缩tool消息的内容
+
+    Args:
+        content: tool消息内容（通常为JSON）
+        max_chars: 字符串最大保留长度
+
+    Returns:
+        str: 压缩后的内容
+    """
+    try:
+        data = json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        return summarize_value(content or "", max_chars)
+    return json.dumps(summarize_value(data, max_chars), ensure_ascii=False)
+
+
+class ConversationContext:
+    """
+    对话上下文预算
+
+    用法:
+        context = ConversationContext(token_budget=4096)
+        messages, stats = context.compact(messages, tools)
+    """
+
+    def __init__(
+        self,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        max_summary_chars: int = 200
+    ):
+        """
+        初始化上下文预算
+
+        Args:
+            token_budget: 每次请求的估算token预算（包含工具定义）
+            max_summary_chars: 摘要中字符串的最大保留长度
+        """
+        self.token_budget = token_budget
+        self.max_summary_chars = max_summary_chars
+
+    @staticmethod
+    def _protected_indexes(messages: List[Dict[str, Any]]) -> Set[int]:
+        """系统提示词、最后一条用户消息、最后一条助手消息及之后的消息"""
+        protected = {i for i, message in enumerate(messages) if message.get("role") == "system"}
+        last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=None)
+        if last_user is not None:
+            protected.add(last_user)
+        last_assistant = max((i for i, m in enumerate(messages) if m.get("role") == "assistant"), default=None)
+        if last_assistant is not None:
+            protected.update(range(last_assistant, len(messages)))
+        return protected
+
+    def compact(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: Optional[Any] = None
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        按预算压缩对话
+
+        不修改传入的消息，返回新的消息列表。
+
+        Args:
+            messages: 对话消息
+            tools: 本次请求发送的工具定义或ToolSchemaSet（计入预算）
+
+        Returns:
+            Tuple[List[Dict], Dict]: (压缩后的消息, 统计 {tokens_before, tokens_after,
+                images_dropped, summarized, dropped})
+        """
+        tokens_before = estimate_prompt_tokens(messages, tools)
+        stats = {"tokens_before": tokens_before, "tokens_after": tokens_before,
+                 "images_dropped": 0, "summarized": 0, "dropped": 0}
+
+        protected = self._protected_indexes(messages)
+        result = [dict(message) for message in messages]
+
+        for index, message in enumerate(result):
+            if index in protected:
+                continue
+            if message.get("images"):
+                stats["images_dropped"] += len(message.pop("images"))
+            if message.get("role") == "tool" and isinstance(message.get("content"), str):
+                try:
+                    data = json.loads(message["content"])
+                except json.JSONDecodeError:
+                    continue
+                data, count = _strip_base64(data)
+                if count:
+                    message["content"] = json.dumps(data, ensure_ascii=False)
+                    stats["images_dropped"] += count
+
+        tokens = estimate_prompt_tokens(result, tools)
+        if tokens > self.token_budget:
+            for index, message in enumerate(result):
+                if index in protected or message.get("role") != "tool":
+                    continue
+                summary = summarize_tool_content(message.get("content", ""), self.max_summary_chars)
+                if summary != message.get("content"):
+                    message["content"] = summary
+                    stats["summarized"] += 1
+                    tokens = estimate_prompt_tokens(result, tools)
+                    if tokens <= self.token_budget:
+                        break
+
+        if tokens > self.token_budget:
+            keep = [True] * len(result)
+            index = 0
+            while tokens > self.token_budget and index < len(result):
+                if index in protected:
+                    index += 1
+                    continue
+                # 整轮删除：助手消息连同紧随其后的tool消息
+                end = index + 1
+                if result[index].get("role") == "assistant":
+                    while end < len(result) and result[end].get("role") == "tool" and end not in protected:
+                        end += 1
+                for i in range(index, end):
+                    keep[i] = False
+                    stats["dropped"] += 1
+                index = end
+                tokens = estimate_prompt_tokens([m for m, k in zip(result, keep) if k], tools)
+            result = [m for m, k in zip(result, keep) if k]
+
+        stats["tokens_after"] = tokens
+        return result, stats
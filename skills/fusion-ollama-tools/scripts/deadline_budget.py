@@ -0,0 +1,194 @@
+"""
+deadline_budget.py - 工具循环的时间预算模块
+
+为chat_with_tool_execution设置墙钟截止时间，代替固定的max_iterations和120秒超时：
+1. 把剩余时间分摊到剩余的迭代上，每次模型请求的超时随剩余时间缩短
+2. 剩余时间不足时切换到更便宜的配置：更小的工具子集、限制num_predict、备用模型
+3. 预算耗尽时返回部分结果，并给出各阶段（工具选择、上下文压缩、模型请求、工具执行）的耗时
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Iterator
+
+
+PHASES = ("selection", "context", "llm", "tools")
+
+
+class DeadlineBudget:
+    """
+    一次对话的时间预算
+
+    用法:
+        budget = DeadlineBudget(30, fallback_model="qwen3:1.7b")
+        result = caller.chat_with_tool_execution("...", deadline=budget)
+        print(result["deadline"])  # elapsed / exhausted / degraded_at / phases
+    """
+
+    def __init__(
+        self,
+        seconds: float,
+        min_request_timeout: float = 2.0,
+        timeout_slack: float = 2.0,
+        degrade_below: float = 0.3,
+        fallback_model: Optional[str] = None,
+        degraded_num_predict: Optional[int] = 256,
+        degraded_top_k: int = 3
+    ):
+        """
+        初始化时间预算（从创建时开始计时）
+
+        Args:
+            seconds: 总预算(秒)
+            min_request_timeout: 单次模型请求的最小超时(秒)
+            timeout_slack: 单次请求最多可使用平均每轮预算的倍数
+            degrade_below: 剩余时间低于总预算的该比例时切换到降级配置
+            fallback_model: 降级时使用的备用模型，为None时不切换模型
+            degraded_num_predict: 降级时的num_predict上限，为None时不限制
+            degraded_top_k: 降级时最多发送的检索工具数（已调用过的工具始终保留）
+        """
+        self.seconds = seconds
+        self.min_request_timeout = min_request_timeout
+        self.timeout_slack = timeout_slack
+        self.degrade_below = degrade_below
+        self.fallback_model = fallback_model
+        self.degraded_num_predict = degraded_num_predict
+        self.degraded_top_k = degraded_top_k
+        self.start = time.monotonic()
+        self.degraded_at: Optional[int] = None
+        self.exhausted = False
+        self.phases: Dict[str, float] = {phase: 0.0 for phase in PHASES}
+
+    def elapsed(self) -> float:
+        """
+        已用时间(秒)
+
+        Returns:
+            float: 从创建预算到现在的时间
+        """
+        return time.monotonic() - self.start
+
+    def remaining(self) -> float:
+        """
+        剩余时间(秒)
+
+        Returns:
+            float: 剩余时间，不小于0
+        """
+        return max(0.0, self.seconds - self.elapsed())
+
+    def expired(self) -> bool:
+        """
+        是否已没有足够时间发起新的模型请求
+
+        Returns:
+            bool: 剩余时间小于min_request_timeout时为True
+        """
+        return self.remaining() < self.min_request_timeout
+
+    def request_timeout(self, iterations_left: int, default_timeout: float) -> float:
+        """
+        计算本次模型请求的超时
+
+        平均每轮预算为剩余时间 / 剩余迭代数，本次请求最多使用其timeout_slack倍，
+        且不超过剩余时间和默认超时。
+
+        Args:
+            iterations_left: 包括本轮在内的剩余迭代数
+            default_timeout: 配置中的默认超时(秒)
+
+        Returns:
+            float: 超时(秒)
+        """
+        remaining = self.remaining()
+        share = remaining / max(1, iterations_left) * self.timeout_slack
+        return max(
+            min(self.min_request_timeout, remaining),
+            min(default_timeout, remaining, share)
+        )
+
+    def should_degrade(self) -> bool:
+        """
+        是否应切换到降级配置
+
+        Returns:
+            bool: 剩余时间低于总预算的degrade_below比例时为True
+        """
+        return self.remaining() < self.seconds * self.degrade_below
+
+    def mark_degraded(self, iteration: int) -> None:
+        """
+        记录开始降级的迭代
+
+        Args:
+            iteration: 迭代序号
+        """
+        if self.degraded_at is None:
+            self.degraded_at = iteration
+
+    def degrade_request(self, request_body: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        把请求体改为降级配置（备用模型、num_predict上限）
+
+        Args:
+            request_body: 请求体
+
+        Returns:
+            Dict: 修改后的请求体（同一个对象）
+        """
+        if self.fallback_model:
+            request_body["model"] = self.fallback_model
+        if self.degraded_num_predict is not None:
+            options = dict(request_body.get("options") or {})
+            options["num_predict"] = min(options.get("num_predict", self.degraded_num_predict),
+                                         self.degraded_num_predict)
+            request_body["options"] = options
+        return request_body
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        统计with块的耗时到指定阶段
+
+        Args:
+            name: 阶段名称（selection、context、llm、tools）
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        """
+        把耗时累加到指定阶段
+
+        Args:
+            name: 阶段名称
+            seconds: 耗时(秒)
+        """
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def report(self) -> Dict[str, Any]:
+        """
+        获取预算使用情况
+
+        Returns:
+            Dict: {deadline, elapsed, remaining, exhausted, degraded_at, phases}；
+                phases中的other为未归入任何阶段的耗时
+        """
+        elapsed = self.elapsed()
+        phases = {name: round(value, 4) for name, value in self.phases.items()}
+        phases["other"] = round(max(0.0, elapsed - sum(self.phases.values())), 4)
+        return {
+            "deadline": self.seconds,
+            "elapsed": round(elapsed, 4),
+            "remaining": round(self.remaining(), 4),
+            "exhausted": self.exhausted,
+            "degraded_at": self.degraded_at,
+            "phases": phases
+        }
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+执行模式基准测试
+
+对比ToolExecutor各执行模式的单次工具调用延迟:
+1. spawn - 每次调用启动新进程
+2. forkserver - 预热服务器fork子进程
+3. worker - 每个技能一个常驻工作进程
+4. inprocess - 进程内直接调用
+
+首次调用（包含进程/服务器启动和冷导入）单独统计，其余调用统计均值和分位数。
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import time
+from typing import Dict, Any, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tool_executor import ToolExecutor, EXECUTION_MODES, create_tool_registry
+
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+
+DEFAULT_TOOLS = ["screen_get_size", "desktop_position", "clipboard_get"]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    计算分位数（最近秩法）
+
+    Args:
+        values: 数值列表
+        pct: 分位 (0-100)
+
+    Returns:
+        float: 分位数
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def benchmark_mode(
+    mode: str,
+    tool_names: List[str],
+    iterations: int
+) -> Dict[str, Any]:
+    """
+    测试单个执行模式
+
+    Args:
+        mode: 执行模式
+        tool_names: 要调用的工具名称
+        iterations: 每个工具的调用次数
+
+    Returns:
+        Dict: 测试结果
+    """
+    registry = create_tool_registry()
+    executor = ToolExecutor(base_path=REPO_ROOT, execution_mode=mode)
+    cold: List[float] = []
+    warm: List[float] = []
+    failures = 0
+
+    try:
+        for tool_name in tool_names:
+            tool_info = registry[tool_name]
+            for i in range(iterations):
+                start = time.perf_counter()
+                result = executor.execute_tool(
+                    tool_name=tool_name,
+                    arguments={},
+                    skill_path=tool_info["skill_path"],
+                    skill_action=tool_info["skill_action"]
+                )
+                elapsed = time.perf_counter() - start
+                (cold if i == 0 else warm).append(elapsed)
+                if not result.success:
+                    failures += 1
+    finally:
+        executor.close()
+
+    return {
+        "mode": mode,
+        "calls": len(cold) + len(warm),
+        "failures": failures,
+        "cold_ms": statistics.mean(cold) * 1000 if cold else 0.0,
+        "mean_ms": statistics.mean(warm) * 1000 if warm else 0.0,
+        "p50_ms": percentile(warm, 50) * 1000,
+        "p95_ms": percentile(warm, 95) * 1000
+    }
+
+
+def print_report(results: List[Dict[str, Any]]) -> None:
+    """
+    打印对比表
+
+    Args:
+        results: 各模式的测试结果
+    """
+    print("\n" + "=" * 72)
+    print("执行模式延迟对比 (毫秒)")
+    print("=" * 72)
+    print(f"{'模式':<12}{'调用数':>8}{'失败':>6}{'首次':>10}{'均值':>10}{'P50':>10}{'P95':>10}")
+    print("-" * 72)
+    for r in results:
+        print(
+            f"{r['mode']:<12}{r['calls']:>8}{r['failures']:>6}"
+            f"{r['cold_ms']:>10.2f}{r['mean_ms']:>10.2f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+        )
+    print("=" * 72)
+
+    baseline = next((r for r in results if r["mode"] == "spawn"), None)
+    if baseline and baseline["mean_ms"] > 0:
+        for r in results:
+            if r is not baseline and r["mean_ms"] > 0:
+                print(f"  {r['mode']}: 相对spawn加速 {baseline['mean_ms'] / r['mean_ms']:.1f}x")
+    print("\n注: 失败的调用（如缺少pyautogui或显示环境）同样计入延迟，反映的是调度开销。")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ToolExecutor执行模式基准测试")
+    parser.add_argument("--iterations", type=int, default=20, help="每个工具的调用次数")
+    parser.add_argument("--tools", default=",".join(DEFAULT_TOOLS), help="逗号分隔的工具名称")
+    parser.add_argument(
+        "--modes",
+        default="spawn,forkserver,worker",
+        help=f"逗号分隔的执行模式，可选: {', '.join(EXECUTION_MODES)}"
+    )
+    parser.add_argument("--output", help="将结果保存为JSON文件")
+    args = parser.parse_args()
+
+    tool_names = [name for name in args.tools.split(",") if name]
+    modes = [mode for mode in args.modes.split(",") if mode]
+
+    results = []
+    for mode in modes:
+        print(f"测试模式: {mode} ...")
+        results.append(benchmark_mode(mode, tool_names, args.iterations))
+
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+inference_telemetry.py - 推理遥测模块
+
+Ollama的响应（非流式响应或流的最后一个分块）带有total_duration、load_duration、
+prompt_eval_count、prompt_eval_duration、eval_count、eval_duration等计时字段。本模块：
+1. 把这些字段换算为每次请求的指标（秒、tokens/s、是否发生模型加载、网络和排队开销）
+2. 按模型和按工具集合汇总：解码速度、prefill耗时、模型加载频率以及工具执行耗时
+   （设置了num_ctx的请求还按num_ctx档位汇总，并记录各档位的模型内存占用）
+3. 提供摘要和JSON导出，用于判断延迟来自prefill、解码、模型加载还是工具执行
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import json
+import threading
+from typing import Dict, Any, Optional, Iterable
+
+from tool_schema_cache import ToolSchemaSet
+
+
+NANOSECONDS = 1e9
+
+# load_duration超过该值(秒)视为发生了一次模型加载
+LOAD_THRESHOLD = 0.5
+
+_COUNTERS = (
+    "requests", "cached", "loads", "prompt_tokens", "eval_tokens",
+    "load_time", "prompt_eval_time", "eval_time", "total_time", "wall_time",
+    "tool_calls", "tool_time"
+)
+
+
+def _seconds(response: Dict[str, Any], field: str) -> float:
+    """把纳秒字段换算为秒，字段缺失时为0"""
+    return (response.get(field) or 0) / NANOSECONDS
+
+
+def _rate(tokens: float, seconds: float) -> Optional[float]:
+    """每秒token数，耗时为0时为None"""
+    return round(tokens / seconds, 2) if seconds > 0 else None
+
+
+def inference_metrics(
+    response: Dict[str, Any],
+    wall_time: Optional[float] = None,
+    load_threshold: float = LOAD_THRESHOLD
+) -> Dict[str, Any]:
+    """
+    从Ollama响应中提取一次请求的推理指标
+
+    Args:
+        response: Ollama响应（非流式响应或流的最后一个分块组装后的响应）
+        wall_time: 客户端测得的请求耗时(秒)
+        load_threshold: load_duration超过该值(秒)视为发生了模型加载
+
+    Returns:
+        Dict: {total_duration, load_duration, prompt_eval_duration, eval_duration (秒),
+            prompt_eval_count, eval_count, prefill_tokens_per_sec, decode_tokens_per_sec,
+            loaded, cached, wall_time, overhead}；overhead为客户端耗时减去total_duration
+            （网络传输、排队和请求编码）。调用方可以再附加num_ctx（请求的上下文窗口）
+    """
+    cached = bool(response.get("cached"))
+    total = _seconds(response, "total_duration")
+    load = _seconds(response, "load_duration")
+    prompt_eval = _seconds(response, "prompt_eval_duration")
+    eval_time = _seconds(response, "eval_duration")
+    prompt_tokens = response.get("prompt_eval_count") or 0
+    eval_tokens = response.get("eval_count") or 0
+
+    overhead = None
+    if wall_time is not None and not cached and total > 0:
+        overhead = round(max(0.0, wall_time - total), 4)
+
+    return {
+        "total_duration": round(total, 4),
+        "load_duration": round(load, 4),
+        "prompt_eval_duration": round(prompt_eval, 4),
+        "eval_duration": round(eval_time, 4),
+        "prompt_eval_count": prompt_tokens,
+        "eval_count": eval_tokens,
+        "prefill_tokens_per_sec": _rate(prompt_tokens, prompt_eval),
+        "decode_tokens_per_sec": _rate(eval_tokens, eval_time),
+        "loaded": load >= load_threshold,
+        "cached": cached,
+        "wall_time": round(wall_time, 4) if wall_time is not None else None,
+        "overhead": overhead
+    }
+
+
+def tool_set_key(tools: Optional[Iterable[Dict[str, Any]]]) -> str:
+    """
+    工具集合的标识
+
+    Args:
+        tools: ToolSchemaSet或工具定义列表
+
+    Returns:
+        str: 工具定义的内容哈希，没有工具时为"none"
+    """
+    if not tools:
+        return "none"
+    if not isinstance(tools, ToolSchemaSet):
+        tools = ToolSchemaSet(tools)
+    return tools.digest
+
+
+class InferenceTelemetry:
+    """
+    推理遥测汇总
+
+    用法:
+        telemetry = InferenceTelemetry()
+        caller = OllamaToolCaller(telemetry=telemetry)
+        ...
+        print(telemetry.summary())
+        telemetry.export_json("telemetry.json")
+    """
+
+    def __init__(self):
+        self._by_model: Dict[str, Dict[str, float]] = {}
+        self._by_tool_set: Dict[str, Dict[str, Any]] = {}
+        self._by_num_ctx: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _new_counters() -> Dict[str, float]:
+        return {name: 0 for name in _COUNTERS}
+
+    def _buckets(self, model: str, tools: Optional[Iterable[Dict[str, Any]]]):
+        """获取模型和工具集合的计数（调用方需持有self._lock）"""
+        key = tool_set_key(tools)
+        by_tool_set = self._by_tool_set.get(key)
+        if by_tool_set is None:
+            names = list(tools.names) if isinstance(tools, ToolSchemaSet) else [
+                tool.get("function", {}).get("name", "") for tool in tools or []
+            ]
+            by_tool_set = self._by_tool_set[key] = {"names": names, **self._new_counters()}
+        by_model = self._by_model.setdefault(model, self._new_counters())
+        return by_model, by_tool_set
+
+    def _context_bucket(self, num_ctx: int) -> Dict[str, Any]:
+        """获取num_ctx档位的计数（调用方需持有self._lock）"""
+        bucket = self._by_num_ctx.get(num_ctx)
+        if bucket is None:
+            bucket = self._by_num_ctx[num_ctx] = {"size": None, "size_vram": None, **self._new_counters()}
+        return bucket
+
+    def record(
+        self,
+        model: str,
+        tools: Optional[Iterable[Dict[str, Any]]],
+        metrics: Dict[str, Any]
+    ) -> None:
+        """
+        记录一次请求
+
+        命中响应缓存的请求只计入requests和cached，不计入推理耗时。
+        metrics中有num_ctx时同时计入该档位。
+
+        Args:
+            model: 模型名称
+            tools: 请求发送的工具集合
+            metrics: inference_metrics的返回值
+        """
+        with self._lock:
+            buckets = list(self._buckets(model, tools))
+            if metrics.get("num_ctx"):
+                buckets.append(self._context_bucket(metrics["num_ctx"]))
+            for counters in buckets:
+                counters["requests"] += 1
+                if metrics.get("cached"):
+                    counters["cached"] += 1
+                    continue
+                counters["loads"] += 1 if metrics.get("loaded") else 0
+                counters["prompt_tokens"] += metrics.get("prompt_eval_count") or 0
+                counters["eval_tokens"] += metrics.get("eval_count") or 0
+                counters["load_time"] += metrics.get("load_duration") or 0.0
+                counters["prompt_eval_time"] += metrics.get("prompt_eval_duration") or 0.0
+                counters["eval_time"] += metrics.get("eval_duration") or 0.0
+                counters["total_time"] += metrics.get("total_duration") or 0.0
+                counters["wall_time"] += metrics.get("wall_time") or metrics.get("total_duration") or 0.0
+
+    def record_tools(
+        self,
+        model: str,
+        tools: Optional[Iterable[Dict[str, Any]]],
+        tool_calls: int,
+        tool_time: float
+    ) -> None:
+        """
+        记录一轮工具执行
+
+        Args:
+            model: 模型名称
+            tools: 该轮请求发送的工具集合
+            tool_calls: 工具调用数
+            tool_time: 工具执行耗时(秒)
+        """
+        with self._lock:
+            for counters in self._buckets(model, tools):
+                counters["tool_calls"] += tool_calls
+                counters["tool_time"] += tool_time
+
+    def record_memory(self, num_ctx: int, size: int, size_vram: int) -> None:
+        """
+        记录以某个num_ctx档位加载的模型占用的内存（来自/api/ps）
+
+        Args:
+            num_ctx: 上下文窗口
+            size: 模型占用的总内存(字节)
+            size_vram: 其中的显存(字节)
+        """
+        with self._lock:
+            bucket = self._context_bucket(num_ctx)
+            bucket["size"] = size
+            bucket["size_vram"] = size_vram
+
+    @staticmethod
+    def _summarize(counters: Dict[str, Any]) -> Dict[str, Any]:
+        """由计数计算汇总指标"""
+        inferred = counters["requests"] - counters["cached"]
+        other = max(
+            0.0,
+            counters["wall_time"] - counters["load_time"] - counters["prompt_eval_time"] - counters["eval_time"]
+        )
+        phases = {
+            "load": counters["load_time"],
+            "prefill": counters["prompt_eval_time"],
+            "decode": counters["eval_time"],
+            "tools": counters["tool_time"],
+            "other": other
+        }
+        elapsed = sum(phases.values())
+        summary = {key: round(value, 4) if isinstance(value, float) else value for key, value in counters.items()}
+        summary.update({
+            "decode_tokens_per_sec": _rate(counters["eval_tokens"], counters["eval_time"]),
+            "prefill_tokens_per_sec": _rate(counters["prompt_tokens"], counters["prompt_eval_time"]),
+            "avg_prefill_time": round(counters["prompt_eval_time"] / inferred, 4) if inferred else None,
+            "avg_prompt_tokens": round(counters["prompt_tokens"] / inferred, 1) if inferred else None,
+            "load_frequency": round(counters["loads"] / inferred, 4) if inferred else None,
+            "breakdown": {
+                phase: round(value / elapsed, 4) if elapsed > 0 else 0.0
+                for phase, value in phases.items()
+            },
+            "dominant_phase": max(phases, key=phases.get) if elapsed > 0 else None
+        })
+        return summary
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        获取汇总
+
+        breakdown为load（模型加载）、prefill、decode、tools（工具执行）、other
+        （网络、排队等客户端可见的其余耗时）各占总耗时的比例。
+
+        Returns:
+            Dict: {"models": {模型: 汇总}, "tool_sets": {工具集合哈希: 汇总（含names）},
+                "context_buckets": {num_ctx: 汇总（含size、size_vram，未记录时为None）}}
+        """
+        with self._lock:
+            return {
+                "models": {model: self._summarize(c) for model, c in self._by_model.items()},
+                "tool_sets": {key: self._summarize(c) for key, c in self._by_tool_set.items()},
+                "context_buckets": {
+                    str(num_ctx): self._summarize(c)
+                    for num_ctx, c in sorted(self._by_num_ctx.items())
+                }
+            }
+
+    def export_json(self, path: Optional[str] = None) -> str:
+        """
+        导出JSON格式的汇总
+
+        Args:
+            path: 写入的文件路径，为None时只返回字符串
+
+        Returns:
+            str: JSON字符串
+        """
+        data = json.dumps(self.summary(), ensure_ascii=False, indent=2)
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(data)
+        return data
+
+    def reset(self) -> None:
+        """
+        清空所有记录
+        """
+        with self._lock:
+            self._by_model.clear()
+            self._by_tool_set.clear()
+            self._by_num_ctx.clear()
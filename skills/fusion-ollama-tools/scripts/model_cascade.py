@@ -0,0 +1,149 @@
+"""
+model_cascade.py - 模型级联模块
+
+大部分请求（"截图"、"复制这段文字"）用小模型就能完成。级联模式下：
+1. 按给定顺序（从小到大）依次尝试模型
+2. 每个模型的回复先经过校验（工具存在、参数符合定义、回复不为空，见tool_validation），
+   校验失败才升级到下一个模型；最后一个模型的回复无论是否通过都直接使用
+3. 统计每一级的升级率和相对于直接使用最后一个模型节省的时间
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import threading
+from typing import Dict, Any, List, Optional, Callable
+
+from tool_validation import validate_response
+
+
+Validator = Callable[[Dict[str, Any], Optional[Dict[str, Dict[str, Any]]]], List[str]]
+
+
+class ModelCascade:
+    """
+    模型级联配置和统计
+
+    用法:
+        cascade = ModelCascade(["qwen3:0.6b", "qwen3:1.7b", "qwen3:latest"])
+        caller = OllamaToolCaller(cascade=cascade)
+        caller.chat_with_tool_execution("截图")
+        print(cascade.stats())
+    """
+
+    def __init__(self, models: List[str], validator: Optional[Validator] = None):
+        """
+        初始化模型级联
+
+        Args:
+            models: 模型列表，按从小到大（从快到慢）的顺序
+            validator: 校验函数 f(助手消息, 工具注册表) -> 错误列表，为None时使用validate_response
+        """
+        if not models:
+            raise ValueError("At least one model is required")
+        self.models = list(models)
+        self.validator = validator or validate_response
+        self._tiers = [
+            {"requests": 0, "accepted": 0, "escalated": 0, "failed": 0, "time": 0.0,
+             "accepted_total_time": 0.0}
+            for _ in self.models
+        ]
+        self._lock = threading.Lock()
+
+    def validate(
+        self,
+        message: Dict[str, Any],
+        tool_registry: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> List[str]:
+        """
+        校验一条回复
+
+        Args:
+            message: 助手消息
+            tool_registry: 工具注册表
+
+        Returns:
+            List[str]: 错误列表，为空表示通过
+        """
+        return self.validator(message, tool_registry)
+
+    def record(
+        self,
+        tier: int,
+        elapsed: float,
+        accepted: bool,
+        failed: bool = False,
+        total_time: float = 0.0
+    ) -> None:
+        """
+        记录一次尝试
+
+        Args:
+            tier: 模型在级联中的序号
+            elapsed: 本次尝试的耗时(秒)
+            accepted: 回复是否被采用（最后一级的回复总是被采用）
+            failed: 请求是否失败（而不是校验不通过）
+            total_time: 回复被采用时，整个级联（包括之前失败的各级）的耗时(秒)
+        """
+        with self._lock:
+            counters = self._tiers[tier]
+            counters["requests"] += 1
+            counters["time"] += elapsed
+            if failed:
+                counters["failed"] += 1
+            if accepted:
+                counters["accepted"] += 1
+                counters["accepted_total_time"] += total_time
+            else:
+                counters["escalated"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取级联统计
+
+        time_saved为该级采用的回复相对于直接请求最后一个模型节省的时间：
+        采用数 × 最后一个模型的平均耗时 − 这些请求在级联中实际花费的时间；
+        最后一个模型还没有被请求过时为None。
+
+        Returns:
+            Dict: {"requests", "time_saved", "tiers": [{model, requests, accepted, escalated,
+                failed, escalation_rate, avg_time, time_saved}]}
+        """
+        with self._lock:
+            last = self._tiers[-1]
+            last_avg = last["time"] / last["requests"] if last["requests"] else None
+            tiers = []
+            total_saved = 0.0 if last_avg is not None else None
+            for model, counters in zip(self.models, self._tiers):
+                saved = None
+                if last_avg is not None:
+                    saved = counters["accepted"] * last_avg - counters["accepted_total_time"]
+                    if counters is last:
+                        saved = 0.0
+                    total_saved += saved
+                requests = counters["requests"]
+                tiers.append({
+                    "model": model,
+                    "requests": requests,
+                    "accepted": counters["accepted"],
+                    "escalated": counters["escalated"],
+                    "failed": counters["failed"],
+                    "escalation_rate": round(counters["escalated"] / requests, 4) if requests else None,
+                    "avg_time": round(counters["time"] / requests, 4) if requests else None,
+                    "time_saved": round(saved, 4) if saved is not None else None
+                })
+            return {
+                "requests": self._tiers[0]["requests"],
+                "time_saved": round(total_saved, 4) if total_saved is not None else None,
+                "tiers": tiers
+            }
+
+    def reset(self) -> None:
+        """
+        清空统计
+        """
+        with self._lock:
+            for counters in self._tiers:
+                for key in counters:
+                    counters[key] = 0.0 if isinstance(counters[key], float) else 0
@@ -0,0 +1,247 @@
+"""
+model_residency.py - Ollama模型常驻管理模块
+
+空闲一段时间后的第一次请求要等待模型重新加载。本模块负责让模型保持在显存/内存中：
+1. 启动时用空prompt的/api/generate请求预加载模型，并设置keep_alive
+2. 从响应的load_duration判断模型是否被意外重新加载
+3. 可选: 同时保持多个模型常驻，超出数量或显存/内存预算时按LRU卸载（基于/api/ps）
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Union
+
+from ollama_transport import get_transport
+
+
+KeepAlive = Union[str, int, float]
+
+DEFAULT_KEEP_ALIVE = "30m"
+
+NANOSECONDS = 1e9
+
+
+class ModelResidencyManager:
+    """
+    模型常驻管理器
+
+    warm_models为按最近使用排序的常驻模型集合。请求的模型不在集合中时加入集合，
+    超过max_warm或memory_budget时卸载最久未使用的模型。
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://127.0.0.1:11434",
+        keep_alive: KeepAlive = DEFAULT_KEEP_ALIVE,
+        max_warm: int = 1,
+        memory_budget: Optional[int] = None,
+        reload_threshold: float = 0.5,
+        timeout: float = 300.0
+    ):
+        """
+        初始化管理器
+
+        Args:
+            base_url: Ollama API基础URL
+            keep_alive: 请求中携带的keep_alive（如"30m"、3600，-1表示永久常驻）
+            max_warm: 最多同时常驻的模型数
+            memory_budget: 常驻模型占用的显存/内存预算(字节)，为None时不限制
+            reload_threshold: load_duration超过该值(秒)视为发生了一次加载
+            timeout: 预加载请求超时(秒)
+        """
+        self.base_url = base_url
+        self.keep_alive = keep_alive
+        self.max_warm = max(1, max_warm)
+        self.memory_budget = memory_budget
+        self.reload_threshold = reload_threshold
+        self.timeout = timeout
+        self.transport = get_transport(base_url)
+        self.warm_models: "OrderedDict[str, float]" = OrderedDict()
+        self.evictions = 0
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _model_stats(self, model: str) -> Dict[str, Any]:
+        """获取模型的统计记录（调用方需持有self._lock）"""
+        return self._stats.setdefault(model, {
+            "requests": 0,
+            "warmups": 0,
+            "loads": 0,
+            "unexpected_reloads": 0,
+            "last_load_duration": 0.0,
+            "total_load_duration": 0.0
+        })
+
+    def _record(self, model: str, response: Dict[str, Any], warmup: bool) -> bool:
+        """
+        记录一次响应中的加载信息并更新LRU顺序
+
+        Returns:
+            bool: 模型是否是新加入常驻集合的
+        """
+        load_duration = (response.get("load_duration") or 0) / NANOSECONDS
+        with self._lock:
+            stats = self._model_stats(model)
+            stats["warmups" if warmup else "requests"] += 1
+            was_warm = model in self.warm_models
+            if load_duration >= self.reload_threshold:
+                stats["loads"] += 1
+                stats["last_load_duration"] = round(load_duration, 4)
+                stats["total_load_duration"] = round(stats["total_load_duration"] + load_duration, 4)
+                if was_warm:
+                    stats["unexpected_reloads"] += 1
+            self.warm_models[model] = time.monotonic()
+            self.warm_models.move_to_end(model)
+        return not was_warm
+
+    def warmup(self, model: str) -> Dict[str, Any]:
+        """
+        预加载模型并设置keep_alive
+
+        Args:
+            model: 模型名称
+
+        Returns:
+            Dict: {"status": "success", "model", "load_duration"} 或 {"status": "error", "message"}
+        """
+        try:
+            response = self.transport.post(
+                "/api/generate",
+                json={"model": model, "keep_alive": self.keep_alive},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            data = response.json()
+        except Exception as e:
+            return {"status": "error", "model": model, "message": f"Warmup failed: {e}"}
+
+        if self._record(model, data, warmup=True):
+            self.enforce_budget(keep=model)
+        return {
+            "status": "success",
+            "model": model,
+            "load_duration": round((data.get("load_duration") or 0) / NANOSECONDS, 4)
+        }
+
+    def start(self, models: List[str], background: bool = False) -> Optional[threading.Thread]:
+        """
+        启动时预加载模型
+
+        Args:
+            models: 模型名称列表，按重要性从低到高排列（最后一个最不容易被淘汰）
+            background: 是否在后台线程中预加载
+
+        Returns:
+            Optional[threading.Thread]: 后台预加载线程，background为False时返回None
+        """
+        def run():
+            for model in models:
+                self.warmup(model)
+
+        if not background:
+            run()
+            return None
+        thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def observe(self, model: str, response: Dict[str, Any]) -> None:
+        """
+        记录一次聊天响应，检测意外的重新加载
+
+        Args:
+            model: 请求使用的模型
+            response: Ollama响应（非流式响应或流的最后一个分块）
+        """
+        if not isinstance(response, dict) or response.get("error"):
+            return
+        if self._record(model, response, warmup=False):
+            self.enforce_budget(keep=model)
+
+    def running_models(self) -> List[Dict[str, Any]]:
+        """
+        查询Ollama当前加载的模型
+
+        Returns:
+            List[Dict]: /api/ps返回的模型列表（含size、size_vram），查询失败时为空列表
+        """
+        try:
+            response = self.transport.get("/api/ps", timeout=5)
+            if response.status_code == 200:
+                return response.json().get("models", [])
+        except Exception:
+            pass
+        return []
+
+    def unload(self, model: str) -> bool:
+        """
+        卸载模型（keep_alive=0）
+
+        Args:
+            model: 模型名称
+
+        Returns:
+            bool: 是否成功
+        """
+        try:
+            response = self.transport.post(
+                "/api/generate",
+                json={"model": model, "keep_alive": 0},
+                timeout=30
+            )
+            response.raise_for_status()
+        except Exception:
+            return False
+        with self._lock:
+            self.warm_models.pop(model, None)
+            self.evictions += 1
+        return True
+
+    def enforce_budget(self, keep: Optional[str] = None) -> List[str]:
+        """
+        按LRU卸载超出数量或内存预算的常驻模型
+
+        Args:
+            keep: 不卸载的模型（通常是刚刚使用的模型）
+
+        Returns:
+            List[str]: 被卸载的模型
+        """
+        evicted: List[str] = []
+        sizes: Dict[str, int] = {}
+        if self.memory_budget is not None:
+            for info in self.running_models():
+                sizes[info.get("name") or info.get("model", "")] = info.get("size_vram") or info.get("size") or 0
+
+        while True:
+            with self._lock:
+                candidates = [model for model in self.warm_models if model != keep]
+                total = sum(sizes.get(model, 0) for model in self.warm_models)
+                over_count = len(self.warm_models) > self.max_warm
+                over_budget = self.memory_budget is not None and total > self.memory_budget
+            if not candidates or not (over_count or over_budget):
+                return evicted
+            victim = candidates[0]
+            if not self.unload(victim):
+                with self._lock:
+                    self.warm_models.pop(victim, None)
+            evicted.append(victim)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取常驻统计
+
+        Returns:
+            Dict: {warm_models, evictions, per_model}
+        """
+        with self._lock:
+            return {
+                "warm_models": list(self.warm_models),
+                "evictions": self.evictions,
+                "per_model": {model: dict(stats) for model, stats in self._stats.items()}
+            }
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+ollama_stub_server.py - 离线Ollama桩服务器
+
+不需要真实模型即可端到端运行OllamaToolCaller，用于测量我们自己的编排开销：
+1. 实现/api/chat（流式和非流式）、/api/tags、/api/embed，以及/api/generate、/api/ps
+2. 按脚本返回响应（可以包含tool_calls）：第n次助手回复使用脚本的第n项，
+   同一份脚本可以同时服务任意多个对话
+3. 可配置的prefill（按提示词token数）和解码（按生成token数）延迟，首次请求可模拟模型加载；
+   与Ollama一样，options.num_ctx变化时重新加载模型，超出num_ctx的提示词被截断
+4. 响应带有与Ollama一致的计时字段（total_duration、prompt_eval_count等）
+
+只依赖标准库。
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Callable
+
+
+NANOSECONDS = 1e9
+
+CHARS_PER_TOKEN = 4
+
+EMBED_DIMENSIONS = 64
+
+# /api/ps中按num_ctx计算的KV缓存大小（每个token的字节数）
+KV_BYTES_PER_TOKEN = 131072
+
+# 默认脚本：先调用一次工具，再给出最终回复
+DEFAULT_SCRIPT: List[Dict[str, Any]] = [
+    {"content": "", "tool_calls": [{"function": {"name": "screen_get_size", "arguments": {}}}]},
+    {"content": "屏幕尺寸已获取。"}
+]
+
+Responder = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+def _count_tokens(text: str) -> int:
+    """粗略的token数（按字符数估算）"""
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN)) if text else 0
+
+
+def scripted_responder(script: List[Dict[str, Any]]) -> Responder:
+    """
+    按脚本生成助手消息
+
+    请求中已有n条助手消息时返回script[n]，超出脚本长度时重复最后一项。
+
+    Args:
+        script: 助手消息列表，每项可包含content、thinking和tool_calls
+
+    Returns:
+        Callable: f(chat请求体) -> 助手消息
+    """
+    script = list(script) or [{"content": ""}]
+
+    def respond(request: Dict[str, Any]) -> Dict[str, Any]:
+        turn = sum(1 for message in request.get("messages", []) if message.get("role") == "assistant")
+        step = script[min(turn, len(script) - 1)]
+        message = {"role": "assistant", "content": step.get("content", "")}
+        if step.get("thinking"):
+            message["thinking"] = step["thinking"]
+        if step.get("tool_calls"):
+            message["tool_calls"] = step["tool_calls"]
+        return message
+
+    return respond
+
+
+def stub_embedding(text: str, dimensions: int = EMBED_DIMENSIONS) -> List[float]:
+    """
+    确定性的伪向量（字符二元组哈希），相似的文本得到相近的向量
+
+    Args:
+        text: 文本
+        dimensions: 向量维度
+
+    Returns:
+        List[float]: 单位向量
+    """
+    vector = [0.0] * dimensions
+    padded = f" {text.lower()} "
+    for i in range(len(padded) - 1):
+        digest = hashlib.md5(padded[i:i + 2].encode("utf-8")).digest()
+        vector[digest[0] % dimensions] += 1.0 if digest[1] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class OllamaStubServer:
+    """
+    Ollama桩服务器
+
+    用法:
+        with OllamaStubServer(script=[...], decode_latency=0.01) as stub:
+            caller = OllamaToolCaller(OllamaConfig(base_url=stub.base_url))
+            caller.chat_with_tool_execution("...")
+    """
+
+    def __init__(
+        self,
+        script: Optional[List[Dict[str, Any]]] = None,
+        responder: Optional[Responder] = None,
+        models: Optional[List[str]] = None,
+        prefill_latency: float = 0.0,
+        decode_latency: float = 0.0,
+        load_latency: float = 0.0,
+        base_latency: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0
+    ):
+        """
+        初始化桩服务器（调用start()或使用with语句后开始监听）
+
+        Args:
+            script: 脚本化的助手消息，为None时使用DEFAULT_SCRIPT
+            responder: 自定义响应函数 f(chat请求体) -> 助手消息，优先于script
+            models: /api/tags返回的模型列表
+            prefill_latency: 每个提示词token的prefill耗时(秒)
+            decode_latency: 每个生成token的解码耗时(秒)
+            load_latency: 每个模型第一次请求（或num_ctx变化）时的加载耗时(秒)
+            base_latency: 每次请求的固定耗时(秒)
+            host: 监听地址
+            port: 监听端口，0表示随机空闲端口
+        """
+        self.responder = responder or scripted_responder(script if script is not None else DEFAULT_SCRIPT)
+        self.models = list(models or ["qwen3:latest", "nomic-embed-text:latest"])
+        self.prefill_latency = prefill_latency
+        self.decode_latency = decode_latency
+        self.load_latency = load_latency
+        self.base_latency = base_latency
+        self.requests: List[Dict[str, Any]] = []
+        self._loaded: Dict[str, float] = {}
+        self._num_ctx: Dict[str, Optional[int]] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """服务器的Ollama API基础URL"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "OllamaStubServer":
+        """
+        在后台线程中开始监听
+
+        Returns:
+            OllamaStubServer: self
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, name="ollama-stub", daemon=True)
+            self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """
+        在当前线程中监听，直到KeyboardInterrupt
+        """
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+
+    def stop(self) -> None:
+        """
+        停止监听
+        """
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self) -> "OllamaStubServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+    def _record(self, path: str, body: Dict[str, Any]) -> None:
+        with self._lock:
+            self.requests.append({"path": path, "body": body, "time": time.time()})
+
+    def _load(self, model: str, keep_alive: Any = None, num_ctx: Optional[int] = None) -> float:
+        """模拟模型加载（num_ctx变化时重新加载），返回加载耗时(秒)"""
+        with self._lock:
+            if keep_alive == 0:
+                self._loaded.pop(model, None)
+                self._num_ctx.pop(model, None)
+                return 0.0
+            loaded = model in self._loaded and self._num_ctx.get(model) == num_ctx
+            self._loaded[model] = time.time()
+            self._num_ctx[model] = num_ctx
+        if loaded or self.load_latency <= 0:
+            return 0.0
+        time.sleep(self.load_latency)
+        return self.load_latency
+
+    def _timings(self, load: float, prompt_tokens: int, prefill: float, eval_tokens: int, decode: float,
+                 total: float) -> Dict[str, Any]:
+        """Ollama格式的计时字段"""
+        return {
+            "total_duration": int(total * NANOSECONDS),
+            "load_duration": int(load * NANOSECONDS),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prefill * NANOSECONDS),
+            "eval_count": eval_tokens,
+            "eval_duration": int(decode * NANOSECONDS)
+        }
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def handle(self):
+                try:
+                    super().handle()
+                except ConnectionError:
+                    # 客户端超时后断开连接（如带截止时间的请求），不打印堆栈
+                    self.close_connection = True
+
+            def _send_json(self, data: Dict[str, Any], status: int = 200) -> None:
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _read_body(self) -> Dict[str, Any]:
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                return json.loads(raw) if raw else {}
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    stub._record(self.path, {})
+                    self._send_json({"models": [{"name": name, "model": name} for name in stub.models]})
+                elif self.path == "/api/ps":
+                    with stub._lock:
+                        loaded = [(name, stub._num_ctx.get(name) or 0) for name in stub._loaded]
+                    self._send_json({"models": [
+                        {"name": name, "model": name, "context_length": num_ctx,
+                         "size": num_ctx * KV_BYTES_PER_TOKEN, "size_vram": num_ctx * KV_BYTES_PER_TOKEN}
+                        for name, num_ctx in loaded
+                    ]})
+                elif self.path in ("/", "/api/version"):
+                    self._send_json({"version": "stub"})
+                else:
+                    self._send_json({"error": f"unknown path {self.path}"}, 404)
+
+            def do_POST(self):
+                try:
+                    body = self._read_body()
+                except json.JSONDecodeError as e:
+                    self._send_json({"error": f"invalid JSON: {e}"}, 400)
+                    return
+                stub._record(self.path, body)
+                if self.path == "/api/chat":
+                    self._chat(body)
+                elif self.path == "/api/embed":
+                    inputs = body.get("input", [])
+                    if isinstance(inputs, str):
+                        inputs = [inputs]
+                    self._send_json({"model": body.get("model"), "embeddings": [stub_embedding(t) for t in inputs]})
+                elif self.path == "/api/generate":
+                    start = time.perf_counter()
+                    load = stub._load(body.get("model", ""), body.get("keep_alive"))
+                    self._send_json({
+                        "model": body.get("model"), "response": "", "done": True,
+                        **stub._timings(load, 0, 0.0, 0, 0.0, time.perf_counter() - start)
+                    })
+                else:
+                    self._send_json({"error": f"unknown path {self.path}"}, 404)
+
+            def _chat(self, body: Dict[str, Any]) -> None:
+                start = time.perf_counter()
+                model = body.get("model", "")
+                if model not in stub.models:
+                    self._send_json({"error": f"model '{model}' not found"}, 404)
+                    return
+                message = stub.responder(body)
+                num_ctx = (body.get("options") or {}).get("num_ctx")
+                load = stub._load(model, body.get("keep_alive"), num_ctx)
+
+                prompt_text = json.dumps(body.get("messages", []), ensure_ascii=False)
+                prompt_text += json.dumps(body.get("tools") or [], ensure_ascii=False)
+                prompt_tokens = _count_tokens(prompt_text)
+                if num_ctx:
+                    prompt_tokens = min(prompt_tokens, num_ctx)
+                prefill = stub.base_latency + prompt_tokens * stub.prefill_latency
+                time.sleep(prefill)
+
+                output = message.get("content", "") + json.dumps(message.get("tool_calls", []), ensure_ascii=False)
+                eval_tokens = _count_tokens(output)
+                done = {"model": model, "done": True, "done_reason": "stop"}
+
+                if not body.get("stream", True):
+                    decode = eval_tokens * stub.decode_latency
+                    time.sleep(decode)
+                    total = time.perf_counter() - start
+                    self._send_json({**done, "message": message,
+                                     **stub._timings(load, prompt_tokens, prefill, eval_tokens, decode, total)})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                decode_start = time.perf_counter()
+                for chunk in self._stream_chunks(model, message):
+                    self._write_chunk(chunk)
+                decode = time.perf_counter() - decode_start
+                total = time.perf_counter() - start
+                self._write_chunk({**done, "message": {"role": "assistant", "content": ""},
+                                   **stub._timings(load, prompt_tokens, prefill, eval_tokens, decode, total)})
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _stream_chunks(self, model: str, message: Dict[str, Any]):
+                """按token切分内容，工具调用各占一个分块"""
+                for field in ("thinking", "content"):
+                    text = message.get(field, "")
+                    for i in range(0, len(text), CHARS_PER_TOKEN):
+                        time.sleep(stub.decode_latency)
+                        yield {"model": model, "done": False,
+                               "message": {"role": "assistant", "content": "", field: text[i:i + CHARS_PER_TOKEN]}}
+                for tool_call in message.get("tool_calls", []):
+                    time.sleep(stub.decode_latency * _count_tokens(json.dumps(tool_call, ensure_ascii=False)))
+                    yield {"model": model, "done": False,
+                           "message": {"role": "assistant", "content": "", "tool_calls": [tool_call]}}
+
+            def _write_chunk(self, chunk: Dict[str, Any]) -> None:
+                data = json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n"
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线Ollama桩服务器")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=11435, help="监听端口")
+    parser.add_argument("--script", help="JSON脚本文件（助手消息列表，可包含tool_calls）")
+    parser.add_argument("--models", default="qwen3:latest,nomic-embed-text:latest", help="逗号分隔的模型列表")
+    parser.add_argument("--prefill-ms", type=float, default=0.0, help="每个提示词token的prefill耗时(毫秒)")
+    parser.add_argument("--decode-ms", type=float, default=0.0, help="每个生成token的解码耗时(毫秒)")
+    parser.add_argument("--load-ms", type=float, default=0.0, help="模型首次加载耗时(毫秒)")
+    args = parser.parse_args()
+
+    script: Optional[List[Dict[str, Any]]] = None
+    if args.script:
+        with open(args.script, "r", encoding="utf-8") as f:
+            script = json.load(f)
+
+    stub = OllamaStubServer(
+        script=script,
+        models=[name for name in args.models.split(",") if name],
+        prefill_latency=args.prefill_ms / 1000,
+        decode_latency=args.decode_ms / 1000,
+        load_latency=args.load_ms / 1000,
+        host=args.host,
+        port=args.port
+    )
+    print(f"Ollama桩服务器: {stub.base_url} (Ctrl+C停止)")
+    stub.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -11,12 +11,17 @@ ollama_tools.py - Ollama工具调用核心模块
 日期: 2026-02-17
 """
 
+import asyncio
 import json
 import requests
-from typing import Dict, Any, List, Optional, Callable, Union
+from typing import Dict, Any, List, Optional, Callable, Union, Iterator, Generator, Tuple
 from dataclasses import dataclass
 import os
 import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 
 try:
     from langchain_experimental.llms.ollama_functions import OllamaFunctions
@@ -25,14 +30,37 @@ try:
 except ImportError:
     LANGCHAIN_AVAILABLE = False
 
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
 from tool_definitions import (
     ALL_TOOLS, 
     get_tool_by_name, 
     get_all_tools_ollama_format,
     ToolDefinition
 )
+from ollama_transport import OllamaTransport, get_transport
+from tool_retrieval import ToolRetriever, ToolSelection
+from tool_schema_cache import ToolSchemaCache, ToolSchemaSet, encode_chat_request
+from model_residency import ModelResidencyManager
+from backend_pool import OllamaBackendPool
+from conversation_context import ConversationContext
+from response_cache import ResponseCache
+from inference_telemetry import InferenceTelemetry, inference_metrics
+from request_scheduler import FairScheduler
+from deadline_budget import DeadlineBudget
+from context_window import ContextWindowSizer
+from model_cascade import ModelCascade
+from tool_validation import ToolCallValidator
+from tool_plan import PLAN_TOOL, PLAN_TOOL_NAME, PLAN_SYSTEM_PROMPT, run_plan_call, plan_tool_message
+from token_estimator import estimate_prompt_tokens
 from tool_executor import (
     ToolExecutor, 
+    AsyncToolExecutor,
+    PipelinedToolDispatcher,
     ExecutionResult,
     create_tool_registry
 )
@@ -46,54 +74,632 @@ class OllamaConfig:
     Attributes:
         base_url: Ollama API基础URL
         model: 模型名称
-        timeout: 请求超时时间
+        timeout: 请求超时时间（读取超时）
         stream: 是否使用流式响应
+        pool_size: HTTP连接池最大连接数
+        connect_timeout: 连接超时时间
+        max_retries: 5xx和连接重置等瞬时错误的最大重试次数
+        retry_backoff: 重试退避系数(秒)
+        keep_alive: 请求中携带的keep_alive（如"30m"、-1），为None时使用Ollama默认值
+        options: 请求中携带的模型参数（如{"temperature": 0, "seed": 42}），为None时使用模型默认值
     """
     base_url: str = "http://127.0.0.1:11434"
     model: str = "qwen3:latest"
     timeout: int = 120
     stream: bool = False
+    pool_size: int = 10
+    connect_timeout: float = 5.0
+    max_retries: int = 2
+    retry_backoff: float = 0.5
+    keep_alive: Optional[Union[str, int]] = None
+    options: Optional[Dict[str, Any]] = None
+    
+    def get_transport(self, base_url: Optional[str] = None) -> OllamaTransport:
+        """
+        获取该配置对应的共享HTTP传输层（keep-alive连接池）
+        
+        Args:
+            base_url: 使用的Ollama地址，为None时使用self.base_url
+            
+        Returns:
+            OllamaTransport: 传输层实例
+        """
+        return get_transport(
+            base_url or self.base_url,
+            pool_size=self.pool_size,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.timeout,
+            max_retries=self.max_retries,
+            retry_backoff=self.retry_backoff
+        )
+
+
+class OllamaStreamError(requests.exceptions.RequestException):
+    """流式响应中收到Ollama错误分块或无法解析的数据"""
+
+
+class OllamaRequestCancelled(requests.exceptions.RequestException):
+    """请求在调度器中排队时被取消"""
+
+
+class ChatStreamAccumulator:
+    """
+    流式聊天响应累积器
+    
+    逐个接收Ollama /api/chat的NDJSON分块，累积文本增量和工具调用，
+    并在最后一个分块(done=true)到达后组装出与非流式响应格式一致的结果。
+    """
+    
+    def __init__(self):
+        self.role = "assistant"
+        self.content_parts: List[str] = []
+        self.thinking_parts: List[str] = []
+        self.tool_calls: List[Dict[str, Any]] = []
+        self.final_chunk: Dict[str, Any] = {}
+        self.done = False
+    
+    def add(self, chunk: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        加入一个分块
+        
+        Args:
+            chunk: 解析后的NDJSON分块
+            
+        Returns:
+            Dict: 本分块带来的增量 {content, thinking, tool_calls}
+        """
+        message = chunk.get("message") or {}
+        self.role = message.get("role", self.role)
+        content = message.get("content") or ""
+        thinking = message.get("thinking") or ""
+        new_tool_calls = message.get("tool_calls") or []
+        
+        if content:
+            self.content_parts.append(content)
+        if thinking:
+            self.thinking_parts.append(thinking)
+        self.tool_calls.extend(new_tool_calls)
+        
+        if chunk.get("done"):
+            self.done = True
+            self.final_chunk = chunk
+        elif not self.final_chunk:
+            self.final_chunk = {"model": chunk.get("model"), "created_at": chunk.get("created_at")}
+        
+        return {"content": content, "thinking": thinking, "tool_calls": new_tool_calls}
+    
+    def response(self) -> Dict[str, Any]:
+        """
+        组装最终响应
+        
+        Returns:
+            Dict: 与非流式/api/chat响应格式一致的字典，包含最后分块中的计时字段
+        """
+        message: Dict[str, Any] = {
+            "role": self.role,
+            "content": "".join(self.content_parts)
+        }
+        if self.thinking_parts:
+            message["thinking"] = "".join(self.thinking_parts)
+        if self.tool_calls:
+            message["tool_calls"] = list(self.tool_calls)
+        
+        response = {key: value for key, value in self.final_chunk.items() if key != "message"}
+        response["message"] = message
+        response["done"] = self.done
+        return response
+
 
+class _ToolCallerBase:
+    """
+    OllamaToolCaller和AsyncOllamaToolCaller共用的工具选择、keep_alive、
+    常驻观测和tool消息构建，保证同步和异步路径的行为一致
 
-class OllamaToolCaller:
+    子类需设置config、tool_registry、schema_cache、tool_retriever和residency属性。
+    """
+    
+    def _select_tools(
+        self, 
+        user_message: str, 
+        tools: Optional[List[Dict[str, Any]]]
+    ) -> Tuple[ToolSchemaSet, Optional[ToolSelection]]:
+        """
+        确定本次对话发送的工具
+        
+        Args:
+            user_message: 用户消息
+            tools: 调用方指定的工具定义列表
+            
+        Returns:
+            Tuple[ToolSchemaSet, Optional[ToolSelection]]: (预编码的工具集合, 工具子集)；
+                调用方指定了tools或未设置检索器时工具子集为None
+        """
+        if tools is not None:
+            return self.schema_cache.for_tools(tools), None
+        if self.tool_retriever is None:
+            return self.schema_cache.all_tools(), None
+        selection = ToolSelection(
+            self.tool_retriever, user_message, list(self.schema_cache.all_tools())
+        )
+        return self.schema_cache.for_names(selection.names), selection
+    
+    def _keep_alive(self) -> Optional[Union[str, int, float]]:
+        """
+        获取请求中携带的keep_alive
+        
+        Returns:
+            Optional: config.keep_alive，未设置时取常驻管理器的keep_alive
+        """
+        if self.config.keep_alive is not None:
+            return self.config.keep_alive
+        if self.residency is not None:
+            return self.residency.keep_alive
+        return None
+    
+    def _observe_response(self, response: Dict[str, Any], model: Optional[str] = None) -> None:
+        """
+        把响应的加载信息交给模型常驻管理器
+        
+        Args:
+            response: Ollama响应
+            model: 请求使用的模型（级联或降级时与config.model不同），为None时使用config.model
+        """
+        if self.residency is not None:
+            self.residency.observe(model or self.config.model, response)
+    
+    def _tool_message(self, result: ExecutionResult) -> Dict[str, Any]:
+        """
+        将工具执行结果转换为追加到对话中的tool消息
+        
+        Args:
+            result: 工具执行结果
+            
+        Returns:
+            Dict: tool消息
+        """
+        if result.tool_name in self.tool_registry:
+            return result.to_ollama_tool_response()
+        return {
+            "role": "tool",
+            "content": json.dumps({"error": result.error}),
+            "name": result.tool_name
+        }
+    
+    def get_available_tools(self) -> List[str]:
+        """
+        获取可用工具列表
+        
+        Returns:
+            List[str]: 工具名称列表
+        """
+        return list(self.tool_registry.keys())
+
+
+class OllamaToolCaller(_ToolCallerBase):
     """
     Ollama原生API工具调用器
     
     直接使用Ollama原生API进行工具调用，无需LangChain依赖。
     """
     
-    def __init__(self, config: Optional[OllamaConfig] = None):
+    def __init__(
+        self, 
+        config: Optional[OllamaConfig] = None,
+        executor: Optional[ToolExecutor] = None,
+        tool_retriever: Optional[ToolRetriever] = None,
+        schema_cache: Optional[ToolSchemaCache] = None,
+        residency: Optional[ModelResidencyManager] = None,
+        backend_pool: Optional[OllamaBackendPool] = None,
+        context: Optional[ConversationContext] = None,
+        response_cache: Optional[ResponseCache] = None,
+        telemetry: Optional[InferenceTelemetry] = None,
+        scheduler: Optional[FairScheduler] = None,
+        context_window: Optional[ContextWindowSizer] = None,
+        cascade: Optional[ModelCascade] = None
+    ):
         """
         初始化工具调用器
         
         Args:
             config: Ollama配置，为None时使用默认配置
+            executor: 工具执行器，为None时使用带参数校验（ToolCallValidator）的默认ToolExecutor
+                      （例如传入ToolExecutor(execution_mode="worker")复用常驻进程）
+            tool_retriever: 工具检索器；设置后未指定tools的请求只发送与用户消息
+                            最相关的工具子集，为None时发送全部工具
+
+            schema_cache: 预编码工具定义缓存，为None时新建
+            residency: 模型常驻管理器；设置后请求携带其keep_alive（config.keep_alive优先），
+                       并根据响应的load_duration检测模型重新加载
+            backend_pool: 多Ollama实例池；设置后聊天请求发往负载最低的健康实例
+                          （同一对话固定使用同一实例），为None时使用config.base_url
+            context: 对话上下文预算；设置后chat_with_tool_execution每次请求前按token预算
+                     压缩旧的工具结果和截图，为None时不压缩
+            response_cache: 模型响应缓存；设置后相同的请求（模型、options、消息、工具定义）
+                            直接返回缓存的响应（cached为True），为None时不缓存
+            telemetry: 推理遥测；设置后按模型和工具集合汇总每次请求的推理计时和工具执行耗时
+                       （每次响应的metrics字段不论是否设置都会附加）
+            scheduler: 模型请求调度器；设置后每个请求先在调度器中按对话公平排队，
+                       受全局并发上限限制（多个对话共享调用器时使用，见session_manager）
+            context_window: num_ctx档位选择器；设置后按估算的提示词token数为请求设置
+                            options.num_ctx（config.options中已有num_ctx时不覆盖）
+            cascade: 模型级联；设置后chat_with_tools和工具循环的请求从小模型开始尝试，
+                     回复校验失败才升级到下一个模型（代替config.model；stream_chat不使用级联）
         """
         self.config = config or OllamaConfig()
         self.tool_registry = create_tool_registry()
-        self.executor = ToolExecutor()
+        self.executor = executor or ToolExecutor(validator=ToolCallValidator())
+        self.tool_retriever = tool_retriever
+        self.schema_cache = schema_cache or ToolSchemaCache()
+        self.residency = residency
+        self.backend_pool = backend_pool
+        self.context = context
+        self.response_cache = response_cache
+        self.telemetry = telemetry
+        self.scheduler = scheduler
+        self.context_window = context_window
+        self.cascade = cascade
+    
+    def _degraded_tools(
+        self, 
+        tools: ToolSchemaSet, 
+        messages: List[Dict[str, Any]], 
+        user_message: str, 
+        top_k: int
+    ) -> ToolSchemaSet:
+        """
+        时间不足时使用的更小工具子集
+        
+        保留本次对话中已经调用过的工具和检索得分最高的top_k个工具；
+        未设置工具检索器时无法排序，保持原有工具集合。
+        
+        Args:
+            tools: 当前工具集合
+            messages: 对话历史
+            user_message: 用户消息
+            top_k: 检索工具数
+            
+        Returns:
+            ToolSchemaSet: 工具集合
+        """
+        if self.tool_retriever is None:
+            return tools
+        keep = {
+            call.get("function", {}).get("name")
+            for message in messages if message.get("role") == "assistant"
+            for call in message.get("tool_calls") or []
+        }
+        keep.update(tool.name for tool in self.tool_retriever.select(user_message, top_k))
+        subset = [tool for tool in tools if tool.get("function", {}).get("name") in keep]
+        if not subset or len(subset) == len(tools):
+            return tools
+        return ToolSchemaSet(subset)
     
     def _build_chat_request(
         self, 
         messages: List[Dict[str, Any]], 
-        tools: List[Dict[str, Any]]
+        tools: Union[ToolSchemaSet, List[Dict[str, Any]]],
+        prompt_tokens: Optional[int] = None,
+        size_context: bool = True
     ) -> Dict[str, Any]:
         """
         构建聊天请求体
         
         Args:
             messages: 消息列表
-            tools: 工具定义列表
+            tools: 预编码的工具集合或工具定义列表
+            prompt_tokens: 已估算的提示词token数（用于选择num_ctx），为None时重新估算
+            size_context: 是否立即选择num_ctx；最终使用的模型尚未确定（级联、降级）时为False，
+                          由调用方确定模型后调用_size_context
             
         Returns:
             Dict: 请求体
         """
-        return {
+        request_body = {
             "model": self.config.model,
             "messages": messages,
             "stream": self.config.stream,
             "tools": tools
         }
+        keep_alive = self._keep_alive()
+        if keep_alive is not None:
+            request_body["keep_alive"] = keep_alive
+        if self.config.options:
+            request_body["options"] = self.config.options
+        if size_context:
+            self._size_context(request_body, prompt_tokens)
+        return request_body
+    
+    def _size_context(self, request_body: Dict[str, Any], prompt_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """
+        按请求体中的模型选择options.num_ctx（设置了context_window且config.options中没有num_ctx时）
+        
+        Args:
+            request_body: 请求体（model为实际发送的模型）
+            prompt_tokens: 已估算的提示词token数，为None时重新估算
+            
+        Returns:
+            Dict: 请求体（同一个对象）
+        """
+        if self.context_window is None or "num_ctx" in (self.config.options or {}):
+            return request_body
+        if prompt_tokens is None:
+            prompt_tokens = estimate_prompt_tokens(request_body.get("messages", []), request_body.get("tools"))
+        options = dict(request_body.get("options") or {})
+        options["num_ctx"] = self.context_window.size(
+            request_body.get("model", self.config.model), prompt_tokens, options.get("num_predict")
+        )
+        request_body["options"] = options
+        return request_body
+    
+    def _record_metrics(
+        self, 
+        request_body: Dict[str, Any], 
+        response_data: Dict[str, Any], 
+        wall_time: float
+    ) -> Dict[str, Any]:
+        """
+        提取响应的推理指标，附加到响应的metrics字段并交给推理遥测
+        
+        Args:
+            request_body: 请求体
+            response_data: Ollama响应
+            wall_time: 客户端测得的请求耗时(秒)
+            
+        Returns:
+            Dict: 推理指标
+        """
+        metrics = inference_metrics(response_data, wall_time)
+        model = request_body.get("model", self.config.model)
+        num_ctx = (request_body.get("options") or {}).get("num_ctx")
+        if num_ctx:
+            metrics["num_ctx"] = num_ctx
+        if self.context_window is not None and metrics["prompt_eval_count"] and not metrics["cached"]:
+            self.context_window.observe(
+                model,
+                estimate_prompt_tokens(request_body.get("messages", []), request_body.get("tools")),
+                metrics["prompt_eval_count"]
+            )
+        response_data["metrics"] = metrics
+        if self.telemetry is not None:
+            self.telemetry.record(model, request_body.get("tools"), metrics)
+            if num_ctx and metrics["loaded"]:
+                self._record_context_memory(model, num_ctx)
+        return metrics
+    
+    def _record_context_memory(self, model: str, num_ctx: int) -> None:
+        """
+        模型以新的num_ctx加载后，从/api/ps读取其内存占用并记入推理遥测
+        
+        Args:
+            model: 模型名称
+            num_ctx: 上下文窗口
+        """
+        if self.residency is not None:
+            running = self.residency.running_models()
+        else:
+            try:
+                response = self.config.get_transport().get("/api/ps", timeout=5)
+                response.raise_for_status()
+                running = response.json().get("models", [])
+            except (requests.exceptions.RequestException, ValueError):
+                running = []
+        for info in running:
+            if model in (info.get("name"), info.get("model")):
+                self.telemetry.record_memory(num_ctx, info.get("size") or 0, info.get("size_vram") or 0)
+                return
+    
+    def _send_chat(
+        self, 
+        request_body: Dict[str, Any], 
+        fetch: Callable[[], Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        通过响应缓存发送请求并记录推理指标
+        
+        Args:
+            request_body: 请求体（用于生成缓存键）
+            fetch: 实际发送请求的函数
+            
+        Returns:
+            Dict: 响应；命中缓存时cached为True
+        """
+        start = time.perf_counter()
+        if self.response_cache is None:
+            response_data = fetch()
+        else:
+            response_data = self.response_cache.get_or_fetch(request_body, fetch)
+        self._record_metrics(request_body, response_data, time.perf_counter() - start)
+        return response_data
+    
+    @staticmethod
+    def _time_left(deadline: Optional[float]) -> Optional[float]:
+        """
+        距请求截止时间的剩余时间
+        
+        Args:
+            deadline: time.monotonic()形式的截止时间，为None时不限制
+            
+        Returns:
+            Optional[float]: 剩余时间(秒)，未设置截止时间时为None
+            
+        Raises:
+            requests.exceptions.Timeout: 已过截止时间
+        """
+        if deadline is None:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise requests.exceptions.Timeout("Request deadline exceeded")
+        return remaining
+    
+    @contextmanager
+    def _chat_transport(
+        self, 
+        conversation_id: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> Iterator[OllamaTransport]:
+        """
+        获取发送聊天请求的传输层
+        
+        设置了调度器时先等待一个并发槽位；设置了实例池时在with块期间占用一个实例，
+        块内的连接错误和5xx计为该实例的失败（见backend_pool.is_backend_failure）。
+        
+        Args:
+            conversation_id: 对话ID，同一对话固定使用同一实例，并作为调度器的公平排队单位
+            deadline: time.monotonic()形式的请求截止时间，排队时间也计入其中；为None时一直等待
+            
+        Yields:
+            OllamaTransport: 传输层实例
+            
+        Raises:
+            OllamaRequestCancelled: 排队时该对话的请求被取消
+            requests.exceptions.Timeout: 截止时间前没有等到槽位
+        """
+        if self.scheduler is not None and not self.scheduler.acquire(conversation_id, self._time_left(deadline)):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise requests.exceptions.Timeout("Timed out waiting for a scheduler slot")
+            raise OllamaRequestCancelled("Request cancelled while waiting for a scheduler slot")
+        try:
+            if self.backend_pool is None:
+                yield self.config.get_transport()
+            else:
+                with self.backend_pool.lease(conversation_id) as backend:
+                    yield self.config.get_transport(backend.base_url)
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.release()
+    
+    def _iter_chat_stream(
+        self, 
+        request_body: Dict[str, Any],
+        conversation_id: Optional[str] = None,
+        timeout: Optional[float] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        发送流式聊天请求并逐个产出NDJSON分块
+        
+        Args:
+            request_body: 请求体（stream需为True）
+            conversation_id: 对话ID（用于实例池的对话绑定）
+            timeout: 整个流（包括调度器排队）的超时(秒)，为None时使用config.timeout作为读取超时
+            
+        Yields:
+            Dict: 解析后的分块
+            
+        Raises:
+            requests.exceptions.RequestException: 请求失败或流中出现错误
+            requests.exceptions.Timeout: 流在timeout内没有结束
+        """
+        stream_deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._chat_transport(conversation_id, stream_deadline) as transport:
+            response = transport.post(
+                "/api/chat",
+                data=encode_chat_request(request_body),
+                headers={"Content-Type": "application/json"},
+                stream=True,
+                timeout=self._time_left(stream_deadline) or self.config.timeout
+            )
+            try:
+                response.raise_for_status()
+                for line in self._iter_lines_until(response, stream_deadline):
+                    if not line:
+                        continue
+                    try:
+                        chunk = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        raise OllamaStreamError(f"Invalid stream chunk: {e}")
+                    if "error" in chunk:
+                        raise OllamaStreamError(f"Ollama error: {chunk['error']}")
+                    yield chunk
+                    if chunk.get("done"):
+                        break
+            finally:
+                response.close()
+    
+    def _iter_lines_until(
+        self, 
+        response: requests.Response, 
+        deadline: Optional[float]
+    ) -> Iterator[bytes]:
+        """
+        逐行读取流式响应，每次读取前把socket的读取超时缩短为剩余时间
+        
+        否则流停顿时，一次读取会在截止时间之后继续等待完整的读取超时。
+        
+        Args:
+            response: 流式响应
+            deadline: time.monotonic()形式的截止时间，为None时不限制
+            
+        Yields:
+            bytes: 响应中的一行
+            
+        Raises:
+            requests.exceptions.Timeout: 流在截止时间前没有结束
+        """
+        connection = getattr(response.raw, "connection", None)
+        sock = getattr(connection, "sock", None)
+        if deadline is not None and sock is not None:
+            sock.settimeout(self._time_left(deadline))
+        lines = response.iter_lines()
+        while True:
+            try:
+                line = next(lines)
+            except StopIteration:
+                return
+            except requests.exceptions.ConnectionError as e:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise requests.exceptions.Timeout(f"Stream did not finish before the deadline: {e}")
+                raise
+            if deadline is not None:
+                remaining = self._time_left(deadline)
+                if sock is not None:
+                    sock.settimeout(remaining)
+            yield line
+    
+    def _post_chat(
+        self, 
+        request_body: Dict[str, Any],
+        conversation_id: Optional[str] = None,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        通过共享连接池发送聊天请求
+        
+        请求体中stream为True时读取完整的流并组装为非流式响应格式。
+        
+        Args:
+            request_body: 请求体
+            conversation_id: 对话ID（用于实例池的对话绑定）
+            timeout: 请求（包括调度器排队）超时(秒)，为None时使用config.timeout
+            
+        Returns:
+            Dict: 响应结果
+            
+        Raises:
+            requests.exceptions.RequestException: 请求失败
+        """
+        def fetch() -> Dict[str, Any]:
+            if request_body.get("stream"):
+                accumulator = ChatStreamAccumulator()
+                for chunk in self._iter_chat_stream(request_body, conversation_id, timeout):
+                    accumulator.add(chunk)
+                response_data = accumulator.response()
+            else:
+                deadline = time.monotonic() + timeout if timeout is not None else None
+                with self._chat_transport(conversation_id, deadline) as transport:
+                    response = transport.post(
+                        "/api/chat",
+                        data=encode_chat_request(request_body),
+                        headers={"Content-Type": "application/json"},
+                        timeout=self._time_left(deadline) or self.config.timeout
+                    )
+                    response.raise_for_status()
+                    response_data = response.json()
+            
+            self._observe_response(response_data, request_body.get("model"))
+            return response_data
+        
+        return self._send_chat(request_body, fetch)
     
     def chat_with_tools(
         self, 
@@ -112,8 +718,7 @@ class OllamaToolCaller:
         Returns:
             Dict: 响应结果
         """
-        if tools is None:
-            tools = get_all_tools_ollama_format()
+        tools, selection = self._select_tools(user_message, tools)
         
         messages = []
         
@@ -128,16 +733,23 @@ class OllamaToolCaller:
             "content": user_message
         })
         
-        request_body = self._build_chat_request(messages, tools)
+        request_body = self._build_chat_request(messages, tools, size_context=self.cascade is None)
         
         try:
-            response = requests.post(
-                f"{self.config.base_url}/api/chat",
-                json=request_body,
-                timeout=self.config.timeout
-            )
-            response.raise_for_status()
-            return response.json()
+            if selection is None:
+                return self._chat_request(request_body)
+            
+            selection.record_request(messages)
+            response = self._chat_request(request_body)
+            message = response.get("message", {})
+            if selection.add_referenced(message) and not message.get("tool_calls"):
+                selection.record_request(messages)
+                tools = self.schema_cache.for_names(selection.names)
+                response = self._chat_request(
+                    self._build_chat_request(messages, tools, size_context=self.cascade is None)
+                )
+            response["tool_selection"] = selection.report()
+            return response
             
         except requests.exceptions.RequestException as e:
             return {
@@ -145,6 +757,68 @@ class OllamaToolCaller:
                 "message": f"Request failed: {str(e)}"
             }
     
+    def stream_chat(
+        self, 
+        user_message: str, 
+        tools: Optional[List[Dict[str, Any]]] = None,
+        system_prompt: Optional[str] = None
+    ) -> Generator[Dict[str, Any], None, Dict[str, Any]]:
+        """
+        流式发送带工具的聊天请求
+        
+        无论config.stream如何设置都以流式方式请求。产出的事件:
+            {"type": "content", "content": 文本增量}
+            {"type": "thinking", "thinking": 思考过程增量}
+            {"type": "tool_call", "tool_call": 完整的工具调用}
+            {"type": "done", "response": 最终响应}
+            {"type": "error", "message": 错误信息}
+        
+        生成器的返回值（yield from 的结果）同样是最终响应。
+        
+        Args:
+            user_message: 用户消息
+            tools: 工具定义列表，为None时使用所有工具
+            system_prompt: 系统提示词
+            
+        Returns:
+            Dict: 最终响应，格式与chat_with_tools相同，包含Ollama最后分块中的计时字段
+        """
+        tools, selection = self._select_tools(user_message, tools)
+        
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": user_message})
+        
+        request_body = self._build_chat_request(messages, tools)
+        request_body["stream"] = True
+        if selection is not None:
+            selection.record_request(messages)
+        accumulator = ChatStreamAccumulator()
+        request_start = time.perf_counter()
+        
+        try:
+            for chunk in self._iter_chat_stream(request_body):
+                delta = accumulator.add(chunk)
+                if delta["thinking"]:
+                    yield {"type": "thinking", "thinking": delta["thinking"]}
+                if delta["content"]:
+                    yield {"type": "content", "content": delta["content"]}
+                for tool_call in delta["tool_calls"]:
+                    yield {"type": "tool_call", "tool_call": tool_call}
+        except requests.exceptions.RequestException as e:
+            error = {"error": True, "message": f"Request failed: {str(e)}"}
+            yield {"type": "error", "message": error["message"]}
+            return error
+        
+        final_response = accumulator.response()
+        self._observe_response(final_response, request_body.get("model"))
+        self._record_metrics(request_body, final_response, time.perf_counter() - request_start)
+        if selection is not None:
+            final_response["tool_selection"] = selection.report()
+        yield {"type": "done", "response": final_response}
+        return final_response
+    
     def process_tool_calls(
         self, 
         response: Dict[str, Any]
@@ -158,142 +832,783 @@ class OllamaToolCaller:
         Returns:
             List[ExecutionResult]: 执行结果列表
         """
-        results = []
-        
         message = response.get("message", {})
         tool_calls = message.get("tool_calls", [])
         
-        for tool_call in tool_calls:
-            func = tool_call.get("function", {})
-            tool_name = func.get("name", "")
-            arguments = func.get("arguments", {})
-            
-            if tool_name in self.tool_registry:
-                tool_info = self.tool_registry[tool_name]
-                result = self.executor.execute_tool(
-                    tool_name=tool_name,
-                    arguments=arguments,
-                    skill_path=tool_info["skill_path"],
-                    skill_action=tool_info["skill_action"]
-                )
-            else:
-                result = ExecutionResult(
-                    success=False,
-                    tool_name=tool_name,
-                    result={},
-                    error=f"Unknown tool: {tool_name}"
-                )
+        return self.executor.execute_tool_calls(tool_calls, self.tool_registry)
+    
+    def _chat_request(self, request_body: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        发送单次聊天请求（设置了模型级联时经过级联）
+        
+        Args:
+            request_body: 请求体
+            
+        Returns:
+            Dict: 响应结果
+        """
+        if self.cascade is not None:
+            return self._cascade_chat(request_body)
+        return self._post_chat(request_body)
+    
+    def _cascade_chat(
+        self, 
+        request_body: Dict[str, Any],
+        conversation_id: Optional[str] = None,
+        timeout: Optional[float] = None,
+        budget: Optional[DeadlineBudget] = None,
+        prompt_tokens: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        按模型级联发送聊天请求
+        
+        依次使用级联中的模型，回复校验通过（或已是最后一个模型）时返回；
+        较小的模型请求失败时同样升级。返回的响应带有cascade字段:
+        {model, tier, errors（最终回复的校验错误）, escalations: [{model, errors}]}
+        设置了budget时每一级的超时不超过剩余时间，预算耗尽时不再升级。
+        设置了context_window时按每一级的模型选择num_ctx。
+        
+        Args:
+            request_body: 请求体（model字段被级联中的模型替换）
+            conversation_id: 对话ID（用于实例池的对话绑定）
+            timeout: 每次请求的超时(秒)
+            budget: 时间预算
+            prompt_tokens: 已估算的提示词token数（用于选择num_ctx），为None时重新估算
+            
+        Returns:
+            Dict: 响应结果
+            
+        Raises:
+            requests.exceptions.RequestException: 最后一个模型的请求失败
+            requests.exceptions.Timeout: 升级前时间预算已耗尽
+        """
+        cascade = self.cascade
+        escalations = []
+        start = time.perf_counter()
+        last_tier = len(cascade.models) - 1
+        if self.context_window is not None and prompt_tokens is None:
+            prompt_tokens = estimate_prompt_tokens(request_body.get("messages", []), request_body.get("tools"))
+        for tier, model in enumerate(cascade.models):
+            tier_timeout = timeout
+            if budget is not None:
+                if tier > 0 and budget.expired():
+                    raise requests.exceptions.Timeout(
+                        f"Deadline exceeded before escalating to {model}"
+                    )
+                tier_timeout = min(timeout, budget.remaining()) if timeout is not None else budget.remaining()
+            attempt_start = time.perf_counter()
+            try:
+                tier_body = self._size_context(dict(request_body, model=model), prompt_tokens)
+                response = self._post_chat(tier_body, conversation_id, timeout=tier_timeout)
+            except requests.exceptions.RequestException as e:
+                cascade.record(tier, time.perf_counter() - attempt_start, accepted=False, failed=True)
+                if tier == last_tier or isinstance(e, OllamaRequestCancelled):
+                    raise
+                if budget is not None and budget.expired():
+                    raise
+                escalations.append({"model": model, "errors": [f"Request failed: {str(e)}"]})
+                continue
+            
+            errors = cascade.validate(response.get("message") or {}, self.tool_registry)
+            now = time.perf_counter()
+            accepted = not errors or tier == last_tier
+            cascade.record(tier, now - attempt_start, accepted, total_time=now - start)
+            if accepted:
+                response["cascade"] = {
+                    "model": model,
+                    "tier": tier,
+                    "errors": errors,
+                    "escalations": escalations
+                }
+                return response
+            escalations.append({"model": model, "errors": errors})
+    
+    def _stream_and_dispatch(
+        self, 
+        request_body: Dict[str, Any],
+        dispatcher: PipelinedToolDispatcher,
+        conversation_id: Optional[str] = None,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        流式读取聊天响应，每收到一个完整的工具调用就交给调度器执行
+        
+        Args:
+            request_body: 请求体（stream需为True）
+            dispatcher: 流水线工具调度器
+            conversation_id: 对话ID（用于实例池的对话绑定）
+            timeout: 整个流的超时(秒)，为None时使用config.timeout作为读取超时
+            
+        Returns:
+            Dict: 组装后的响应，格式与非流式响应一致
+            
+        Raises:
+            requests.exceptions.RequestException: 请求失败或流中出现错误
+        """
+        def fetch() -> Dict[str, Any]:
+            accumulator = ChatStreamAccumulator()
+            for chunk in self._iter_chat_stream(request_body, conversation_id, timeout):
+                for tool_call in accumulator.add(chunk)["tool_calls"]:
+                    dispatcher.submit(tool_call)
+            response_data = accumulator.response()
+            self._observe_response(response_data, request_body.get("model"))
+            return response_data
+        
+        response_data = self._send_chat(request_body, fetch)
+        if response_data.get("cached"):
+            for tool_call in response_data.get("message", {}).get("tool_calls", []):
+                dispatcher.submit(tool_call)
+        return response_data
+    
+    def _with_plan_tool(self, tools: ToolSchemaSet) -> ToolSchemaSet:
+        """
+        在工具集合末尾加上run_plan工具（计划模式）
+        
+        Args:
+            tools: 工具集合
+            
+        Returns:
+            ToolSchemaSet: 工具集合
+        """
+        return self.schema_cache.for_tools(list(tools) + [PLAN_TOOL.to_ollama_format()])
+    
+    def _execute_with_plans(
+        self, 
+        tool_calls: List[Dict[str, Any]],
+        cancel_event: Optional[threading.Event] = None,
+        budget: Optional[DeadlineBudget] = None
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], int]:
+        """
+        按顺序执行一轮中的run_plan调用和普通工具调用（计划模式）
+        
+        相邻的普通工具调用作为一批交给执行器。计划的每一步开始前检查取消事件和时间预算。
+        
+        Args:
+            tool_calls: 本轮的工具调用
+            cancel_event: 取消事件
+            budget: 时间预算
             
-            results.append(result)
+        Returns:
+            Tuple: (按调用顺序的tool消息, 计划执行报告列表, 执行的工具调用数)
+        """
+        tool_messages: List[Dict[str, Any]] = []
+        reports: List[Dict[str, Any]] = []
+        executed = 0
+        batch: List[Dict[str, Any]] = []
         
-        return results
+        def flush() -> None:
+            nonlocal executed
+            if batch:
+                results = self.executor.execute_tool_calls(list(batch), self.tool_registry)
+                tool_messages.extend(self._tool_message(result) for result in results)
+                executed += len(results)
+                batch.clear()
+        
+        for tool_call in tool_calls:
+            func = tool_call.get("function", {})
+            if func.get("name") != PLAN_TOOL_NAME:
+                batch.append(tool_call)
+                continue
+            flush()
+            report = run_plan_call(
+                func.get("arguments"), self.executor, self.tool_registry, cancel_event, budget
+            )
+            reports.append(report)
+            tool_messages.append(plan_tool_message(report))
+            executed += len(report["steps"])
+        flush()
+        return tool_messages, reports, executed
     
     def chat_with_tool_execution(
         self, 
         user_message: str, 
         tools: Optional[List[Dict[str, Any]]] = None,
         system_prompt: Optional[str] = None,
-        max_iterations: int = 5
+        max_iterations: int = 5,
+        deadline: Optional[Union[float, DeadlineBudget]] = None,
+        plan: bool = False
     ) -> Dict[str, Any]:
         """
         带工具执行的完整对话流程
         
+        config.stream为True时，工具调用在其分块到达后立即开始执行，与模型剩余的
+        生成过程重叠（只读工具立即执行，会改变输入状态的工具保持顺序）。
+        返回结果中的iterations为每轮的计时:
+            llm_time: 请求发出到响应结束的时间(秒)
+            tool_calls: 本轮工具调用数
+            tool_time: 从第一个工具开始到最后一个工具结束的时间(秒)
+            wait_after_response: 响应结束后等待工具完成的时间(秒)
+            overlap_saved: 因与生成重叠而节省的时间(秒)
+            pipelined: 是否使用了流水线调度
+            prefix_changed: 系统提示词+工具定义前缀是否与上一次请求不同（Ollama无法复用KV缓存）
+            prompt_tokens: 本轮请求估算的提示词token数（压缩后）
+            prompt_eval_count: Ollama实际处理的提示词token数
+            context_saved: 上下文压缩节省的估算token数
+            metrics: 本轮请求的推理指标（加载、prefill、解码耗时和速度，见inference_telemetry）
+            degraded: 本轮是否使用了降级配置（设置了deadline时）
+            request_timeout: 本轮请求的超时(秒)，未设置deadline时为None
+            model: 本轮回复使用的模型（设置了模型级联时为被采用的模型）
+            plan_steps: 本轮执行的计划步骤数（计划模式）
+        设置了工具检索器且未指定tools时，只发送相关工具子集，模型调用或提到未发送的
+        工具时将其补回；返回结果中的tool_selection给出前后估算的提示词token数。
+        设置了deadline时，每次请求的超时随剩余时间缩短，剩余时间不足时切换到降级配置
+        （更小的工具子集、num_predict上限、备用模型，见DeadlineBudget）；预算耗尽时返回
+        partial为True的部分结果。返回结果中的deadline给出各阶段耗时。
+        plan为True时模型可以调用run_plan一次给出多步计划（见tool_plan），计划在本地执行，
+        只有某一步失败或要求观察时才再次请求模型；计划全部完成时直接以其final作为回复
+        （plan_completed为True）。返回结果中的plans为每个计划的执行报告。
+        
         Args:
             user_message: 用户消息
             tools: 工具定义列表
             system_prompt: 系统提示词
             max_iterations: 最大迭代次数
+            deadline: 时间预算(秒)或DeadlineBudget，为None时不限制
+            plan: 是否使用计划模式
             
         Returns:
             Dict: 最终响应
         """
-        if tools is None:
-            tools = get_all_tools_ollama_format()
-        
         messages = []
         
+        if plan:
+            system_prompt = f"{system_prompt}\n\n{PLAN_SYSTEM_PROMPT}" if system_prompt else PLAN_SYSTEM_PROMPT
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
         
         messages.append({"role": "user", "content": user_message})
         
+        final_response, _ = self.run_tool_loop(messages, tools, max_iterations, deadline=deadline, plan=plan)
+        return final_response
+    
+    def run_tool_loop(
+        self, 
+        messages: List[Dict[str, Any]], 
+        tools: Optional[List[Dict[str, Any]]] = None,
+        max_iterations: int = 5,
+        conversation_id: Optional[str] = None,
+        cancel_event: Optional[threading.Event] = None,
+        deadline: Optional[Union[float, DeadlineBudget]] = None,
+        plan: bool = False
+    ) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        在已有的对话历史上执行工具循环（chat_with_tool_execution的主体）
+        
+        最后一条用户消息用于工具子集检索。不修改传入的列表。
+        
+        Args:
+            messages: 对话历史，最后一条通常是新的用户消息
+            tools: 工具定义列表，为None时按chat_with_tool_execution的规则选择
+            max_iterations: 最大迭代次数
+            conversation_id: 对话ID；为None时生成一次性的ID，结束后解除实例池绑定
+            cancel_event: 取消事件；被设置后在下一次模型请求或工具执行前结束，
+                          返回结果中cancelled为True
+            deadline: 时间预算(秒)或DeadlineBudget，为None时不限制
+            plan: 是否使用计划模式（发送run_plan工具；不使用流水线调度和模型级联）
+            
+        Returns:
+            Tuple[Dict, List[Dict]]: (最终响应, 结束时的对话历史（可能已被上下文预算压缩）)
+        """
+        if deadline is None or isinstance(deadline, DeadlineBudget):
+            budget = deadline
+        else:
+            budget = DeadlineBudget(deadline)
+        
+        phase_start = time.perf_counter()
+        user_message = next(
+            (m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), ""
+        )
+        tools, selection = self._select_tools(user_message, tools)
+        messages = list(messages)
+        if budget is not None:
+            budget.add("selection", time.perf_counter() - phase_start)
+        
         iteration = 0
         final_response = None
+        iterations: List[Dict[str, Any]] = []
+        plans: List[Dict[str, Any]] = []
+        owns_conversation = conversation_id is None
+        if owns_conversation:
+            conversation_id = uuid.uuid4().hex
         
         while iteration < max_iterations:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            if budget is not None and budget.expired():
+                budget.exhausted = True
+                break
             iteration += 1
             
-            request_body = self._build_chat_request(messages, tools)
+            if selection is not None:
+                tools = self.schema_cache.for_names(selection.names)
+                selection.record_request(messages)
+            
+            degraded = budget is not None and budget.should_degrade()
+            if degraded:
+                budget.mark_degraded(iteration)
+                tools = self._degraded_tools(tools, messages, user_message, budget.degraded_top_k)
+            request_tools = self._with_plan_tool(tools) if plan else tools
+            
+            phase_start = time.perf_counter()
+            if self.context is not None:
+                messages, context_stats = self.context.compact(messages, request_tools)
+                prompt_tokens = context_stats["tokens_after"]
+                context_saved = context_stats["tokens_before"] - context_stats["tokens_after"]
+            else:
+                prompt_tokens = estimate_prompt_tokens(messages, request_tools)
+                context_saved = 0
+            if budget is not None:
+                budget.add("context", time.perf_counter() - phase_start)
+            
+            _, prefix_changed = self.schema_cache.observe_prefix(messages, request_tools)
+            request_body = self._build_chat_request(messages, request_tools, prompt_tokens, size_context=False)
+            request_timeout = None
+            if budget is not None:
+                request_timeout = budget.request_timeout(max_iterations - iteration + 1, self.config.timeout)
+                if degraded:
+                    budget.degrade_request(request_body)
+            use_cascade = self.cascade is not None and not degraded and not plan
+            if not use_cascade:
+                # 降级可能换成备用模型：确定模型后再选择num_ctx
+                self._size_context(request_body, prompt_tokens)
+            dispatcher = None
+            request_start = time.perf_counter()
             
             try:
-                response = requests.post(
-                    f"{self.config.base_url}/api/chat",
-                    json=request_body,
-                    timeout=self.config.timeout
-                )
-                response.raise_for_status()
-                response_data = response.json()
+                if use_cascade:
+                    # 级联需要先校验完整的回复，不能边流式接收边执行工具
+                    response_data = self._cascade_chat(
+                        request_body, conversation_id, timeout=request_timeout, budget=budget,
+                        prompt_tokens=prompt_tokens
+                    )
+                elif request_body.get("stream") and not plan:
+                    dispatcher = PipelinedToolDispatcher(self.executor, self.tool_registry)
+                    response_data = self._stream_and_dispatch(
+                        request_body, dispatcher, conversation_id, timeout=request_timeout
+                    )
+                else:
+                    response_data = self._post_chat(request_body, conversation_id, timeout=request_timeout)
                 
             except requests.exceptions.RequestException as e:
-                return {
+                if dispatcher is not None:
+                    dispatcher.wait()
+                if budget is not None:
+                    budget.add("llm", time.perf_counter() - request_start)
+                    if isinstance(e, requests.exceptions.Timeout) or budget.expired():
+                        # 时间预算耗尽：返回部分结果
+                        budget.exhausted = True
+                        break
+                if self.backend_pool is not None and owns_conversation:
+                    self.backend_pool.forget(conversation_id)
+                error = {
                     "error": True,
                     "message": f"Request failed: {str(e)}",
-                    "iteration": iteration
+                    "iteration": iteration,
+                    "iterations": iterations
                 }
+                if cancel_event is not None and cancel_event.is_set():
+                    error.update(message="Cancelled", cancelled=True)
+                if budget is not None:
+                    error["deadline"] = budget.report()
+                return error, messages
             
+            response_end = time.perf_counter()
+            if budget is not None:
+                budget.add("llm", response_end - request_start)
+            model = (response_data.get("cascade") or {}).get("model", request_body.get("model"))
             message = response_data.get("message", {})
             tool_calls = message.get("tool_calls", [])
             content = message.get("content", "")
             
             messages.append(message)
+            added_tools = selection.add_referenced(message) if selection is not None else []
             
             if not tool_calls:
+                iterations.append({
+                    "iteration": iteration,
+                    "llm_time": round(response_end - request_start, 4),
+                    "tool_calls": 0,
+                    "tool_time": 0.0,
+                    "wait_after_response": 0.0,
+                    "overlap_saved": 0.0,
+                    "pipelined": dispatcher is not None,
+                    "prefix_changed": prefix_changed,
+                    "prompt_tokens": prompt_tokens,
+                    "prompt_eval_count": response_data.get("prompt_eval_count"),
+                    "context_saved": context_saved,
+                    "metrics": response_data.get("metrics"),
+                    "degraded": degraded,
+                    "request_timeout": request_timeout,
+                    "model": model,
+                    "plan_steps": 0
+                })
+                if added_tools:
+                    # 模型提到了未发送的工具：补回后重新请求
+                    messages.pop()
+                    continue
                 final_response = response_data
                 break
             
-            for tool_call in tool_calls:
-                func = tool_call.get("function", {})
-                tool_name = func.get("name", "")
-                arguments = func.get("arguments", {})
-                
-                if tool_name in self.tool_registry:
-                    tool_info = self.tool_registry[tool_name]
-                    result = self.executor.execute_tool(
-                        tool_name=tool_name,
-                        arguments=arguments,
-                        skill_path=tool_info["skill_path"],
-                        skill_action=tool_info["skill_action"]
-                    )
-                    
-                    messages.append({
-                        "role": "tool",
-                        "content": json.dumps(result.result, ensure_ascii=False),
-                        "name": tool_name
-                    })
-                else:
-                    messages.append({
-                        "role": "tool",
-                        "content": json.dumps({"error": f"Unknown tool: {tool_name}"}),
-                        "name": tool_name
-                    })
+            if dispatcher is None and cancel_event is not None and cancel_event.is_set():
+                # 已取消：不再执行本轮的工具调用，撤回未执行的助手消息
+                messages.pop()
+                break
+            
+            reports: List[Dict[str, Any]] = []
+            if dispatcher is not None:
+                tool_messages = [self._tool_message(result) for result in dispatcher.results()]
+                executed = len(tool_messages)
+                tools_end = time.perf_counter()
+                tool_start, tool_end = dispatcher.tool_span()
+                tool_time = tool_end - tool_start
+            elif plan:
+                tool_messages, reports, executed = self._execute_with_plans(tool_calls, cancel_event, budget)
+                tools_end = time.perf_counter()
+                tool_time = tools_end - response_end
+            else:
+                results = self.executor.execute_tool_calls(tool_calls, self.tool_registry)
+                tool_messages = [self._tool_message(result) for result in results]
+                executed = len(results)
+                tools_end = time.perf_counter()
+                tool_time = tools_end - response_end
+            
+            wait_after_response = tools_end - response_end
+            iterations.append({
+                "iteration": iteration,
+                "llm_time": round(response_end - request_start, 4),
+                "tool_calls": executed,
+                "tool_time": round(tool_time, 4),
+                "wait_after_response": round(wait_after_response, 4),
+                "overlap_saved": round(max(0.0, tool_time - wait_after_response), 4),
+                "pipelined": dispatcher is not None,
+                "prefix_changed": prefix_changed,
+                "prompt_tokens": prompt_tokens,
+                "prompt_eval_count": response_data.get("prompt_eval_count"),
+                "context_saved": context_saved,
+                "metrics": response_data.get("metrics"),
+                "degraded": degraded,
+                "request_timeout": request_timeout,
+                "model": model,
+                "plan_steps": sum(len(report["steps"]) for report in reports)
+            })
+            if budget is not None:
+                budget.add("tools", wait_after_response)
+            if self.telemetry is not None:
+                self.telemetry.record_tools(model, request_tools, executed, tool_time)
+            
+            messages.extend(tool_messages)
+            for report in reports:
+                plans.append(dict(report, iteration=iteration))
+            if reports and len(reports) == len(tool_calls) and all(
+                report["stopped"] is None for report in reports
+            ):
+                # 计划全部完成：不再请求模型，直接以计划的final作为回复
+                content = "\n".join(report["final"] for report in reports if report["final"])
+                reply = {"role": "assistant", "content": content or "计划已执行完成"}
+                messages.append(reply)
+                final_response = {
+                    "model": model,
+                    "message": reply,
+                    "done": True,
+                    "plan_completed": True
+                }
+                break
         
-        if final_response is None:
+        if final_response is None and cancel_event is not None and cancel_event.is_set():
+            final_response = {
+                "error": True,
+                "cancelled": True,
+                "message": "Cancelled",
+                "iteration": iteration
+            }
+        elif final_response is None and budget is not None and budget.exhausted:
+            final_response = {
+                "error": True,
+                "partial": True,
+                "message": "Deadline exceeded",
+                "iteration": iteration,
+                "last_message": next(
+                    (m for m in reversed(messages) if m.get("role") == "assistant"), None
+                )
+            }
+        elif final_response is None:
             final_response = {
                 "error": True,
                 "message": "Max iterations reached",
                 "iteration": iteration
             }
         
-        return final_response
+        final_response["iterations"] = iterations
+        if plan:
+            final_response["plans"] = plans
+        if budget is not None:
+            final_response["deadline"] = budget.report()
+        if self.backend_pool is not None and owns_conversation:
+            self.backend_pool.forget(conversation_id)
+        if selection is not None:
+            final_response["tool_selection"] = selection.report()
+        return final_response, messages
+
+
+class AsyncOllamaToolCaller(_ToolCallerBase):
+    """
+    异步Ollama原生API工具调用器
     
-    def get_available_tools(self) -> List[str]:
+    OllamaToolCaller的asyncio版本，使用aiohttp发送请求、AsyncToolExecutor执行工具，
+    不阻塞事件循环，适合在同一进程中并发驱动多个对话。
+    取消正在等待的调用任务会同时中止HTTP请求和正在运行的技能子进程。
+    需要安装aiohttp包。
+    """
+    
+    def __init__(
+        self, 
+        config: Optional[OllamaConfig] = None,
+        executor: Optional[AsyncToolExecutor] = None,
+        tool_retriever: Optional[ToolRetriever] = None,
+        schema_cache: Optional[ToolSchemaCache] = None,
+        residency: Optional[ModelResidencyManager] = None,
+        telemetry: Optional[InferenceTelemetry] = None
+    ):
         """
-        获取可用工具列表
+        初始化异步工具调用器
+        
+        Args:
+            config: Ollama配置，为None时使用默认配置
+            executor: 异步工具执行器，为None时使用带参数校验的默认AsyncToolExecutor
+            tool_retriever: 工具检索器，用法同OllamaToolCaller
+
+            schema_cache: 预编码工具定义缓存，为None时新建
+            residency: 模型常驻管理器；设置后请求携带其keep_alive（config.keep_alive优先），
+                       并根据响应的load_duration检测模型重新加载
+            telemetry: 推理遥测，用法同OllamaToolCaller
+        """
+        if not AIOHTTP_AVAILABLE:
+            raise ImportError(
+                "aiohttp not available. Install with: pip install aiohttp"
+            )
+        
+        self.config = config or OllamaConfig()
+        self.tool_registry = create_tool_registry()
+        self.executor = executor or AsyncToolExecutor(validator=ToolCallValidator())
+        self.tool_retriever = tool_retriever
+        self.schema_cache = schema_cache or ToolSchemaCache()
+        self.residency = residency
+        self.telemetry = telemetry
+        self._session: Optional["aiohttp.ClientSession"] = None
+    
+    async def __aenter__(self) -> "AsyncOllamaToolCaller":
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+    
+    async def close(self) -> None:
+        """
+        关闭HTTP会话
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+    
+    def _get_session(self) -> "aiohttp.ClientSession":
+        """
+        获取（必要时创建）HTTP会话
         
         Returns:
-            List[str]: 工具名称列表
+            aiohttp.ClientSession: HTTP会话
         """
-        return list(self.tool_registry.keys())
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.config.timeout)
+            )
+        return self._session
+    
+    def _build_chat_request(
+        self, 
+        messages: List[Dict[str, Any]], 
+        tools: Union[ToolSchemaSet, List[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        构建聊天请求体（异步客户端不支持流式响应）
+        
+        Args:
+            messages: 消息列表
+            tools: 预编码的工具集合或工具定义列表
+            
+        Returns:
+            Dict: 请求体
+        """
+        request_body = {
+            "model": self.config.model,
+            "messages": messages,
+            "stream": False,
+            "tools": tools
+        }
+        keep_alive = self._keep_alive()
+        if keep_alive is not None:
+            request_body["keep_alive"] = keep_alive
+        if self.config.options:
+            request_body["options"] = self.config.options
+        return request_body
+    
+    async def _post_chat(self, request_body: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        发送聊天请求
+        
+        Args:
+            request_body: 请求体
+            
+        Returns:
+            Dict: 响应结果
+            
+        Raises:
+            aiohttp.ClientError: 请求失败
+            asyncio.TimeoutError: 请求超时
+            ValueError: 响应不是合法的JSON
+        """
+        session = self._get_session()
+        request_start = time.perf_counter()
+        async with session.post(
+            f"{self.config.base_url}/api/chat",
+            data=encode_chat_request(request_body),
+            headers={"Content-Type": "application/json"}
+        ) as response:
+            response.raise_for_status()
+            response_data = await response.json(content_type=None)
+        self._observe_response(response_data, request_body.get("model"))
+        metrics = inference_metrics(response_data, time.perf_counter() - request_start)
+        response_data["metrics"] = metrics
+        if self.telemetry is not None:
+            self.telemetry.record(request_body.get("model", self.config.model), request_body.get("tools"), metrics)
+        return response_data
+    
+    async def chat_with_tools(
+        self, 
+        user_message: str, 
+        tools: Optional[List[Dict[str, Any]]] = None,
+        system_prompt: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        发送带工具的聊天请求
+        
+        Args:
+            user_message: 用户消息
+            tools: 工具定义列表，为None时使用所有工具
+            system_prompt: 系统提示词
+            
+        Returns:
+            Dict: 响应结果
+        """
+        tools, selection = self._select_tools(user_message, tools)
+        
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": user_message})
+        
+        try:
+            if selection is None:
+                return await self._post_chat(self._build_chat_request(messages, tools))
+            
+            selection.record_request(messages)
+            response = await self._post_chat(self._build_chat_request(messages, tools))
+            message = response.get("message", {})
+            if selection.add_referenced(message) and not message.get("tool_calls"):
+                selection.record_request(messages)
+                tools = self.schema_cache.for_names(selection.names)
+                response = await self._post_chat(self._build_chat_request(messages, tools))
+            response["tool_selection"] = selection.report()
+            return response
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            return {
+                "error": True,
+                "message": f"Request failed: {str(e) or type(e).__name__}"
+            }
+    
+    async def process_tool_calls(
+        self, 
+        response: Dict[str, Any]
+    ) -> List[ExecutionResult]:
+        """
+        处理工具调用响应
+        
+        Args:
+            response: Ollama API响应
+            
+        Returns:
+            List[ExecutionResult]: 执行结果列表
+        """
+        message = response.get("message", {})
+        tool_calls = message.get("tool_calls", [])
+        
+        return await self.executor.execute_tool_calls(tool_calls, self.tool_registry)
+    
+    async def chat_with_tool_execution(
+        self, 
+        user_message: str, 
+        tools: Optional[List[Dict[str, Any]]] = None,
+        system_prompt: Optional[str] = None,
+        max_iterations: int = 5
+    ) -> Dict[str, Any]:
+        """
+        带工具执行的完整对话流程
+        
+        Args:
+            user_message: 用户消息
+            tools: 工具定义列表
+            system_prompt: 系统提示词
+            max_iterations: 最大迭代次数
+            
+        Returns:
+            Dict: 最终响应
+        """
+        tools, selection = self._select_tools(user_message, tools)
+        
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": user_message})
+        
+        iteration = 0
+        
+        while iteration < max_iterations:
+            iteration += 1
+            if selection is not None:
+                tools = self.schema_cache.for_names(selection.names)
+                selection.record_request(messages)
+            self.schema_cache.observe_prefix(messages, tools)
+            
+            try:
+                response_data = await self._post_chat(self._build_chat_request(messages, tools))
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                return {
+                    "error": True,
+                    "message": f"Request failed: {str(e) or type(e).__name__}",
+                    "iteration": iteration
+                }
+            
+            message = response_data.get("message", {})
+            tool_calls = message.get("tool_calls", [])
+            messages.append(message)
+            added_tools = selection.add_referenced(message) if selection is not None else []
+            
+            if not tool_calls:
+                if added_tools:
+                    messages.pop()
+                    continue
+                if selection is not None:
+                    response_data["tool_selection"] = selection.report()
+                return response_data
+            
+            results = await self.executor.execute_tool_calls(tool_calls, self.tool_registry)
+            for result in results:
+                messages.append(self._tool_message(result))
+        
+        return {
+            "error": True,
+            "message": "Max iterations reached",
+            "iteration": iteration
+        }
 
 
 class LangChainToolCaller:
@@ -426,7 +1741,7 @@ def test_connection(base_url: str = "http://127.0.0.1:11434") -> bool:
         bool: 连接是否成功
     """
     try:
-        response = requests.get(f"{base_url}/api/tags", timeout=5)
+        response = get_transport(base_url).get("/api/tags", timeout=5)
         return response.status_code == 200
     except:
         return False
@@ -443,7 +1758,7 @@ def list_models(base_url: str = "http://127.0.0.1:11434") -> List[str]:
         List[str]: 模型名称列表
     """
     try:
-        response = requests.get(f"{base_url}/api/tags", timeout=10)
+        response = get_transport(base_url).get("/api/tags", timeout=10)
         if response.status_code == 200:
             data = response.json()
             return [model["name"] for model in data.get("models", [])]
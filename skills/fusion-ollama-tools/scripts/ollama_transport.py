@@ -0,0 +1,205 @@
+"""
+ollama_transport.py - Ollama HTTP传输层模块
+
+为每个Ollama地址维护一个共享的keep-alive连接池，避免每次请求都重新建立TCP连接：
+1. 可配置连接池大小、连接/读取超时
+2. 对5xx和连接错误等瞬时错误按指数退避重试；POST（如/api/chat）不重试读取超时，
+   请求已发出后重试会让服务器重新开始生成，一次超时的推理耗用(max_retries + 1)倍的时间
+3. 多线程共享同一连接池（每个线程使用独立的Session）
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import threading
+from typing import Dict, Any, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+class OllamaTransport:
+    """
+    Ollama HTTP传输层
+
+    所有线程共用一个HTTPAdapter（即同一个urllib3连接池），每个线程持有自己的
+    requests.Session，从而既复用连接又不在线程间共享Session状态。
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        pool_size: int = 10,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 120.0,
+        max_retries: int = 2,
+        retry_backoff: float = 0.5
+    ):
+        """
+        初始化传输层
+
+        Args:
+            base_url: Ollama API基础URL
+            pool_size: 连接池最大连接数
+            connect_timeout: 连接超时(秒)
+            read_timeout: 默认读取超时(秒)
+            max_retries: 瞬时错误最大重试次数
+            retry_backoff: 重试退避系数(秒)，第n次重试前等待 retry_backoff * 2^(n-1)
+        """
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=retry_backoff,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=None,
+            raise_on_status=False
+        )
+        self._adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=retry,
+            pool_block=False
+        )
+        # POST不是幂等的：只重试连接错误和状态码，不重试请求发出后的读取错误
+        self._post_adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=retry.new(read=False),
+            pool_block=False
+        )
+        self._local = threading.local()
+
+    def _session(self, post: bool = False) -> requests.Session:
+        """
+        获取当前线程的Session（共享连接池）
+
+        Args:
+            post: 是否用于POST请求（不重试读取错误）
+
+        Returns:
+            requests.Session: 当前线程的Session
+        """
+        name = "post_session" if post else "session"
+        session = getattr(self._local, name, None)
+        if session is None:
+            adapter = self._post_adapter if post else self._adapter
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            setattr(self._local, name, session)
+        return session
+
+    def _timeout(self, timeout: Optional[Timeout]) -> Tuple[float, float]:
+        """将超时参数规范化为(连接超时, 读取超时)"""
+        if timeout is None:
+            return (self.connect_timeout, self.read_timeout)
+        if isinstance(timeout, tuple):
+            return timeout
+        return (min(self.connect_timeout, timeout), timeout)
+
+    def post(
+        self,
+        path: str,
+        json: Optional[Dict[str, Any]] = None,
+        data: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+        stream: bool = False,
+        timeout: Optional[Timeout] = None
+    ) -> requests.Response:
+        """
+        发送POST请求
+
+        只重试连接错误和5xx状态码，不重试读取超时（见模块说明）。
+
+        Args:
+            path: API路径，如 /api/chat
+            json: JSON请求体
+            data: 已编码的请求体
+            headers: 额外请求头
+            stream: 是否以流式方式读取响应
+            timeout: 超时(秒)或(连接超时, 读取超时)，为None时使用默认值
+
+        Returns:
+            requests.Response: 响应
+
+        Raises:
+            requests.exceptions.RequestException: 请求失败（重试后仍失败）
+        """
+        return self._session(post=True).post(
+            f"{self.base_url}{path}",
+            json=json,
+            data=data,
+            headers=headers,
+            stream=stream,
+            timeout=self._timeout(timeout)
+        )
+
+    def get(self, path: str, timeout: Optional[Timeout] = None) -> requests.Response:
+        """
+        发送GET请求
+
+        Args:
+            path: API路径，如 /api/tags
+            timeout: 超时(秒)或(连接超时, 读取超时)
+
+        Returns:
+            requests.Response: 响应
+        """
+        return self._session().get(f"{self.base_url}{path}", timeout=self._timeout(timeout))
+
+    def close(self) -> None:
+        """
+        关闭连接池
+        """
+        self._adapter.close()
+        self._post_adapter.close()
+
+
+_transports: Dict[Tuple[Any, ...], OllamaTransport] = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(
+    base_url: str,
+    pool_size: int = 10,
+    connect_timeout: float = 5.0,
+    read_timeout: float = 120.0,
+    max_retries: int = 2,
+    retry_backoff: float = 0.5
+) -> OllamaTransport:
+    """
+    获取共享的传输层实例
+
+    相同地址和参数的调用方共用同一个连接池。
+
+    Args:
+        base_url: Ollama API基础URL
+        pool_size: 连接池最大连接数
+        connect_timeout: 连接超时(秒)
+        read_timeout: 默认读取超时(秒)
+        max_retries: 瞬时错误最大重试次数
+        retry_backoff: 重试退避系数(秒)
+
+    Returns:
+        OllamaTransport: 传输层实例
+    """
+    key = (base_url.rstrip("/"), pool_size, connect_timeout, read_timeout, max_retries, retry_backoff)
+    with _transports_lock:
+        transport = _transports.get(key)
+        if transport is None:
+            transport = OllamaTransport(*key)
+            _transports[key] = transport
+        return transport
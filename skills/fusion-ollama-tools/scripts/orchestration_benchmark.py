@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+端到端编排基准测试
+
+用离线Ollama桩服务器（或指定的真实Ollama）端到端运行chat_with_tool_execution，
+测量模型推理之外我们自己的编排开销:
+1. 每轮开销: 客户端测得的请求耗时减去服务器报告的total_duration（请求编码、HTTP、解析）
+2. 每次对话的编排开销: 总耗时减去服务器推理时间和工具执行时间
+3. 吞吐量（对话/秒、轮次/秒）和对话延迟的均值、P50/P95/P99
+4. --compare-plan: 同一个多步任务（定位→点击→打开网页）分别用迭代式工具循环和
+   计划模式（run_plan，见tool_plan）运行，比较模型往返次数和端到端延迟
+
+默认使用MockToolExecutor，--real-skills时使用真实技能脚本。
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from execution_mode_benchmark import percentile, REPO_ROOT
+from ollama_stub_server import OllamaStubServer, DEFAULT_SCRIPT
+from ollama_tools import OllamaToolCaller, OllamaConfig
+from tool_executor import ToolExecutor, MockToolExecutor, EXECUTION_MODES
+
+
+DEFAULT_PROMPT = "获取屏幕尺寸"
+
+MULTI_STEP_PROMPT = "找到屏幕上的浏览器图标并点击，然后打开 https://www.example.com"
+
+# 迭代式工具循环：每一步一次模型往返
+ITERATIVE_SCRIPT: List[Dict[str, Any]] = [
+    {"content": "", "tool_calls": [
+        {"function": {"name": "desktop_locate", "arguments": {"image": "browser_icon.png"}}}
+    ]},
+    {"content": "", "tool_calls": [
+        {"function": {"name": "desktop_click", "arguments": {"x": 640, "y": 360}}}
+    ]},
+    {"content": "", "tool_calls": [
+        {"function": {"name": "browser_open", "arguments": {"url": "https://www.example.com"}}}
+    ]},
+    {"content": "已点击浏览器图标并打开网页。"}
+]
+
+# 计划模式：一次给出整个计划，第二步引用第一步的结果
+PLAN_SCRIPT: List[Dict[str, Any]] = [
+    {"content": "", "tool_calls": [{"function": {"name": "run_plan", "arguments": {
+        "steps": [
+            {"id": "s1", "tool": "desktop_locate", "arguments": {"image": "browser_icon.png"}},
+            {"id": "s2", "tool": "desktop_click", "arguments": {"x": "$s1.center_x", "y": "$s1.center_y"}},
+            {"id": "s3", "tool": "browser_open", "arguments": {"url": "https://www.example.com"}}
+        ],
+        "final": "已点击浏览器图标并打开网页。"
+    }}}]},
+    {"content": "已点击浏览器图标并打开网页。"}
+]
+
+
+def _distribution(values: List[float]) -> Dict[str, float]:
+    """均值和分位数（毫秒）"""
+    return {
+        "mean_ms": round(statistics.mean(values) * 1000, 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3)
+    }
+
+
+def run_benchmark(
+    caller: OllamaToolCaller,
+    runs: int = 50,
+    concurrency: int = 1,
+    prompt: str = DEFAULT_PROMPT,
+    max_iterations: int = 5,
+    plan: bool = False
+) -> Dict[str, Any]:
+    """
+    多次运行chat_with_tool_execution并汇总开销
+
+    Args:
+        caller: 工具调用器（指向桩服务器或真实Ollama）
+        runs: 对话次数
+        concurrency: 并发对话数
+        prompt: 用户消息
+        max_iterations: 每次对话的最大迭代次数
+        plan: 是否使用计划模式
+
+    Returns:
+        Dict: {runs, errors, iterations, round_trips, elapsed, runs_per_sec, iterations_per_sec,
+            latency, iteration_overhead, orchestration_overhead, server_time, tool_time}；
+            round_trips为每次对话的平均模型请求数
+    """
+    def one(_: int) -> Dict[str, Any]:
+        start = time.perf_counter()
+        response = caller.chat_with_tool_execution(prompt, max_iterations=max_iterations, plan=plan)
+        return {"wall": time.perf_counter() - start, "response": response}
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        outcomes = list(pool.map(one, range(runs)))
+    elapsed = time.perf_counter() - start
+
+    latencies: List[float] = []
+    iteration_overheads: List[float] = []
+    orchestration: List[float] = []
+    server_times: List[float] = []
+    tool_times: List[float] = []
+    errors = 0
+    iterations = 0
+    for outcome in outcomes:
+        response = outcome["response"]
+        if response.get("error"):
+            errors += 1
+        latencies.append(outcome["wall"])
+        server_total = 0.0
+        tool_total = 0.0
+        for record in response.get("iterations", []):
+            iterations += 1
+            metrics = record.get("metrics") or {}
+            server = metrics.get("total_duration") or 0.0
+            server_total += server
+            tool_total += record.get("wait_after_response", 0.0)
+            iteration_overheads.append(max(0.0, record["llm_time"] - server))
+        server_times.append(server_total)
+        tool_times.append(tool_total)
+        orchestration.append(max(0.0, outcome["wall"] - server_total - tool_total))
+
+    return {
+        "runs": runs,
+        "concurrency": concurrency,
+        "errors": errors,
+        "iterations": iterations,
+        "round_trips": round(iterations / runs, 2) if runs else 0.0,
+        "elapsed": round(elapsed, 4),
+        "runs_per_sec": round(runs / elapsed, 2) if elapsed > 0 else 0.0,
+        "iterations_per_sec": round(iterations / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency": _distribution(latencies),
+        "iteration_overhead": _distribution(iteration_overheads),
+        "orchestration_overhead": _distribution(orchestration),
+        "server_time": _distribution(server_times),
+        "tool_time": _distribution(tool_times)
+    }
+
+
+def compare_plan_modes(
+    executor: ToolExecutor,
+    runs: int = 20,
+    model: str = "qwen3:latest",
+    prefill_latency: float = 0.0,
+    decode_latency: float = 0.0,
+    prompt: str = MULTI_STEP_PROMPT
+) -> Dict[str, Any]:
+    """
+    比较迭代式工具循环和计划模式完成同一个多步任务的往返次数和延迟
+
+    两种模式各用一个桩服务器（分别按ITERATIVE_SCRIPT和PLAN_SCRIPT回复）。
+
+    Args:
+        executor: 工具执行器（计划中的引用需要结果中有center_x/center_y，
+                  MockToolExecutor的模拟结果带有这些字段）
+        runs: 每种模式的对话次数
+        model: 模型名称
+        prefill_latency: 桩服务器每个提示词token的prefill耗时(秒)
+        decode_latency: 桩服务器每个生成token的解码耗时(秒)
+        prompt: 用户消息
+
+    Returns:
+        Dict: {"iterative": run_benchmark结果, "plan": run_benchmark结果,
+            "round_trips_saved", "latency_saved_ms", "speedup"}
+    """
+    results = {}
+    for mode, script in (("iterative", ITERATIVE_SCRIPT), ("plan", PLAN_SCRIPT)):
+        with OllamaStubServer(script=script, models=[model], prefill_latency=prefill_latency,
+                              decode_latency=decode_latency) as stub:
+            caller = OllamaToolCaller(config=OllamaConfig(base_url=stub.base_url, model=model),
+                                      executor=executor)
+            results[mode] = run_benchmark(caller, runs, prompt=prompt, plan=mode == "plan")
+
+    iterative_ms = results["iterative"]["latency"]["mean_ms"]
+    plan_ms = results["plan"]["latency"]["mean_ms"]
+    results["round_trips_saved"] = round(results["iterative"]["round_trips"] - results["plan"]["round_trips"], 2)
+    results["latency_saved_ms"] = round(iterative_ms - plan_ms, 3)
+    results["speedup"] = round(iterative_ms / plan_ms, 2) if plan_ms > 0 else None
+    return results
+
+
+def print_comparison(result: Dict[str, Any]) -> None:
+    """
+    打印迭代式与计划模式的比较
+
+    Args:
+        result: compare_plan_modes的返回值
+    """
+    print("\n" + "=" * 72)
+    print("多步任务: 迭代式工具循环 vs 计划模式")
+    print("=" * 72)
+    print(f"{'模式':<16}{'往返/对话':>12}{'失败':>8}{'延迟均值(ms)':>16}{'P95(ms)':>12}")
+    print("-" * 72)
+    for mode, label in (("iterative", "迭代式"), ("plan", "计划模式")):
+        r = result[mode]
+        print(f"{label:<16}{r['round_trips']:>12}{r['errors']:>8}"
+              f"{r['latency']['mean_ms']:>16.3f}{r['latency']['p95_ms']:>12.3f}")
+    print("-" * 72)
+    print(f"减少往返: {result['round_trips_saved']}/对话, 节省延迟: {result['latency_saved_ms']} ms, "
+          f"加速: {result['speedup']}x")
+    print("=" * 72)
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    """
+    打印测试报告
+
+    Args:
+        result: run_benchmark的返回值
+    """
+    print("\n" + "=" * 72)
+    print(f"端到端编排基准 (对话数: {result['runs']}, 并发: {result['concurrency']}, "
+          f"失败: {result['errors']})")
+    print("=" * 72)
+    print(f"吞吐量: {result['runs_per_sec']} 对话/秒, {result['iterations_per_sec']} 轮/秒")
+    print(f"{'指标 (毫秒)':<20}{'均值':>12}{'P50':>12}{'P95':>12}{'P99':>12}")
+    print("-" * 72)
+    for key, label in (
+        ("latency", "对话延迟"),
+        ("server_time", "服务器推理"),
+        ("tool_time", "工具等待"),
+        ("orchestration_overhead", "编排开销/对话"),
+        ("iteration_overhead", "请求开销/轮"),
+    ):
+        d = result[key]
+        print(f"{label:<20}{d['mean_ms']:>12.3f}{d['p50_ms']:>12.3f}{d['p95_ms']:>12.3f}{d['p99_ms']:>12.3f}")
+    print("=" * 72)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端编排基准测试（离线Ollama桩服务器）")
+    parser.add_argument("--runs", type=int, default=50, help="对话次数")
+    parser.add_argument("--concurrency", type=int, default=1, help="并发对话数")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT, help="用户消息")
+    parser.add_argument("--stream", action="store_true", help="使用流式响应（工具调用流水线执行）")
+    parser.add_argument("--base-url", help="使用真实Ollama而不是桩服务器")
+    parser.add_argument("--model", default="qwen3:latest", help="模型名称")
+    parser.add_argument("--script", help="桩服务器的JSON脚本文件（助手消息列表）")
+    parser.add_argument("--prefill-ms", type=float, default=0.0, help="桩服务器每个提示词token的prefill耗时(毫秒)")
+    parser.add_argument("--decode-ms", type=float, default=0.0, help="桩服务器每个生成token的解码耗时(毫秒)")
+    parser.add_argument("--real-skills", action="store_true", help="执行真实技能脚本而不是MockToolExecutor")
+    parser.add_argument("--execution-mode", default="inprocess", choices=EXECUTION_MODES, help="真实技能的执行模式")
+    parser.add_argument("--compare-plan", action="store_true",
+                        help="比较迭代式工具循环和计划模式完成多步任务的往返次数和延迟")
+    parser.add_argument("--output", help="将结果保存为JSON文件")
+    args = parser.parse_args()
+
+    if args.compare_plan:
+        executor = MockToolExecutor()
+        try:
+            result = compare_plan_modes(executor, args.runs, args.model, args.prefill_ms / 1000,
+                                        args.decode_ms / 1000)
+        finally:
+            executor.close()
+        print_comparison(result)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            print(f"\n结果已保存: {args.output}")
+        return
+
+    script: Optional[List[Dict[str, Any]]] = None
+    if args.script:
+        with open(args.script, "r", encoding="utf-8") as f:
+            script = json.load(f)
+
+    if args.real_skills:
+        executor = ToolExecutor(base_path=REPO_ROOT, execution_mode=args.execution_mode)
+    else:
+        executor = MockToolExecutor()
+
+    stub = None
+    base_url = args.base_url
+    if base_url is None:
+        stub = OllamaStubServer(
+            script=script or DEFAULT_SCRIPT,
+            models=[args.model],
+            prefill_latency=args.prefill_ms / 1000,
+            decode_latency=args.decode_ms / 1000
+        ).start()
+        base_url = stub.base_url
+        print(f"桩服务器: {base_url}")
+
+    config = OllamaConfig(base_url=base_url, model=args.model, stream=args.stream,
+                          pool_size=max(10, args.concurrency))
+    caller = OllamaToolCaller(config=config, executor=executor)
+    try:
+        result = run_benchmark(caller, args.runs, args.concurrency, args.prompt)
+    finally:
+        executor.close()
+        if stub is not None:
+            stub.stop()
+
+    print_report(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
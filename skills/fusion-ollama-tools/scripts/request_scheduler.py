@@ -0,0 +1,165 @@
+"""
+request_scheduler.py - 模型请求公平调度模块
+
+多个对话共享同一个Ollama后端时，所有模型请求经过同一个调度器：
+1. 全局并发上限与后端的处理能力（OLLAMA_NUM_PARALLEL × 实例数）对应，超出的请求排队
+2. 按对话轮询出队，一个对话排队的请求再多也不会饿死其他对话
+3. 可以取消某个对话正在排队的请求
+4. 统计队列深度和排队等待时间
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Any, Optional, Hashable
+
+
+class _Waiter:
+    """排队中的请求"""
+
+    __slots__ = ("event", "granted", "enqueued")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+        self.enqueued = time.monotonic()
+
+
+class FairScheduler:
+    """
+    按对话轮询的并发调度器
+
+    用法:
+        scheduler = FairScheduler(max_concurrent=2)
+        if scheduler.acquire("session-1"):
+            try:
+                ...  # 发送模型请求
+            finally:
+                scheduler.release()
+    """
+
+    def __init__(self, max_concurrent: int = 1):
+        """
+        初始化调度器
+
+        Args:
+            max_concurrent: 同时进行的模型请求上限
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.in_flight = 0
+        self._queues: "OrderedDict[Hashable, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.granted = 0
+        self.cancelled = 0
+        self.timeouts = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _queue_depth(self) -> int:
+        """排队中的请求数（调用方需持有self._lock）"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _grant(self, wait: float) -> None:
+        """占用一个并发槽位并记录等待时间（调用方需持有self._lock）"""
+        self.in_flight += 1
+        self.granted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def _dispatch(self) -> None:
+        """把空闲槽位按对话轮询分配给排队的请求（调用方需持有self._lock）"""
+        now = time.monotonic()
+        while self.in_flight < self.max_concurrent and self._queues:
+            key, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            waiter.granted = True
+            self._grant(now - waiter.enqueued)
+            waiter.event.set()
+
+    def acquire(self, key: Optional[Hashable] = None, timeout: Optional[float] = None) -> bool:
+        """
+        等待一个并发槽位
+
+        Args:
+            key: 对话标识，同一对话的请求按提交顺序出队
+            timeout: 最长等待时间(秒)，为None时一直等待
+
+        Returns:
+            bool: 获得槽位返回True（使用完后需调用release）；超时或被取消返回False
+        """
+        with self._lock:
+            if self.in_flight < self.max_concurrent and not self._queues:
+                self._grant(0.0)
+                return True
+            waiter = _Waiter()
+            self._queues.setdefault(key, deque()).append(waiter)
+            self.max_queue_depth = max(self.max_queue_depth, self._queue_depth())
+
+        waiter.event.wait(timeout)
+
+        with self._lock:
+            if waiter.granted:
+                return True
+            queue = self._queues.get(key)
+            if queue is not None and waiter in queue:
+                queue.remove(waiter)
+                if not queue:
+                    del self._queues[key]
+                self.timeouts += 1
+            return False
+
+    def release(self) -> None:
+        """
+        释放一个并发槽位
+        """
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._dispatch()
+
+    def cancel(self, key: Optional[Hashable]) -> int:
+        """
+        取消对话所有排队中的请求，对应的acquire返回False
+
+        Args:
+            key: 对话标识
+
+        Returns:
+            int: 取消的请求数
+        """
+        with self._lock:
+            queue = self._queues.pop(key, None) or deque()
+            self.cancelled += len(queue)
+        for waiter in queue:
+            waiter.event.set()
+        return len(queue)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取调度统计
+
+        Returns:
+            Dict: {max_concurrent, in_flight, queue_depth, max_queue_depth, queued_by_key,
+                granted, cancelled, timeouts, avg_wait, max_wait}
+        """
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "in_flight": self.in_flight,
+                "queue_depth": self._queue_depth(),
+                "max_queue_depth": self.max_queue_depth,
+                "queued_by_key": {str(key): len(queue) for key, queue in self._queues.items()},
+                "granted": self.granted,
+                "cancelled": self.cancelled,
+                "timeouts": self.timeouts,
+                "avg_wait": round(self.total_wait / self.granted, 4) if self.granted else 0.0,
+                "max_wait": round(self.max_wait, 4)
+            }
@@ -0,0 +1,296 @@
+"""
+response_cache.py - 模型响应磁盘缓存模块
+
+相同的自动化提示词在确定性设置（temperature为0或固定seed）下会得到相同的响应，
+本模块把聊天响应缓存到本地磁盘，重复请求不再发送到Ollama：
+1. 缓存键为模型、options、消息和工具定义哈希的SHA-256
+2. 按最近使用排序，超出容量上限时淘汰最久未使用的条目；条目超过TTL后失效
+3. 相同的并发请求合并为一次实际请求
+4. 命中缓存的响应带有cached=True
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable
+
+from tool_schema_cache import ToolSchemaSet
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "fusion-ollama-tools", "responses")
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+DEFAULT_TTL = 7 * 24 * 3600.0
+
+# 不影响模型输出、不参与缓存键的请求字段
+NON_KEY_FIELDS = ("stream", "keep_alive")
+
+# 不写入缓存的响应字段（由调用器在每次对话中附加）
+NON_CACHED_FIELDS = ("cached", "tool_selection", "iterations", "metrics")
+
+
+class _InFlight:
+    """正在进行中的请求，供相同的并发请求等待其响应"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.response: Optional[Dict[str, Any]] = None
+
+
+class ResponseCache:
+    """
+    模型响应磁盘缓存
+
+    每个条目是cache_dir下的一个JSON文件，文件修改时间即最近使用时间。
+    只缓存done为True且没有错误的响应。
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl: float = DEFAULT_TTL,
+        clock: Callable[[], float] = time.time
+    ):
+        """
+        初始化缓存，加载已有条目的索引
+
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存文件总大小上限(字节)
+            ttl: 条目有效期(秒)
+            clock: 墙上时钟（便于测试；TTL需跨进程有效，不能使用monotonic）
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._in_flight: Dict[str, _InFlight] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        """条目文件路径"""
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_index(self) -> None:
+        """按文件修改时间从旧到新建立LRU索引"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-len(".json")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+        with self._lock:
+            self._evict()
+
+    @staticmethod
+    def make_key(request_body: Dict[str, Any]) -> str:
+        """
+        生成缓存键
+
+        Args:
+            request_body: 聊天请求体
+
+        Returns:
+            str: 模型、options、消息和工具定义哈希等字段的SHA-256
+        """
+        keyed = {key: value for key, value in request_body.items() if key not in NON_KEY_FIELDS}
+        tools = keyed.get("tools")
+        if tools is not None:
+            if not isinstance(tools, ToolSchemaSet):
+                tools = ToolSchemaSet(tools)
+            keyed["tools"] = tools.digest
+        canonical = json.dumps(keyed, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _evict(self) -> None:
+        """淘汰最久未使用的条目直到不超过容量上限（调用方需持有self._lock）"""
+        total = sum(self._index.values())
+        while self._index and total > self.max_bytes:
+            key, size = self._index.popitem(last=False)
+            total -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _discard(self, key: str) -> None:
+        """删除条目（调用方需持有self._lock）"""
+        self._index.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        读取未过期的缓存响应
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            Optional[Dict]: 缓存的响应（新的副本），不存在或已过期时为None
+        """
+        with self._lock:
+            if key not in self._index:
+                return None
+            path = self._path(key)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self._discard(key)
+                return None
+            if self._clock() - entry.get("created", 0) > self.ttl:
+                self._discard(key)
+                return None
+            self._index.move_to_end(key)
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return entry["response"]
+
+    def put(self, key: str, response: Dict[str, Any]) -> bool:
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            response: Ollama响应
+
+        Returns:
+            bool: 是否写入（未完成、带错误或无法序列化的响应不写入）
+        """
+        if not isinstance(response, dict) or response.get("error") or not response.get("done", True):
+            return False
+        cached = {k: v for k, v in response.items() if k not in NON_CACHED_FIELDS}
+        try:
+            data = json.dumps({"created": self._clock(), "response": cached}, ensure_ascii=False).encode("utf-8")
+        except (TypeError, ValueError):
+            return False
+        if len(data) > self.max_bytes:
+            return False
+
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, self._path(key))
+            except OSError:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                return False
+            self._index[key] = len(data)
+            self._index.move_to_end(key)
+            self._evict()
+        return True
+
+    def get_or_fetch(
+        self,
+        request_body: Dict[str, Any],
+        fetch: Callable[[], Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        返回缓存的响应，或发送请求并缓存响应
+
+        相同请求同时进行时只有第一个调用fetch，其余等待其结果。
+
+        Args:
+            request_body: 聊天请求体
+            fetch: 实际发送请求的函数，返回Ollama响应；抛出的异常原样传给调用方
+
+        Returns:
+            Dict: 响应；来自缓存（或合并到其他请求）时cached为True
+        """
+        key = self.make_key(request_body)
+        cached = self.get(key)
+        with self._lock:
+            if cached is None:
+                waiting = self._in_flight.get(key)
+                if waiting is None:
+                    leader = _InFlight()
+                    self._in_flight[key] = leader
+                    self.misses += 1
+                else:
+                    self.coalesced += 1
+            else:
+                self.hits += 1
+        if cached is not None:
+            cached["cached"] = True
+            return cached
+
+        if waiting is not None:
+            waiting.event.wait()
+            if waiting.response is None:
+                return fetch()
+            response = json.loads(json.dumps(waiting.response))
+            response["cached"] = True
+            return response
+
+        response = None
+        try:
+            response = fetch()
+            self.put(key, response)
+            return response
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            if isinstance(response, dict) and not response.get("error"):
+                leader.response = json.loads(json.dumps(
+                    {k: v for k, v in response.items() if k not in NON_CACHED_FIELDS}, default=str
+                ))
+            leader.event.set()
+
+    def clear(self) -> None:
+        """
+        删除所有缓存条目
+        """
+        with self._lock:
+            for key in list(self._index):
+                self._discard(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+
+        Returns:
+            Dict: {hits, misses, coalesced, hit_rate, entries, bytes, evictions}
+        """
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+                "entries": len(self._index),
+                "bytes": sum(self._index.values()),
+                "evictions": self.evictions
+            }
@@ -0,0 +1,330 @@
+"""
+session_manager.py - 多会话智能体服务模块
+
+在一个进程中同时托管多个操作员的对话：
+1. 每个会话有自己的对话历史和工具集合，提交的消息在后台线程中执行完整的工具循环
+2. 所有会话的模型请求经过同一个FairScheduler：按会话轮询排队，全局并发受后端能力限制
+3. 会话可以提交、轮询和取消；stats()给出各状态的会话数和调度器队列深度
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Union
+
+from ollama_tools import OllamaToolCaller
+from request_scheduler import FairScheduler
+from tool_schema_cache import ToolSchemaSet
+
+
+# 会话状态
+STATUS_IDLE = "idle"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_CANCELLED = "cancelled"
+STATUS_ERROR = "error"
+
+
+class AgentSession:
+    """
+    单个会话
+
+    Attributes:
+        session_id: 会话ID
+        tools: 会话使用的工具集合，为None时按调用器的规则选择
+        messages: 对话历史
+        status: 当前状态（idle/running/completed/cancelled/error）
+        result: 最近一次执行的最终响应
+        turns: 已完成的执行次数
+        created: 创建时间(time.time)
+        updated: 最后更新时间(time.time)
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        system_prompt: Optional[str] = None,
+        tools: Optional[ToolSchemaSet] = None
+    ):
+        self.session_id = session_id
+        self.tools = tools
+        self.messages: List[Dict[str, Any]] = []
+        if system_prompt:
+            self.messages.append({"role": "system", "content": system_prompt})
+        self.status = STATUS_IDLE
+        self.result: Optional[Dict[str, Any]] = None
+        self.turns = 0
+        self.created = time.time()
+        self.updated = self.created
+        self.cancel_event = threading.Event()
+        self.future: Optional[Future] = None
+
+    def to_dict(self, include_messages: bool = False) -> Dict[str, Any]:
+        """
+        转换为字典格式
+
+        Args:
+            include_messages: 是否包含对话历史
+
+        Returns:
+            Dict: 会话状态
+        """
+        data = {
+            "session_id": self.session_id,
+            "status": self.status,
+            "turns": self.turns,
+            "tools": list(self.tools.names) if self.tools is not None else None,
+            "result": self.result,
+            "created": self.created,
+            "updated": self.updated
+        }
+        if include_messages:
+            data["messages"] = list(self.messages)
+        return data
+
+
+class SessionManager:
+    """
+    多会话管理器
+
+    用法:
+        manager = SessionManager(max_concurrent=2)
+        session_id = manager.create_session(system_prompt="你是桌面助手")
+        manager.submit(session_id, "打开记事本")
+        print(manager.poll(session_id)["status"])
+    """
+
+    def __init__(
+        self,
+        caller: Optional[OllamaToolCaller] = None,
+        max_concurrent: int = 1,
+        max_sessions: int = 64,
+        max_iterations: int = 5
+    ):
+        """
+        初始化会话管理器
+
+        Args:
+            caller: 所有会话共享的工具调用器，为None时使用默认配置新建；
+                    调用器未设置调度器时为其设置FairScheduler(max_concurrent)
+            max_concurrent: 全局模型请求并发上限（与后端的OLLAMA_NUM_PARALLEL × 实例数一致）
+            max_sessions: 最多同时存在的会话数（也是执行线程数上限）
+            max_iterations: 每次执行的最大工具循环迭代次数
+        """
+        self.caller = caller or OllamaToolCaller()
+        if self.caller.scheduler is None:
+            self.caller.scheduler = FairScheduler(max_concurrent)
+        self.scheduler = self.caller.scheduler
+        self.max_sessions = max_sessions
+        self.max_iterations = max_iterations
+        self._sessions: Dict[str, AgentSession] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_sessions, thread_name_prefix="agent-session")
+
+    def create_session(
+        self,
+        system_prompt: Optional[str] = None,
+        tools: Optional[Union[List[str], List[Dict[str, Any]], ToolSchemaSet]] = None,
+        session_id: Optional[str] = None
+    ) -> str:
+        """
+        创建会话
+
+        Args:
+            system_prompt: 系统提示词
+            tools: 会话使用的工具（工具名称列表、Ollama工具定义列表或ToolSchemaSet），
+                   为None时按调用器的规则选择（工具检索器或全部工具）
+            session_id: 会话ID，为None时自动生成
+
+        Returns:
+            str: 会话ID
+
+        Raises:
+            ValueError: 会话数已达上限或会话ID已存在
+        """
+        if tools is not None and not isinstance(tools, ToolSchemaSet):
+            tools = list(tools)
+            if all(isinstance(tool, str) for tool in tools):
+                tools = self.caller.schema_cache.for_names(tools)
+            else:
+                tools = self.caller.schema_cache.for_tools(tools)
+        session_id = session_id or uuid.uuid4().hex
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                raise ValueError(f"Session limit reached: {self.max_sessions}")
+            if session_id in self._sessions:
+                raise ValueError(f"Session already exists: {session_id}")
+            self._sessions[session_id] = AgentSession(session_id, system_prompt, tools)
+        return session_id
+
+    def _get(self, session_id: str) -> Optional[AgentSession]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def _run_turn(self, session: AgentSession, messages: List[Dict[str, Any]], max_iterations: int) -> None:
+        """在后台线程中执行一次工具循环"""
+        try:
+            response, history = self.caller.run_tool_loop(
+                messages,
+                session.tools,
+                max_iterations,
+                conversation_id=session.session_id,
+                cancel_event=session.cancel_event
+            )
+        except Exception as e:
+            response, history = {"error": True, "message": f"Session failed: {e}"}, messages
+
+        if response.get("cancelled"):
+            status = STATUS_CANCELLED
+        elif response.get("error"):
+            status = STATUS_ERROR
+        else:
+            status = STATUS_COMPLETED
+        with self._lock:
+            session.messages = history
+            session.result = response
+            session.status = status
+            session.turns += 1
+            session.updated = time.time()
+
+    def submit(self, session_id: str, user_message: str, max_iterations: Optional[int] = None) -> Dict[str, Any]:
+        """
+        向会话提交一条用户消息，在后台执行
+
+        Args:
+            session_id: 会话ID
+            user_message: 用户消息
+            max_iterations: 本次执行的最大迭代次数，为None时使用管理器的设置
+
+        Returns:
+            Dict: {"status": "success", "session_id"} 或 {"status": "error", "message"}
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return {"status": "error", "message": f"Unknown session: {session_id}"}
+            if session.status == STATUS_RUNNING:
+                return {"status": "error", "message": f"Session is busy: {session_id}"}
+            session.cancel_event.clear()
+            session.status = STATUS_RUNNING
+            session.updated = time.time()
+            messages = session.messages + [{"role": "user", "content": user_message}]
+            session.future = self._pool.submit(
+                self._run_turn, session, messages, max_iterations or self.max_iterations
+            )
+        return {"status": "success", "session_id": session_id}
+
+    def poll(self, session_id: str, include_messages: bool = False) -> Dict[str, Any]:
+        """
+        查询会话状态
+
+        Args:
+            session_id: 会话ID
+            include_messages: 是否包含对话历史
+
+        Returns:
+            Dict: 会话状态（status、result等，queued为该会话在调度器中排队的请求数），
+                会话不存在时为{"status": "error", "message"}
+        """
+        queued = self.scheduler.stats()["queued_by_key"]
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return {"status": "error", "message": f"Unknown session: {session_id}"}
+            data = session.to_dict(include_messages)
+        data["queued"] = queued.get(session_id, 0)
+        return data
+
+    def wait(self, session_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        等待会话当前的执行结束
+
+        Args:
+            session_id: 会话ID
+            timeout: 最长等待时间(秒)
+
+        Returns:
+            Dict: 同poll
+        """
+        session = self._get(session_id)
+        if session is not None and session.future is not None:
+            try:
+                session.future.result(timeout)
+            except Exception:
+                pass
+        return self.poll(session_id)
+
+    def cancel(self, session_id: str) -> bool:
+        """
+        取消会话当前的执行
+
+        排队中的模型请求立即取消；正在进行的模型请求或工具调用结束后不再继续。
+
+        Args:
+            session_id: 会话ID
+
+        Returns:
+            bool: 会话正在执行时返回True
+        """
+        session = self._get(session_id)
+        if session is None or session.status != STATUS_RUNNING:
+            return False
+        session.cancel_event.set()
+        self.scheduler.cancel(session_id)
+        return True
+
+    def close_session(self, session_id: str) -> bool:
+        """
+        取消并删除会话
+
+        Args:
+            session_id: 会话ID
+
+        Returns:
+            bool: 会话存在时返回True
+        """
+        self.cancel(session_id)
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        """
+        列出所有会话
+
+        Returns:
+            List[Dict]: 会话状态列表（不含对话历史）
+        """
+        with self._lock:
+            return [session.to_dict() for session in self._sessions.values()]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取服务统计
+
+        Returns:
+            Dict: {sessions, by_status, scheduler}
+        """
+        with self._lock:
+            by_status: Dict[str, int] = {}
+            for session in self._sessions.values():
+                by_status[session.status] = by_status.get(session.status, 0) + 1
+            sessions = len(self._sessions)
+        return {"sessions": sessions, "by_status": by_status, "scheduler": self.scheduler.stats()}
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        取消所有会话并停止执行线程
+
+        Args:
+            wait: 是否等待正在执行的会话结束
+        """
+        with self._lock:
+            session_ids = list(self._sessions)
+        for session_id in session_ids:
+            self.cancel(session_id)
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,296 @@
+"""
+skill_forkserver.py - 预热导入的技能fork服务器
+
+服务器进程启动时预先导入pyautogui、PIL、Xlib并加载技能脚本，之后每个工具调用
+都由服务器fork出一个子进程执行对应动作，结果通过管道返回。这样既保留了
+"每次调用一个独立进程"的隔离性，又省去了解释器启动和冷导入的开销。
+
+仅支持提供os.fork()的平台（Linux/macOS）。
+
+协议与skill_worker.py相同（每行一个JSON对象），请求额外携带脚本路径和超时:
+    请求: {"id": 1, "script": "/path/desktop.py", "action": "click",
+           "params": {...}, "timeout": 60}
+    响应: {"id": 1, "result": {"status": "success", ...}}
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import atexit
+import importlib
+import json
+import os
+import selectors
+import signal
+import sys
+import time
+from typing import Dict, Any, List, Optional
+
+from skill_worker import SkillWorker, load_skill_module
+
+
+FORKSERVER_SCRIPT = os.path.abspath(__file__)
+
+FORK_AVAILABLE = hasattr(os, "fork")
+
+PRELOAD_MODULES = ["pyautogui", "PIL.Image", "Xlib.display"]
+
+
+def _preload_modules(module_names: List[str]) -> None:
+    """
+    预先导入重量级依赖，未安装的模块直接跳过
+
+    Args:
+        module_names: 模块名称列表
+    """
+    for name in module_names:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+
+
+def _reset_after_fork() -> None:
+    """
+    子进程中重建与父进程共享的X连接
+
+    pyautogui在导入时即打开X display连接，多个子进程共用同一socket会破坏
+    X协议流，因此每个子进程都改用自己的连接。
+    """
+    x11 = sys.modules.get("pyautogui._pyautogui_x11")
+    if x11 is None or not hasattr(x11, "_display"):
+        return
+    try:
+        from Xlib.display import Display
+        x11._display = Display(os.environ.get("DISPLAY"))
+    except Exception:
+        pass
+
+
+def _run_child(actions: Dict[str, Any], action: str, params: Dict[str, Any], write_fd: int) -> None:
+    """
+    子进程入口：执行动作并把结果写入管道后立即退出
+
+    Args:
+        actions: 技能的actions表
+        action: 动作名称
+        params: 参数字典
+        write_fd: 结果管道写端
+    """
+    status = 0
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        _reset_after_fork()
+        if action in actions:
+            try:
+                result = actions[action](params)
+            except Exception as e:
+                result = {"status": "error", "action": action, "message": str(e)}
+        else:
+            result = {"status": "error", "message": f"Unknown action: {action}"}
+        data = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        while data:
+            written = os.write(write_fd, data)
+            data = data[written:]
+    except BaseException:
+        status = 1
+    finally:
+        os._exit(status)
+
+
+class _Child:
+    """正在运行的子进程记录"""
+
+    def __init__(self, request_id: Any, pid: int, read_fd: int, timeout: float):
+        self.request_id = request_id
+        self.pid = pid
+        self.read_fd = read_fd
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout
+        self.chunks: List[bytes] = []
+        self.timed_out = False
+
+
+def serve(skill_scripts: List[str]) -> None:
+    """
+    fork服务器主循环
+
+    单线程事件循环同时监听stdin上的请求和各子进程的结果管道，
+    因此多个请求可以并发执行。
+
+    Args:
+        skill_scripts: 启动时预加载的技能脚本路径
+    """
+    protocol_out = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+
+    _preload_modules(PRELOAD_MODULES)
+
+    skills: Dict[str, Dict[str, Any]] = {}
+
+    def get_actions(script_path: str) -> Dict[str, Any]:
+        key = os.path.abspath(script_path)
+        if key not in skills:
+            skills[key] = load_skill_module(key).actions
+        return skills[key]
+
+    for script_path in skill_scripts:
+        try:
+            get_actions(script_path)
+        except Exception:
+            pass
+
+    def respond(request_id: Any, result: Dict[str, Any]) -> None:
+        protocol_out.write(json.dumps({"id": request_id, "result": result}, ensure_ascii=False) + "\n")
+        protocol_out.flush()
+
+    selector = selectors.DefaultSelector()
+    stdin_fd = sys.stdin.fileno()
+    selector.register(stdin_fd, selectors.EVENT_READ, None)
+    children: Dict[int, _Child] = {}
+    stdin_buffer = b""
+    stdin_open = True
+
+    def start_child(request: Dict[str, Any]) -> None:
+        request_id = request.get("id")
+        try:
+            actions = get_actions(request.get("script", ""))
+        except Exception as e:
+            respond(request_id, {"status": "error", "message": f"Failed to load skill: {e}"})
+            return
+
+        timeout = float(request.get("timeout") or 60)
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            _run_child(actions, request.get("action", ""), request.get("params") or {}, write_fd)
+        os.close(write_fd)
+        child = _Child(request_id, pid, read_fd, timeout)
+        children[read_fd] = child
+        selector.register(read_fd, selectors.EVENT_READ, child)
+
+    def finish_child(child: _Child) -> None:
+        selector.unregister(child.read_fd)
+        os.close(child.read_fd)
+        del children[child.read_fd]
+        _, status = os.waitpid(child.pid, 0)
+
+        if child.timed_out:
+            respond(child.request_id, {"status": "error", "message": f"Execution timeout ({child.timeout:g}s)"})
+            return
+        try:
+            result = json.loads(b"".join(child.chunks).decode("utf-8"))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            result = {"status": "error", "message": f"Child exited with status {status}"}
+        respond(child.request_id, result)
+
+    while stdin_open or children:
+        now = time.monotonic()
+        deadlines = [child.deadline for child in children.values() if not child.timed_out]
+        wait = max(0.0, min(deadlines) - now) if deadlines else None
+
+        for key, _ in selector.select(timeout=wait):
+            if key.data is None:
+                data = os.read(stdin_fd, 65536)
+                if not data:
+                    selector.unregister(stdin_fd)
+                    stdin_open = False
+                    continue
+                stdin_buffer += data
+                while b"\n" in stdin_buffer:
+                    line, stdin_buffer = stdin_buffer.split(b"\n", 1)
+                    if not line.strip():
+                        continue
+                    try:
+                        request = json.loads(line.decode("utf-8"))
+                    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                        respond(None, {"status": "error", "message": f"JSON parse error: {e}"})
+                        continue
+                    start_child(request)
+            else:
+                child = key.data
+                data = os.read(child.read_fd, 65536)
+                if data:
+                    child.chunks.append(data)
+                else:
+                    finish_child(child)
+
+        now = time.monotonic()
+        for child in list(children.values()):
+            if not child.timed_out and child.deadline <= now:
+                child.timed_out = True
+                try:
+                    os.kill(child.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+
+class SkillForkServer:
+    """
+    fork服务器客户端
+
+    懒启动服务器进程；服务器崩溃后由SkillWorker在下一次调用时自动重启。
+    """
+
+    def __init__(self, skill_scripts: Optional[List[str]] = None, python: str = "python"):
+        """
+        初始化fork服务器客户端
+
+        Args:
+            skill_scripts: 启动时预加载的技能脚本路径
+            python: 启动服务器使用的Python解释器
+        """
+        scripts = [os.path.abspath(path) for path in (skill_scripts or [])]
+        self._worker = SkillWorker([python, FORKSERVER_SCRIPT] + scripts, name="skill-forkserver")
+        atexit.register(self.shutdown)
+
+    @property
+    def restarts(self) -> int:
+        """服务器重启次数"""
+        return self._worker.restarts
+
+    def call(
+        self,
+        script_path: str,
+        action: str,
+        params: Dict[str, Any],
+        timeout: float = 60
+    ) -> Dict[str, Any]:
+        """
+        在fork出的子进程中执行技能动作
+
+        Args:
+            script_path: 技能脚本路径
+            action: 动作名称
+            params: 参数字典
+            timeout: 超时时间(秒)，超时由服务器终止子进程
+
+        Returns:
+            Dict: 执行结果
+
+        Raises:
+            SkillWorkerUnavailable: 服务器无法启动或无法接收请求
+            SkillWorkerError: 服务器在执行中退出
+        """
+        request = {
+            "script": os.path.abspath(script_path),
+            "action": action,
+            "params": params,
+            "timeout": timeout
+        }
+        return self._worker.call(request, timeout=timeout + 5)
+
+    def shutdown(self) -> None:
+        """关闭服务器进程（并取消退出时的自动关闭，不再持有本实例）"""
+        atexit.unregister(self.shutdown)
+        self._worker.stop()
+
+
+if __name__ == "__main__":
+    if not FORK_AVAILABLE:
+        print(json.dumps({"status": "error", "message": "os.fork() is not available on this platform"}))
+        sys.exit(1)
+    serve(sys.argv[1:])
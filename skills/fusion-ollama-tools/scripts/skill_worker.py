@@ -0,0 +1,365 @@
+"""
+skill_worker.py - 常驻技能工作进程模块
+
+为每个技能脚本维护一个长期运行的Python进程，脚本的actions表只加载一次，
+之后通过stdin/stdout上的行分隔JSON处理请求，避免每次工具调用都重新启动
+解释器并导入pyautogui/PIL。
+
+协议（每行一个JSON对象）:
+    请求: {"id": 1, "action": "click", "params": {"x": 100, "y": 200}}
+    响应: {"id": 1, "result": {"status": "success", ...}}
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import atexit
+import importlib.util
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+
+WORKER_SCRIPT = os.path.abspath(__file__)
+
+
+class SkillWorkerError(Exception):
+    """工作进程不可用（启动失败或执行中崩溃）"""
+
+
+class SkillWorkerTimeout(SkillWorkerError):
+    """工作进程在超时时间内未返回结果"""
+
+
+class SkillWorkerUnavailable(SkillWorkerError):
+    """工作进程没有收到请求（启动失败或无法写入），动作尚未执行"""
+
+
+def load_skill_module(script_path: str):
+    """
+    以模块方式加载技能脚本
+
+    脚本的 ``if __name__ == '__main__'`` 分支不会执行，只暴露其函数和actions表。
+
+    Args:
+        script_path: 技能脚本路径
+
+    Returns:
+        module: 已加载的模块对象
+    """
+    full_path = os.path.abspath(script_path)
+    skill_name = os.path.splitext(os.path.basename(full_path))[0]
+    module_name = f"fusion_skill_{skill_name}"
+    spec = importlib.util.spec_from_file_location(module_name, full_path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Cannot load skill script: {full_path}")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def serve(script_path: str) -> None:
+    """
+    工作进程主循环
+
+    加载技能脚本后逐行读取请求并写回响应。动作执行期间产生的任何输出
+    都被重定向到stderr，保证stdout上只有协议数据。
+
+    Args:
+        script_path: 技能脚本路径
+    """
+    protocol_out = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+
+    try:
+        actions = load_skill_module(script_path).actions
+    except Exception as e:
+        actions = {}
+        load_error = f"Failed to load skill: {e}"
+    else:
+        load_error = None
+
+    stdin = open(sys.stdin.fileno(), "r", encoding="utf-8", closefd=False)
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            response = {"id": None, "result": {"status": "error", "message": f"JSON parse error: {e}"}}
+        else:
+            action = request.get("action", "")
+            params = request.get("params") or {}
+            if load_error:
+                result = {"status": "error", "message": load_error}
+            elif action in actions:
+                try:
+                    result = actions[action](params)
+                except Exception as e:
+                    result = {"status": "error", "action": action, "message": str(e)}
+            else:
+                result = {"status": "error", "message": f"Unknown action: {action}"}
+            response = {"id": request.get("id"), "result": result}
+
+        protocol_out.write(json.dumps(response, ensure_ascii=False) + "\n")
+        protocol_out.flush()
+
+
+class SkillWorker:
+    """
+    单个常驻工作进程的客户端
+
+    请求带有递增id，由后台读线程按id分发响应。工作进程一次只执行一个请求，
+    客户端也逐个发送（从写入请求到收到结果），因此超时只计算动作本身的执行时间，
+    在其他请求之后排队的调用不会因排队而超时。可以安全地被多个线程共享。
+    进程退出后，下一次调用会自动重启。
+    """
+
+    def __init__(self, command: List[str], name: str = ""):
+        """
+        初始化工作进程客户端
+
+        Args:
+            command: 启动工作进程的命令行
+            name: 工作进程名称（用于错误信息）
+        """
+        self.command = command
+        self.name = name or " ".join(command)
+        self.restarts = 0
+        self._process: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+        self._call_lock = threading.Lock()
+        self._pending: Dict[int, Tuple[subprocess.Popen, queue.Queue]] = {}
+        self._next_id = 0
+        self._started_once = False
+
+    def is_alive(self) -> bool:
+        """工作进程是否在运行"""
+        return self._process is not None and self._process.poll() is None
+
+    def _start(self) -> subprocess.Popen:
+        """启动工作进程并创建读线程（调用方需持有self._lock）"""
+        try:
+            process = subprocess.Popen(
+                self.command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                encoding="utf-8",
+                bufsize=1
+            )
+        except OSError as e:
+            raise SkillWorkerUnavailable(f"Failed to start worker {self.name}: {e}")
+
+        if self._started_once:
+            self.restarts += 1
+        self._started_once = True
+        self._process = process
+
+        reader = threading.Thread(
+            target=self._read_loop,
+            args=(process,),
+            name=f"skill-worker-reader:{self.name}",
+            daemon=True
+        )
+        reader.start()
+        return process
+
+    def _read_loop(self, process: subprocess.Popen) -> None:
+        """读取响应并分发给等待中的调用方；进程退出时唤醒所有等待者"""
+        for line in process.stdout:
+            try:
+                response = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            with self._lock:
+                pending = self._pending.pop(response.get("id"), None)
+            if pending is not None:
+                pending[1].put(response)
+
+        with self._lock:
+            if self._process is process:
+                self._process = None
+            stranded = [
+                request_id for request_id, (owner, _) in self._pending.items()
+                if owner is process
+            ]
+            waiters = [self._pending.pop(request_id)[1] for request_id in stranded]
+        for waiter in waiters:
+            waiter.put(None)
+
+    def call(
+        self,
+        request: Dict[str, Any],
+        timeout: float = 60
+    ) -> Dict[str, Any]:
+        """
+        发送请求并等待结果
+
+        Args:
+            request: 请求内容（不含id）
+            timeout: 执行超时时间(秒)，从请求写入工作进程开始计算，不包括等待其他请求的时间
+
+        Returns:
+            Dict: 动作执行结果
+
+        Raises:
+            SkillWorkerUnavailable: 工作进程无法启动或无法接收请求（动作没有执行）
+            SkillWorkerError: 工作进程在执行中退出（动作可能已部分执行）
+            SkillWorkerTimeout: 等待结果超时（此时工作进程会被终止）
+        """
+        waiter: queue.Queue = queue.Queue(maxsize=1)
+
+        with self._call_lock:
+            with self._lock:
+                process = self._process if self.is_alive() else self._start()
+                self._next_id += 1
+                request_id = self._next_id
+                self._pending[request_id] = (process, waiter)
+
+            line = json.dumps(dict(request, id=request_id), ensure_ascii=False) + "\n"
+            try:
+                process.stdin.write(line)
+                process.stdin.flush()
+            except (OSError, ValueError) as e:
+                with self._lock:
+                    self._pending.pop(request_id, None)
+                self._kill(process)
+                raise SkillWorkerUnavailable(f"Worker {self.name} is not accepting requests: {e}")
+
+            try:
+                response = waiter.get(timeout=timeout)
+            except queue.Empty:
+                with self._lock:
+                    self._pending.pop(request_id, None)
+                self._kill(process)
+                raise SkillWorkerTimeout(f"Execution timeout ({timeout}s)")
+
+        if response is None:
+            raise SkillWorkerError(f"Worker {self.name} exited during execution")
+        return response.get("result", {})
+
+    def _kill(self, process: subprocess.Popen) -> None:
+        """终止指定的工作进程"""
+        with self._lock:
+            if self._process is process:
+                self._process = None
+        try:
+            process.kill()
+            process.wait(timeout=5)
+        except Exception:
+            pass
+
+    def stop(self) -> None:
+        """关闭工作进程"""
+        with self._lock:
+            process = self._process
+            self._process = None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+            process.wait(timeout=2)
+        except Exception:
+            self._kill(process)
+
+
+class SkillWorkerPool:
+    """
+    技能工作进程池
+
+    每个技能脚本对应一个常驻工作进程，按需懒启动。
+    """
+
+    def __init__(self, python: str = "python"):
+        """
+        初始化工作进程池
+
+        Args:
+            python: 启动工作进程使用的Python解释器
+        """
+        self.python = python
+        self._workers: Dict[str, SkillWorker] = {}
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    def get_worker(self, script_path: str) -> SkillWorker:
+        """
+        获取（必要时创建）技能脚本对应的工作进程
+
+        Args:
+            script_path: 技能脚本路径
+
+        Returns:
+            SkillWorker: 工作进程客户端
+        """
+        key = os.path.abspath(script_path)
+        with self._lock:
+            worker = self._workers.get(key)
+            if worker is None:
+                worker = SkillWorker(
+                    [self.python, WORKER_SCRIPT, key],
+                    name=os.path.basename(key)
+                )
+                self._workers[key] = worker
+            return worker
+
+    def call(
+        self,
+        script_path: str,
+        action: str,
+        params: Dict[str, Any],
+        timeout: float = 60
+    ) -> Dict[str, Any]:
+        """
+        在技能脚本的工作进程中执行动作
+
+        Args:
+            script_path: 技能脚本路径
+            action: 动作名称
+            params: 参数字典
+            timeout: 执行超时时间(秒)，不包括在同一工作进程前面的请求之后排队的时间
+
+        Returns:
+            Dict: 执行结果
+        """
+        worker = self.get_worker(script_path)
+        return worker.call({"action": action, "params": params}, timeout=timeout)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        获取各工作进程状态
+
+        Returns:
+            Dict: {脚本路径: {alive, restarts}}
+        """
+        with self._lock:
+            workers = dict(self._workers)
+        return {
+            path: {"alive": worker.is_alive(), "restarts": worker.restarts}
+            for path, worker in workers.items()
+        }
+
+    def shutdown(self) -> None:
+        """关闭所有工作进程（并取消退出时的自动关闭，不再持有本实例）"""
+        atexit.unregister(self.shutdown)
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(json.dumps({"status": "error", "message": "Usage: python skill_worker.py <skill_script>"}))
+        sys.exit(1)
+    serve(sys.argv[1])
@@ -11,6 +11,9 @@ test_ollama_tools.py - Ollama工具调用测试脚本
 import sys
 import os
 import json
+import asyncio
+import tempfile
+import time
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
@@ -23,9 +26,11 @@ from tool_definitions import (
 )
 from tool_executor import (
     ToolExecutor,
+    AsyncToolExecutor,
     MockToolExecutor,
     ExecutionResult,
-    create_tool_registry
+    create_tool_registry,
+    plan_tool_batches
 )
 
 
@@ -198,6 +203,1772 @@ def test_tool_call_simulation():
     return True
 
 
+def test_worker_execution_mode():
+    """
+    测试常驻工作进程执行模式
+    """
+    print("\n" + "=" * 60)
+    print("测试5: 常驻工作进程执行模式")
+    print("=" * 60)
+    
+    skill_source = (
+        "import os\n"
+        "def pid(params):\n"
+        "    print('stray output')\n"
+        "    return {'status': 'success', 'pid': os.getpid(), 'params': params}\n"
+        "def crash(params):\n"
+        "    os._exit(3)\n"
+        "def slow(params):\n"
+        "    import time\n"
+        "    time.sleep(0.5)\n"
+        "    return {'status': 'success', 'pid': os.getpid()}\n"
+        "actions = {'pid': pid, 'crash': crash, 'slow': slow}\n"
+    )
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        skill_path = os.path.join(tmp_dir, "echo_skill.py")
+        with open(skill_path, "w", encoding="utf-8") as f:
+            f.write(skill_source)
+        
+        executor = ToolExecutor(execution_mode="worker")
+        try:
+            first = executor.execute_tool("echo_pid", {"n": 1}, skill_path, "pid")
+            second = executor.execute_tool("echo_pid", {"n": 2}, skill_path, "pid")
+            print(f"  第一次: pid={first.result.get('pid')}, 耗时{first.duration:.4f}秒")
+            print(f"  第二次: pid={second.result.get('pid')}, 耗时{second.duration:.4f}秒")
+            assert first.success and second.success
+            assert first.result["pid"] == second.result["pid"]
+            assert second.result["params"] == {"n": 2}
+            
+            crashed = executor.execute_tool("echo_crash", {}, skill_path, "crash")
+            print(f"  执行中崩溃: success={crashed.success}, error={crashed.error}")
+            # 工作进程已收到请求：不回退到spawn再执行一次
+            assert not crashed.success and "exited during execution" in crashed.error
+            
+            third = executor.execute_tool("echo_pid", {}, skill_path, "pid")
+            print(f"  重启后: pid={third.result.get('pid')}")
+            assert third.success and third.result["pid"] != first.result["pid"]
+            
+            unknown = executor.execute_tool("echo_missing", {}, skill_path, "missing")
+            assert unknown.error == "Unknown action: missing"
+        finally:
+            executor.close()
+        
+        # 同一工作进程一次执行一个请求：排队等待的时间不计入每次调用的超时
+        from skill_worker import SkillWorkerPool
+        from concurrent.futures import ThreadPoolExecutor as Threads
+        pool = SkillWorkerPool()
+        try:
+            with Threads(max_workers=3) as threads:
+                results = list(threads.map(lambda _: pool.call(skill_path, "slow", {}, timeout=1.0), range(3)))
+            print(f"  排队的慢调用: {[r['status'] for r in results]}")
+            assert all(r["status"] == "success" for r in results)
+            assert len({r["pid"] for r in results}) == 1
+        finally:
+            pool.shutdown()
+    
+    # 并发调用只创建一个工作进程池；关闭后atexit不再持有它
+    import gc
+    import weakref
+    from concurrent.futures import ThreadPoolExecutor as Threads
+    executor = ToolExecutor(execution_mode="worker")
+    with Threads(max_workers=8) as threads:
+        pools = list(threads.map(lambda _: executor._get_worker_pool(), range(32)))
+    assert all(pool is pools[0] for pool in pools)
+    pool_ref = weakref.ref(pools[0])
+    executor.close()
+    del pools
+    gc.collect()
+    assert pool_ref() is None
+    
+    return True
+
+
+def test_inprocess_execution_mode():
+    """
+    测试进程内执行模式
+    """
+    print("\n" + "=" * 60)
+    print("测试6: 进程内执行模式")
+    print("=" * 60)
+    
+    from skill_worker import load_skill_module
+    
+    repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+    desktop_path = os.path.join(repo_root, "skills/fusion-desktop/scripts/desktop.py")
+    
+    preloaded = "pyautogui" in sys.modules
+    desktop = load_skill_module(desktop_path)
+    print(f"  desktop动作数量: {len(desktop.actions)}")
+    assert "click" in desktop.actions
+    if not preloaded:
+        assert "pyautogui" not in sys.modules
+        print("  ✓ 加载脚本时未导入pyautogui")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        skill_path = os.path.join(tmp_dir, "echo_skill.py")
+        with open(skill_path, "w", encoding="utf-8") as f:
+            f.write(
+                "import os\n"
+                "def pid(params):\n"
+                "    params['seen'] = True\n"
+                "    return {'status': 'success', 'pid': os.getpid()}\n"
+                "actions = {'pid': pid}\n"
+            )
+        
+        executor = ToolExecutor(execution_mode="inprocess")
+        arguments = {"n": 1}
+        result = executor.execute_tool("echo_pid", arguments, skill_path, "pid")
+        print(f"  结果: pid={result.result.get('pid')}, 耗时{result.duration * 1e6:.1f}微秒")
+        assert result.success
+        assert result.result["pid"] == os.getpid()
+        assert arguments == {"n": 1}
+        
+        unknown = executor.execute_tool("echo_missing", {}, skill_path, "missing")
+        assert unknown.error == "Unknown action: missing"
+    
+    return True
+
+
+def test_concurrent_tool_calls():
+    """
+    测试同一轮中只读工具调用的并行执行
+    """
+    print("\n" + "=" * 60)
+    print("测试7: 工具调用并行调度")
+    print("=" * 60)
+    
+    class SlowMockExecutor(MockToolExecutor):
+        def __init__(self):
+            super().__init__(max_parallel=4)
+            self.order = []
+        
+        def execute_tool(self, tool_name, arguments, skill_path, skill_action):
+            time.sleep(0.2)
+            self.order.append(tool_name)
+            return super().execute_tool(tool_name, arguments, skill_path, skill_action)
+    
+    registry = create_tool_registry()
+    tool_calls = [
+        {"function": {"name": "window_list", "arguments": {}}},
+        {"function": {"name": "clipboard_get", "arguments": {}}},
+        {"function": {"name": "screen_get_size", "arguments": {}}},
+        {"function": {"name": "desktop_click", "arguments": {"x": 1, "y": 2}}},
+        {"function": {"name": "desktop_type", "arguments": {"text": "hi"}}},
+        {"function": {"name": "desktop_position", "arguments": {}}},
+        {"function": {"name": "no_such_tool", "arguments": {}}},
+    ]
+    
+    batches = plan_tool_batches(tool_calls, registry)
+    print(f"  批次划分: {batches}")
+    assert batches == [[0, 1, 2], [3], [4], [5], [6]]
+    
+    executor = SlowMockExecutor()
+    try:
+        start = time.time()
+        results = executor.execute_tool_calls(tool_calls[:3], registry)
+        elapsed = time.time() - start
+        print(f"  3个只读调用耗时: {elapsed:.2f}秒")
+        assert elapsed < 0.5
+        assert [r.tool_name for r in results] == ["window_list", "clipboard_get", "screen_get_size"]
+        
+        executor.order.clear()
+        results = executor.execute_tool_calls(tool_calls, registry)
+        assert [r.tool_name for r in results] == [tc["function"]["name"] for tc in tool_calls]
+        assert executor.order[3:] == ["desktop_click", "desktop_type", "desktop_position"]
+        assert results[-1].error == "Unknown tool: no_such_tool"
+    finally:
+        executor.close()
+    
+    return True
+
+
+def test_async_tool_executor():
+    """
+    测试异步工具执行器与取消
+    """
+    print("\n" + "=" * 60)
+    print("测试8: 异步工具执行器")
+    print("=" * 60)
+    
+    skill_source = (
+        "import json, sys, time\n"
+        "params = json.loads(sys.argv[2])\n"
+        "time.sleep(params.get('sleep', 0))\n"
+        "print(json.dumps({'status': 'success', 'action': sys.argv[1]}))\n"
+    )
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        skill_path = os.path.join(tmp_dir, "sleepy_skill.py")
+        with open(skill_path, "w", encoding="utf-8") as f:
+            f.write(skill_source)
+        
+        registry = {
+            name: {"skill_path": skill_path, "skill_action": name, "read_only": True}
+            for name in ("read_a", "read_b", "read_c")
+        }
+        tool_calls = [
+            {"function": {"name": name, "arguments": {"sleep": 0.5}}}
+            for name in registry
+        ]
+        executor = AsyncToolExecutor()
+        
+        async def run_batch():
+            start = time.time()
+            results = await executor.execute_tool_calls(tool_calls, registry)
+            return results, time.time() - start
+        
+        results, elapsed = asyncio.run(run_batch())
+        print(f"  3个并发调用耗时: {elapsed:.2f}秒")
+        assert [r.tool_name for r in results] == ["read_a", "read_b", "read_c"]
+        assert all(r.success for r in results)
+        assert elapsed < 1.4
+        
+        async def run_cancelled():
+            task = asyncio.ensure_future(
+                executor.execute_tool("slow", {"sleep": 30}, skill_path, "slow")
+            )
+            await asyncio.sleep(0.3)
+            task.cancel()
+            start = time.time()
+            try:
+                await task
+            except asyncio.CancelledError:
+                return time.time() - start
+            return None
+        
+        cancel_time = asyncio.run(run_cancelled())
+        print(f"  取消耗时: {cancel_time:.3f}秒")
+        assert cancel_time is not None and cancel_time < 2
+    
+    return True
+
+
+def test_forkserver_execution_mode():
+    """
+    测试fork服务器执行模式
+    """
+    print("\n" + "=" * 60)
+    print("测试9: fork服务器执行模式")
+    print("=" * 60)
+    
+    from skill_forkserver import FORK_AVAILABLE
+    if not FORK_AVAILABLE:
+        print("  - 当前平台不支持fork，跳过")
+        return True
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        skill_path = os.path.join(tmp_dir, "fork_skill.py")
+        with open(skill_path, "w", encoding="utf-8") as f:
+            f.write(
+                "import os, time\n"
+                "def pid(params):\n"
+                "    time.sleep(params.get('sleep', 0))\n"
+                "    return {'status': 'success', 'pid': os.getpid(), 'ppid': os.getppid()}\n"
+                "actions = {'pid': pid}\n"
+            )
+        
+        executor = ToolExecutor(execution_mode="forkserver")
+        try:
+            first = executor.execute_tool("fork_pid", {}, skill_path, "pid")
+            second = executor.execute_tool("fork_pid", {}, skill_path, "pid")
+            print(f"  子进程: {first.result.get('pid')}, {second.result.get('pid')}")
+            print(f"  第二次耗时: {second.duration * 1000:.2f}毫秒")
+            assert first.success and second.success
+            assert first.result["pid"] != second.result["pid"]
+            assert first.result["ppid"] == second.result["ppid"] != os.getpid()
+            
+            timed_out = executor._forkserver.call(skill_path, "pid", {"sleep": 10}, timeout=0.3)
+            print(f"  超时结果: {timed_out}")
+            assert timed_out["message"] == "Execution timeout (0.3s)"
+            
+            # 超时不回退到spawn（否则动作会再执行一次）
+            from skill_worker import SkillWorkerTimeout
+            def stalled(*args, **kwargs):
+                raise SkillWorkerTimeout("Execution timeout (65s)")
+            spawned = []
+            executor._forkserver.call = stalled
+            executor._spawn_python_skill = lambda *args: spawned.append(args) or {"status": "success"}
+            result = executor._execute_python_skill(skill_path, "pid", {})
+            assert result == {"status": "error", "message": "Execution timeout (60s)"} and spawned == []
+        finally:
+            executor.close()
+    
+    return True
+
+
+def test_tool_result_cache():
+    """
+    测试只读工具结果缓存
+    """
+    print("\n" + "=" * 60)
+    print("测试10: 只读工具结果缓存")
+    print("=" * 60)
+    
+    from tool_cache import ToolResultCache
+    
+    now = [0.0]
+    
+    class CountingExecutor(ToolExecutor):
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.calls = []
+        
+        def _execute_tool_uncached(self, tool_name, arguments, skill_path, skill_action):
+            self.calls.append(tool_name)
+            time.sleep(0.1)
+            return ExecutionResult(True, tool_name, {"status": "success", "n": len(self.calls)})
+    
+    cache = ToolResultCache(clock=lambda: now[0])
+    executor = CountingExecutor(result_cache=cache)
+    registry = create_tool_registry()
+    
+    def call(name, **arguments):
+        info = registry[name]
+        return executor.execute_tool(name, arguments, info["skill_path"], info["skill_action"])
+    
+    first = call("window_list")
+    second = call("window_list")
+    assert not first.cached and second.cached
+    assert executor.calls == ["window_list"]
+    
+    call("window_find", title="a")
+    call("window_find", title="b")
+    assert executor.calls.count("window_find") == 2
+    
+    now[0] += 5
+    assert not call("window_list").cached
+    
+    call("desktop_click", x=1, y=2)
+    assert not call("window_list").cached
+    
+    now[0] += 5
+    tool_calls = [{"function": {"name": "clipboard_get", "arguments": {}}}] * 3
+    executor.calls.clear()
+    results = executor.execute_tool_calls(tool_calls, registry)
+    executor.close()
+    print(f"  3个并发相同调用实际执行: {len(executor.calls)}次")
+    assert executor.calls == ["clipboard_get"]
+    assert sum(r.cached for r in results) == 2
+    
+    stats = cache.stats()
+    print(f"  统计: 命中{stats['hits']}, 未命中{stats['misses']}, 合并{stats['coalesced']}, 失效{stats['invalidations']}")
+    assert stats["per_tool"]["window_list"]["hits"] == 1
+    assert stats["coalesced"] == 2
+    assert stats["invalidations"] == 1
+    
+    return True
+
+
+def test_desktop_batch():
+    """
+    测试desktop_batch批量操作
+    """
+    print("\n" + "=" * 60)
+    print("测试11: 批量桌面操作")
+    print("=" * 60)
+    
+    from skill_worker import load_skill_module
+    
+    tool = get_tool_by_name("desktop_batch")
+    assert tool is not None and not tool.read_only
+    print(f"  工具参数: {[p.name for p in tool.parameters]}")
+    
+    class FakeGui:
+        PAUSE = 0.1
+        
+        def __init__(self):
+            self.events = []
+        
+        def click(self, *args, **kwargs):
+            self.events.append(("click", args))
+        
+        def press(self, key):
+            self.events.append(("press", key))
+        
+        def typewrite(self, text, interval=0):
+            self.events.append(("type", text))
+    
+    repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+    desktop = load_skill_module(os.path.join(repo_root, "skills/fusion-desktop/scripts/desktop.py"))
+    fake = FakeGui()
+    desktop.pyautogui = fake
+    
+    result = desktop.actions["batch"]({
+        "steps": [
+            {"action": "click", "params": {"x": 10, "y": 20}},
+            {"action": "type", "params": {"text": "hello"}},
+            {"action": "key", "params": {"key": "tab"}},
+        ]
+    })
+    print(f"  状态: {result['status']}, 完成{result['completed']}/{result['total_steps']}步, 耗时{result['duration']}秒")
+    assert result["status"] == "success"
+    assert [e[0] for e in fake.events] == ["click", "type", "press"]
+    assert all("duration" in step for step in result["steps"])
+    
+    fake.events.clear()
+    result = desktop.actions["batch"]({
+        "steps": [
+            {"action": "key", "params": {"key": "a"}},
+            {"action": "explode"},
+            {"action": "key", "params": {"key": "b"}},
+        ]
+    })
+    print(f"  出错停止: {result['message']}")
+    assert result["status"] == "error"
+    assert result["failed_steps"] == [1] and result["completed"] == 2
+    assert fake.events == [("press", "a")]
+    assert result["steps"][1]["result"]["message"] == "Unknown action: explode"
+    
+    # 每一步的返回值原样放在result中；不允许嵌套batch
+    result = desktop.actions["batch"]({
+        "steps": [
+            {"action": "key", "params": {"key": "a", "settle_timeout": 0}},
+            {"action": "batch", "params": {"steps": []}},
+        ]
+    })
+    print(f"  嵌套batch: {result['message']}")
+    assert result["steps"][0]["result"] == {"status": "success", "action": "key", "key": "a", "settle_time": 0.0}
+    assert result["steps"][0]["step"] == 0 and "duration" in result["steps"][0]
+    assert result["message"] == "Step 1 (batch) failed: Nested batch steps are not allowed"
+    
+    return True
+
+
+def test_input_settle_detection():
+    """
+    测试输入稳定检测替代固定等待
+    """
+    print("\n" + "=" * 60)
+    print("测试12: 输入稳定检测")
+    print("=" * 60)
+    
+    from types import SimpleNamespace
+    from skill_worker import load_skill_module
+    
+    repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+    desktop = load_skill_module(os.path.join(repo_root, "skills/fusion-desktop/scripts/desktop.py"))
+    
+    class FakeGui:
+        PAUSE = 0
+        
+        def __init__(self):
+            self.moves = []
+        
+        def size(self):
+            return (1920, 1080)
+        
+        def moveTo(self, x, y, duration=0):
+            self.moves.append(((x, y), duration))
+        
+        def click(self, *args, **kwargs):
+            pass
+        
+        def mouseDown(self, button="left"):
+            pass
+        
+        def mouseUp(self, button="left"):
+            pass
+        
+        def locateOnScreen(self, image, confidence=0.9):
+            return (90, 40, 20, 20)
+        
+        def center(self, box):
+            return SimpleNamespace(x=box[0] + box[2] // 2, y=box[1] + box[3] // 2)
+        
+        def press(self, key):
+            pass
+        
+        def hotkey(self, *keys):
+            pass
+    
+    class FakeFrame:
+        def __init__(self, value):
+            self.value = value
+        
+        def convert(self, mode):
+            return self
+        
+        def reduce(self, factor):
+            return self
+        
+        def tobytes(self):
+            return bytes([self.value]) * 64
+    
+    class AnimatingGrab:
+        def __init__(self, changes):
+            self.changes = changes
+            self.grabs = []
+        
+        def grab(self, bbox=None):
+            self.grabs.append(bbox)
+            value = len(self.grabs) * 40 if len(self.grabs) <= self.changes else 255
+            return FakeFrame(value % 256)
+    
+    desktop.pyautogui = FakeGui()
+    
+    desktop.ImageGrab = AnimatingGrab(changes=0)
+    result = desktop.actions["move"]({"x": 100, "y": 50})
+    print(f"  静止画面: settle_time={result['settle_time']}秒")
+    assert result["status"] == "success"
+    assert result["settle_time"] < 0.5
+    assert desktop.ImageGrab.grabs[0] == (0, 0, 260, 210)
+    
+    desktop.ImageGrab = AnimatingGrab(changes=5)
+    result = desktop.actions["move"]({"x": 100, "y": 50})
+    print(f"  动画5帧: settle_time={result['settle_time']}秒, 截取{len(desktop.ImageGrab.grabs)}次")
+    assert len(desktop.ImageGrab.grabs) >= 7
+    
+    desktop.ImageGrab = AnimatingGrab(changes=10 ** 6)
+    result = desktop.actions["move"]({"x": 100, "y": 50, "settle_timeout": 0.2})
+    print(f"  持续变化: settle_time={result['settle_time']}秒（上限0.2秒）")
+    assert 0.2 <= result["settle_time"] < 0.4
+    
+    result = desktop.actions["move"]({"x": 100, "y": 50, "settle_timeout": 0})
+    assert result["settle_time"] == 0.0
+    
+    # 不再有全局的输入后暂停，所有注入输入的动作都等待画面稳定
+    for action, params in [("double_click", {"x": 100, "y": 50}), ("right_click", {"x": 100, "y": 50}),
+                           ("locate_and_click", {"image": "button.png"}), ("key", {"key": "enter"}),
+                           ("hotkey", {"keys": ["ctrl", "c"]})]:
+        desktop.ImageGrab = AnimatingGrab(changes=3)
+        result = desktop.actions[action](params)
+        assert result["status"] == "success" and "settle_time" in result, action
+        assert len(desktop.ImageGrab.grabs) >= 5, action
+    assert desktop.ImageGrab.grabs[0] is None
+    
+    # 拖拽时按住按键平滑移动，而不是瞬移到终点
+    desktop.pyautogui.moves.clear()
+    desktop.actions["drag"]({"start": [10, 10], "end": [200, 200], "settle_timeout": 0})
+    assert desktop.pyautogui.moves[-1] == ((200, 200), desktop.DRAG_DURATION) and desktop.DRAG_DURATION > 0
+    
+    return True
+
+
+def test_stream_accumulator():
+    """
+    测试流式响应分块的累积
+    """
+    print("\n" + "=" * 60)
+    print("测试13: 流式响应累积")
+    print("=" * 60)
+    
+    from ollama_tools import ChatStreamAccumulator
+    
+    chunks = [
+        {"model": "qwen3:latest", "message": {"role": "assistant", "content": "好的，"}, "done": False},
+        {"model": "qwen3:latest", "message": {"role": "assistant", "content": "正在截图"}, "done": False},
+        {"model": "qwen3:latest", "message": {
+            "role": "assistant", "content": "",
+            "tool_calls": [{"function": {"name": "desktop_screenshot", "arguments": {"path": "/tmp/a.png"}}}]
+        }, "done": False},
+        {"model": "qwen3:latest", "message": {"role": "assistant", "content": ""}, "done": True,
+         "done_reason": "stop", "total_duration": 900, "load_duration": 10,
+         "prompt_eval_count": 120, "prompt_eval_duration": 300, "eval_count": 15, "eval_duration": 500},
+    ]
+    
+    accumulator = ChatStreamAccumulator()
+    deltas = [accumulator.add(chunk) for chunk in chunks]
+    response = accumulator.response()
+    
+    print(f"  内容: {response['message']['content']}")
+    print(f"  工具调用: {len(response['message']['tool_calls'])}个")
+    assert [d["content"] for d in deltas[:2]] == ["好的，", "正在截图"]
+    assert deltas[2]["tool_calls"][0]["function"]["name"] == "desktop_screenshot"
+    assert response["message"]["content"] == "好的，正在截图"
+    assert response["done"] and response["eval_count"] == 15
+    assert response["prompt_eval_duration"] == 300
+    
+    return True
+
+
+def test_pipelined_tool_dispatch():
+    """
+    测试流式响应期间的流水线工具调度
+    """
+    print("\n" + "=" * 60)
+    print("测试14: 流水线工具调度")
+    print("=" * 60)
+    
+    from ollama_tools import OllamaToolCaller, OllamaConfig
+    
+    events = []
+    
+    class SlowExecutor(MockToolExecutor):
+        def execute_tool(self, tool_name, arguments, skill_path, skill_action):
+            events.append(("start", tool_name, time.perf_counter()))
+            time.sleep(0.1)
+            events.append(("end", tool_name, time.perf_counter()))
+            return super().execute_tool(tool_name, arguments, skill_path, skill_action)
+    
+    def tool_chunk(name, arguments):
+        return {"message": {"role": "assistant", "content": "",
+                            "tool_calls": [{"function": {"name": name, "arguments": arguments}}]}, "done": False}
+    
+    rounds = []
+    
+    def fake_stream(request_body, conversation_id=None, timeout=None):
+        rounds.append(len(request_body["messages"]))
+        if len(rounds) == 1:
+            yield tool_chunk("desktop_position", {})
+            yield tool_chunk("desktop_click", {"x": 1, "y": 2})
+            yield tool_chunk("desktop_position", {})
+            time.sleep(0.3)
+        else:
+            yield {"message": {"role": "assistant", "content": "完成"}, "done": False}
+        yield {"message": {"role": "assistant", "content": ""}, "done": True, "eval_count": 3}
+    
+    executor = SlowExecutor(max_parallel=4)
+    caller = OllamaToolCaller(OllamaConfig(stream=True), executor=executor)
+    caller._iter_chat_stream = fake_stream
+    try:
+        response = caller.chat_with_tool_execution("点击并获取位置")
+    finally:
+        executor.close()
+    
+    first = response["iterations"][0]
+    print(f"  生成耗时: {first['llm_time']:.3f}s, 工具耗时: {first['tool_time']:.3f}s")
+    print(f"  响应结束后等待: {first['wait_after_response']:.3f}s, 重叠节省: {first['overlap_saved']:.3f}s")
+    assert response["message"]["content"] == "完成"
+    assert rounds == [1, 5]
+    assert first["pipelined"] and first["tool_calls"] == 3
+    assert first["overlap_saved"] > 0.2
+    
+    names = [(kind, name) for kind, name, _ in events]
+    assert names.index(("start", "desktop_click")) > names.index(("end", "desktop_position"))
+    assert names.index(("start", "desktop_position"), 1) > names.index(("end", "desktop_click"))
+    
+    return True
+
+
+def test_tool_retrieval():
+    """
+    测试按用户消息检索工具子集
+    """
+    print("\n" + "=" * 60)
+    print("测试15: 工具子集检索")
+    print("=" * 60)
+    
+    from tool_retrieval import ToolRetriever, ToolSelection, tokenize
+    
+    assert "截图" in tokenize("帮我截图") and "click" in tokenize("desktop_click")
+    
+    retriever = ToolRetriever(top_k=5)
+    cases = {
+        "帮我截个屏": "desktop_screenshot",
+        "click the button at 100,200": "desktop_click",
+        "把这段文字复制到剪贴板": "clipboard_copy",
+        "列出所有窗口": "window_list",
+    }
+    for query, expected in cases.items():
+        names = [tool.name for tool in retriever.select(query)]
+        print(f"  {query} -> {names}")
+        assert expected in names and len(names) <= 5
+    
+    assert len(retriever.select("hello")) == len(ALL_TOOLS)
+    
+    embedded = []
+    def fake_embedder(texts):
+        embedded.append(len(texts))
+        return [[1.0, float("窗口" in text)] for text in texts]
+    hybrid = ToolRetriever(top_k=3, embedder=fake_embedder)
+    assert "window_list" in [tool.name for tool in hybrid.select("列出所有窗口")]
+    hybrid.select("关闭窗口")
+    assert embedded[0] == len(ALL_TOOLS) and embedded[1:] == [1, 1]
+    
+    selection = ToolSelection(retriever, "帮我截个屏")
+    messages = [{"role": "user", "content": "帮我截个屏"}]
+    selection.record_request(messages)
+    added = selection.add_referenced({"role": "assistant", "content": "需要先调用window_list"})
+    report = selection.report()
+    print(f"  提示词token估算: {report['prompt_tokens_all']} -> {report['prompt_tokens_selected']}")
+    assert added == ["window_list"] and "window_list" in selection.names
+    assert report["prompt_tokens_selected"] < report["prompt_tokens_all"] / 2
+    # 只认完整的工具名：提到desktop_locate_and_click不等于提到desktop_locate
+    from tool_retrieval import find_referenced_tools
+    message = {"role": "assistant", "content": "改用desktop_locate_and_click。"}
+    candidates = ["desktop_locate", "desktop_locate_and_click", "desktop_click"]
+    assert find_referenced_tools(message, [], candidates) == ["desktop_locate_and_click"]
+    
+    return True
+
+
+def test_tool_schema_cache():
+    """
+    测试预编码工具定义缓存
+    """
+    print("\n" + "=" * 60)
+    print("测试16: 工具定义缓存")
+    print("=" * 60)
+    
+    from tool_schema_cache import ToolSchemaCache, encode_chat_request
+    
+    cache = ToolSchemaCache()
+    all_tools = cache.all_tools()
+    assert cache.all_tools() is all_tools
+    assert list(all_tools.names) == [tool.name for tool in ALL_TOOLS]
+    assert all_tools.to_list() == get_all_tools_ollama_format()
+    
+    subset = cache.for_names(["window_list", "desktop_click", "no_such_tool"])
+    assert subset.names == ("desktop_click", "window_list")
+    assert cache.for_names(["desktop_click", "window_list"]) is subset
+    assert ToolSchemaCache().for_names(["window_list", "desktop_click"]).digest == subset.digest
+    print(f"  全部工具: {len(all_tools)}个, {len(all_tools.encoded)}字节, 哈希 {all_tools.digest}")
+    
+    try:
+        subset.digest = "x"
+        assert False, "ToolSchemaSet应不可修改"
+    except AttributeError:
+        pass
+    
+    body = {"model": "qwen3:latest", "messages": [{"role": "user", "content": "点击"}], "stream": False, "tools": subset}
+    decoded = json.loads(encode_chat_request(body).decode("utf-8"))
+    assert decoded["tools"] == subset.to_list() and decoded["messages"] == body["messages"]
+    
+    system = [{"role": "system", "content": "你是桌面助手"}, {"role": "user", "content": "a"}]
+    assert cache.observe_prefix(system, subset)[1] is False
+    assert cache.observe_prefix(system + [{"role": "user", "content": "b"}], subset)[1] is False
+    assert cache.observe_prefix(system, all_tools)[1] is True
+    stats = cache.stats()
+    print(f"  统计: {stats}")
+    assert stats["prefix_changes"] == 1 and stats["schema_sets"] == 2
+    
+    return True
+
+
+def test_model_residency():
+    """
+    测试模型预加载、重新加载检测和LRU卸载
+    """
+    print("\n" + "=" * 60)
+    print("测试17: 模型常驻管理")
+    print("=" * 60)
+    
+    from model_residency import ModelResidencyManager
+    from ollama_tools import OllamaToolCaller, OllamaConfig
+    
+    class FakeResponse:
+        def __init__(self, data):
+            self.status_code = 200
+            self._data = data
+        def raise_for_status(self):
+            pass
+        def json(self):
+            return self._data
+    
+    class FakeTransport:
+        def __init__(self):
+            self.posts = []
+        def post(self, path, json=None, timeout=None, **kwargs):
+            self.posts.append((path, json))
+            return FakeResponse({"done": True, "load_duration": 2_000_000_000})
+        def get(self, path, timeout=None):
+            return FakeResponse({"models": [
+                {"name": "small:latest", "size_vram": 2_000_000_000},
+                {"name": "large:latest", "size_vram": 9_000_000_000},
+            ]})
+    
+    manager = ModelResidencyManager(keep_alive="1h", max_warm=2, memory_budget=10_000_000_000)
+    transport = FakeTransport()
+    manager.transport = transport
+    
+    result = manager.warmup("small:latest")
+    assert result["status"] == "success" and result["load_duration"] == 2.0
+    assert transport.posts[0] == ("/api/generate", {"model": "small:latest", "keep_alive": "1h"})
+    
+    manager.warmup("large:latest")
+    stats = manager.stats()
+    print(f"  常驻模型: {stats['warm_models']}, 卸载次数: {stats['evictions']}")
+    assert stats["warm_models"] == ["large:latest"]
+    assert ("/api/generate", {"model": "small:latest", "keep_alive": 0}) in transport.posts
+    
+    manager.observe("large:latest", {"done": True, "load_duration": 10_000_000})
+    manager.observe("large:latest", {"done": True, "load_duration": 3_000_000_000})
+    per_model = manager.stats()["per_model"]["large:latest"]
+    print(f"  large:latest 统计: {per_model}")
+    assert per_model["requests"] == 2 and per_model["unexpected_reloads"] == 1
+    assert per_model["loads"] == 2 and per_model["last_load_duration"] == 3.0
+    
+    caller = OllamaToolCaller(OllamaConfig(model="large:latest"), residency=manager)
+    assert caller._build_chat_request([], [])["keep_alive"] == "1h"
+    caller = OllamaToolCaller(OllamaConfig(keep_alive=-1))
+    assert caller._build_chat_request([], [])["keep_alive"] == -1
+    assert "keep_alive" not in OllamaToolCaller()._build_chat_request([], [])
+    
+    return True
+
+
+def test_backend_pool():
+    """
+    测试多Ollama实例的负载均衡（本地桩服务器）
+    """
+    print("\n" + "=" * 60)
+    print("测试18: 多实例负载均衡")
+    print("=" * 60)
+    
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from backend_pool import OllamaBackendPool
+    from ollama_tools import OllamaToolCaller, OllamaConfig
+    
+    log = []
+    
+    def make_server(name):
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, data):
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def do_GET(self):
+                self._reply({"models": [{"name": "qwen3:latest"}]})
+            
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                messages = request["messages"]
+                log.append((name, messages[0]["content"]))
+                message = {"role": "assistant", "content": f"来自{name}"}
+                if len(messages) == 1:
+                    message["tool_calls"] = [{"function": {"name": "desktop_position", "arguments": {}}}]
+                self._reply({"model": request["model"], "message": message, "done": True})
+            
+            def log_message(self, *args):
+                pass
+        
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    
+    servers = {name: make_server(name) for name in ("A", "B")}
+    urls = {name: f"http://127.0.0.1:{server.server_port}" for name, server in servers.items()}
+    try:
+        pool = OllamaBackendPool(list(urls.values()), model="qwen3:latest")
+        pool.check_health()
+        assert pool.stats()["healthy"] == 2
+        
+        caller = OllamaToolCaller(OllamaConfig(max_retries=0), executor=MockToolExecutor(), backend_pool=pool)
+        for i in range(4):
+            response = caller.chat_with_tool_execution(f"会话{i}")
+            assert not response.get("error"), response
+        
+        for i in range(4):
+            hits = {name for name, content in log if content == f"会话{i}"}
+            print(f"  会话{i}: {sorted(hits)}")
+            assert len(hits) == 1
+        stats = pool.stats()
+        assert stats["conversations"] == 0
+        assert sum(b["requests"] for b in stats["backends"]) == 8
+    finally:
+        for server in servers.values():
+            server.shutdown()
+            server.server_close()
+    
+    pool = OllamaBackendPool(["http://a", "http://b"], max_failures=2, health_check=lambda url: True)
+    first, second = pool.acquire(), pool.acquire()
+    assert (first.base_url, second.base_url) == ("http://a", "http://b")
+    pool.release(first, latency=0.1)
+    pool.release(second, latency=1.0)
+    leased = [pool.acquire(f"c{i}") for i in range(10)]
+    routed = [backend.base_url for backend in leased]
+    print(f"  并发路由: {routed}")
+    assert routed.count("http://a") > routed.count("http://b") > 0
+    for backend in leased:
+        pool.release(backend, latency=0.1 if backend.base_url == "http://a" else 1.0)
+    sticky = pool.acquire("c9").base_url
+    pool.release(pool.backends[0] if sticky == "http://a" else pool.backends[1])
+    assert sticky == routed[9]
+    
+    backend_a = pool.backends[0]
+    pool.release(pool.acquire("x"), success=False)
+    pool.release(pool.acquire("x"), success=False)
+    assert not backend_a.healthy
+    assert pool.acquire("c0").base_url == "http://b"
+    print(f"  实例状态: {pool.stats()['backends']}")
+    
+    # 只有连接错误和5xx计为实例失败；客户端超时、流错误、4xx只释放占用
+    import requests
+    from ollama_tools import OllamaStreamError
+    def http_error(status):
+        response = requests.models.Response()
+        response.status_code = status
+        return requests.exceptions.HTTPError(f"{status}", response=response)
+    pool = OllamaBackendPool(["http://a"], max_failures=2, health_check=lambda url: True)
+    backend = pool.backends[0]
+    for error in (requests.exceptions.ReadTimeout("deadline"), requests.exceptions.Timeout("deadline"),
+                  OllamaStreamError("model error"), http_error(404), http_error(400)):
+        try:
+            with pool.lease("c") as leased:
+                raise error
+        except requests.exceptions.RequestException:
+            pass
+    assert backend.healthy and backend.failures == 0 and backend.errors == 0
+    assert backend.latency_ewma is None and backend.in_flight == 0
+    for error in (http_error(503), requests.exceptions.ConnectionError("refused")):
+        try:
+            with pool.lease("c"):
+                raise error
+        except requests.exceptions.RequestException:
+            pass
+    assert not backend.healthy and backend.errors == 2 and backend.in_flight == 0
+    
+    return True
+
+
+def test_conversation_context():
+    """
+    测试对话上下文预算和工具结果压缩
+    """
+    print("\n" + "=" * 60)
+    print("测试19: 对话上下文预算")
+    print("=" * 60)
+    
+    from conversation_context import ConversationContext
+    from ollama_tools import OllamaToolCaller
+    
+    big_result = {
+        "status": "success",
+        "action": "list",
+        "windows": [{"id": i, "title": f"窗口标题{i}" * 20} for i in range(50)],
+        "image": "iVBORw0KGgo" * 200
+    }
+    
+    class BigResultExecutor(MockToolExecutor):
+        def execute_tool(self, tool_name, arguments, skill_path, skill_action):
+            return ExecutionResult(success=True, tool_name=tool_name, result=big_result)
+    
+    def run(context):
+        caller = OllamaToolCaller(executor=BigResultExecutor(), context=context)
+        calls = []
+        def fake_post(request_body, conversation_id=None, timeout=None):
+            calls.append(list(request_body["messages"]))
+            if len(calls) < 6:
+                message = {"role": "assistant", "content": "",
+                           "tool_calls": [{"function": {"name": "window_list", "arguments": {}}}]}
+            else:
+                message = {"role": "assistant", "content": "完成"}
+            return {"message": message, "done": True}
+        caller._post_chat = fake_post
+        response = caller.chat_with_tool_execution("列出窗口", tools=[], system_prompt="你是桌面助手", max_iterations=6)
+        return response, calls
+    
+    unbounded, _ = run(None)
+    bounded, calls = run(ConversationContext(token_budget=8000))
+    growth = [it["prompt_tokens"] for it in unbounded["iterations"]]
+    flat = [it["prompt_tokens"] for it in bounded["iterations"]]
+    print(f"  未压缩每轮token: {growth}")
+    print(f"  压缩后每轮token: {flat}")
+    assert growth[-1] > 4 * growth[1]
+    assert max(flat[1:]) < 1.3 * flat[1] and all(t <= 8000 for t in flat[1:])
+    assert bounded["iterations"][-1]["context_saved"] > 0
+    
+    last = calls[-1]
+    assert last[0] == {"role": "system", "content": "你是桌面助手"}
+    assert last[1] == {"role": "user", "content": "列出窗口"}
+    assert json.loads(last[-1]["content"]) == big_result
+    
+    context = ConversationContext(token_budget=100000)
+    messages = [
+        {"role": "user", "content": "截图", "images": ["aGVsbG8="]},
+        {"role": "assistant", "content": "", "tool_calls": []},
+        {"role": "tool", "content": json.dumps({"status": "success", "base64": "QUJD" * 100})},
+        {"role": "assistant", "content": "", "tool_calls": []},
+        {"role": "tool", "content": json.dumps({"status": "success", "base64": "QUJD" * 100})},
+    ]
+    compacted, stats = context.compact(messages)
+    print(f"  压缩统计: {stats}")
+    assert "base64 omitted" in compacted[2]["content"] and compacted[4] == messages[4]
+    assert compacted[0] == messages[0] and stats["summarized"] == 0
+    assert "QUJD" in messages[2]["content"]
+    
+    return True
+
+
+def test_response_cache():
+    """
+    测试模型响应磁盘缓存
+    """
+    print("\n" + "=" * 60)
+    print("测试20: 模型响应缓存")
+    print("=" * 60)
+    
+    import threading
+    from contextlib import contextmanager
+    from response_cache import ResponseCache
+    from ollama_tools import OllamaToolCaller, OllamaConfig
+    
+    posts = []
+    
+    class FakeResponse:
+        def __init__(self, data):
+            self.data = data
+        def raise_for_status(self):
+            pass
+        def json(self):
+            return self.data
+    
+    class FakeTransport:
+        def post(self, path, data=None, **kwargs):
+            request = json.loads(data)
+            posts.append(request)
+            time.sleep(0.1)
+            if request["messages"][-1]["role"] == "user":
+                message = {"role": "assistant", "content": "",
+                           "tool_calls": [{"function": {"name": "screen_get_size", "arguments": {}}}]}
+            else:
+                message = {"role": "assistant", "content": "完成"}
+            return FakeResponse({"message": message, "done": True, "eval_count": 5})
+    
+    @contextmanager
+    def fake_transport(conversation_id=None, deadline=None):
+        yield FakeTransport()
+    
+    with tempfile.TemporaryDirectory() as cache_dir:
+        config = OllamaConfig(options={"temperature": 0, "seed": 42})
+        caller = OllamaToolCaller(config=config, executor=MockToolExecutor(),
+                                  response_cache=ResponseCache(cache_dir))
+        caller._chat_transport = fake_transport
+        
+        # 相同的并发请求只发送一次
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(caller.chat_with_tools("屏幕多大")))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f"  并发4个相同请求，实际发送: {len(posts)}")
+        assert len(posts) == 1 and posts[0]["options"] == {"temperature": 0, "seed": 42}
+        assert sum(1 for r in results if r.get("cached")) == 3
+        assert all(r["message"] == results[0]["message"] for r in results)
+        
+        # 磁盘缓存跨实例有效，完整的工具循环不再访问网络
+        caller.response_cache = ResponseCache(cache_dir)
+        first = caller.chat_with_tool_execution("屏幕多大")
+        sent = len(posts)
+        second = caller.chat_with_tool_execution("屏幕多大")
+        print(f"  第二次执行工具循环新增请求: {len(posts) - sent}, 统计: {caller.response_cache.stats()}")
+        assert len(posts) == sent and second.get("cached") and second["message"]["content"] == "完成"
+        assert second["iterations"][0]["tool_calls"] == 1 and first["message"] == second["message"]
+        
+        # options不同时不命中
+        caller.config.options = {"temperature": 0.8}
+        caller.chat_with_tools("屏幕多大")
+        assert len(posts) == sent + 1
+    
+    # TTL和容量上限
+    with tempfile.TemporaryDirectory() as cache_dir:
+        now = [1000.0]
+        cache = ResponseCache(cache_dir, max_bytes=600, ttl=60, clock=lambda: now[0])
+        for i in range(3):
+            cache.put(f"k{i}", {"message": {"role": "assistant", "content": "x" * 150}, "done": True})
+        assert cache.get("k0") is None and cache.get("k2") is not None
+        assert cache.stats()["evictions"] == 1
+        now[0] += 61
+        assert cache.get("k2") is None
+        assert not cache.put("partial", {"message": {}, "done": False})
+    
+    return True
+
+
+def test_inference_telemetry():
+    """
+    测试推理遥测
+    """
+    print("\n" + "=" * 60)
+    print("测试21: 推理遥测")
+    print("=" * 60)
+    
+    from contextlib import contextmanager
+    from inference_telemetry import InferenceTelemetry, inference_metrics
+    from ollama_tools import OllamaToolCaller
+    
+    timings = {
+        "total_duration": 3_000_000_000,
+        "load_duration": 1_000_000_000,
+        "prompt_eval_count": 400,
+        "prompt_eval_duration": 500_000_000,
+        "eval_count": 60,
+        "eval_duration": 1_500_000_000
+    }
+    metrics = inference_metrics(dict(timings, done=True), wall_time=3.2)
+    print(f"  单次请求指标: {metrics}")
+    assert metrics["prefill_tokens_per_sec"] == 800.0 and metrics["decode_tokens_per_sec"] == 40.0
+    assert metrics["loaded"] and metrics["overhead"] == 0.2
+    
+    class FakeResponse:
+        def __init__(self, data):
+            self.data = data
+        def raise_for_status(self):
+            pass
+        def json(self):
+            return self.data
+    
+    class FakeTransport:
+        def __init__(self):
+            self.requests = 0
+        def post(self, path, data=None, **kwargs):
+            request = json.loads(data)
+            self.requests += 1
+            if request["messages"][-1]["role"] == "user":
+                message = {"role": "assistant", "content": "",
+                           "tool_calls": [{"function": {"name": "screen_get_size", "arguments": {}}}]}
+                load = timings["load_duration"]
+            else:
+                message = {"role": "assistant", "content": "完成"}
+                load = 1_000_000
+            return FakeResponse(dict(timings, load_duration=load, message=message, done=True))
+    
+    transport = FakeTransport()
+    
+    @contextmanager
+    def fake_transport(conversation_id=None, deadline=None):
+        yield transport
+    
+    telemetry = InferenceTelemetry()
+    caller = OllamaToolCaller(executor=MockToolExecutor(), telemetry=telemetry)
+    caller._chat_transport = fake_transport
+    result = caller.chat_with_tool_execution("屏幕多大", tools=caller.schema_cache.for_names(["screen_get_size"]))
+    assert all(it["metrics"]["eval_count"] == 60 for it in result["iterations"])
+    assert result["metrics"]["loaded"] is False
+    
+    summary = telemetry.summary()
+    model = summary["models"][caller.config.model]
+    tool_set = next(iter(summary["tool_sets"].values()))
+    print(f"  按模型汇总: requests={model['requests']}, loads={model['loads']}, "
+          f"decode={model['decode_tokens_per_sec']} tok/s, breakdown={model['breakdown']}")
+    assert model["requests"] == 2 and model["loads"] == 1 and model["load_frequency"] == 0.5
+    assert model["decode_tokens_per_sec"] == 40.0 and model["avg_prefill_time"] == 0.5
+    assert model["tool_calls"] == 1 and model["dominant_phase"] == "decode"
+    assert tool_set["names"] == ["screen_get_size"] and tool_set["requests"] == 2
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "telemetry.json")
+        telemetry.export_json(path)
+        with open(path, "r", encoding="utf-8") as f:
+            assert json.load(f) == summary
+    
+    return True
+
+
+def test_session_manager():
+    """
+    测试多会话管理和公平调度
+    """
+    print("\n" + "=" * 60)
+    print("测试22: 多会话公平调度")
+    print("=" * 60)
+    
+    import threading
+    from ollama_tools import OllamaToolCaller
+    from session_manager import SessionManager
+    
+    served = []
+    active = [0, 0]
+    lock = threading.Lock()
+    
+    class FakeResponse:
+        def __init__(self, data):
+            self.data = data
+        def raise_for_status(self):
+            pass
+        def json(self):
+            return self.data
+    
+    class FakeTransport:
+        def post(self, path, data=None, **kwargs):
+            request = json.loads(data)
+            with lock:
+                served.append(request["messages"][0]["content"])
+                active[0] += 1
+                active[1] = max(active[1], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            rounds = sum(1 for m in request["messages"] if m["role"] == "tool")
+            if rounds < 2:
+                message = {"role": "assistant", "content": "",
+                           "tool_calls": [{"function": {"name": "screen_get_size", "arguments": {}}}]}
+            else:
+                message = {"role": "assistant", "content": f"完成: {request['messages'][0]['content']}"}
+            return FakeResponse({"message": message, "done": True})
+    
+    caller = OllamaToolCaller(executor=MockToolExecutor())
+    caller.config.get_transport = lambda base_url=None: FakeTransport()
+    manager = SessionManager(caller=caller, max_concurrent=1)
+    
+    sessions = [manager.create_session(system_prompt=name, tools=["screen_get_size"]) for name in "ABC"]
+    for session_id in sessions:
+        assert manager.submit(session_id, "屏幕多大")["status"] == "success"
+    assert manager.submit(sessions[0], "再来一次")["status"] == "error"
+    time.sleep(0.02)
+    depth = manager.stats()["scheduler"]["queue_depth"]
+    results = [manager.wait(session_id, timeout=10) for session_id in sessions]
+    stats = manager.stats()
+    print(f"  服务顺序: {''.join(served)}, 最大并发: {active[1]}, 排队深度: {depth}")
+    print(f"  调度统计: {stats['scheduler']}")
+    assert active[1] == 1 and depth == 2
+    assert served == list("ABCABCABC")
+    assert all(r["status"] == "completed" and r["result"]["message"]["content"].endswith(s)
+               for r, s in zip(results, "ABC"))
+    assert stats["by_status"] == {"completed": 3} and stats["scheduler"]["max_queue_depth"] >= 2
+    
+    # 会话保留历史，第二轮在原有对话上继续
+    manager.submit(sessions[1], "再确认一次")
+    second = manager.wait(sessions[1], timeout=10)
+    history = manager.poll(sessions[1], include_messages=True)["messages"]
+    assert second["turns"] == 2 and sum(1 for m in history if m["role"] == "user") == 2
+    
+    # 排队中取消
+    served.clear()
+    manager.submit(sessions[0], "长任务")
+    time.sleep(0.01)
+    manager.submit(sessions[2], "被取消的任务")
+    time.sleep(0.01)
+    assert manager.poll(sessions[2])["queued"] == 1
+    assert manager.cancel(sessions[2])
+    cancelled = manager.wait(sessions[2], timeout=10)
+    manager.wait(sessions[0], timeout=10)
+    print(f"  取消后状态: {cancelled['status']}")
+    assert cancelled["status"] == "cancelled" and cancelled["result"]["cancelled"]
+    assert "C" not in served and manager.stats()["scheduler"]["cancelled"] == 1
+    
+    manager.shutdown()
+    return True
+
+
+def test_ollama_stub_server():
+    """
+    测试离线Ollama桩服务器和端到端编排基准
+    """
+    print("\n" + "=" * 60)
+    print("测试23: 离线Ollama桩服务器")
+    print("=" * 60)
+    
+    from ollama_stub_server import OllamaStubServer
+    from ollama_tools import OllamaToolCaller, OllamaConfig, test_connection, list_models
+    from tool_retrieval import OllamaEmbedder
+    from orchestration_benchmark import run_benchmark
+    from execution_mode_benchmark import percentile
+    
+    values = list(range(1, 21))
+    assert [percentile(values, pct) for pct in (5, 50, 95, 100)] == [1, 10, 19, 20]
+    assert percentile([3, 1, 2, 4], 50) == 2 and percentile([], 95) == 0.0
+    
+    script = [
+        {"content": "", "tool_calls": [
+            {"function": {"name": "screen_get_size", "arguments": {}}},
+            {"function": {"name": "desktop_position", "arguments": {}}}
+        ]},
+        {"content": "屏幕尺寸和鼠标位置都已获取。"}
+    ]
+    with OllamaStubServer(script=script, decode_latency=0.001, load_latency=0.05) as stub:
+        assert test_connection(stub.base_url) and "qwen3:latest" in list_models(stub.base_url)
+        
+        embed = OllamaEmbedder(stub.base_url, model="nomic-embed-text:latest")
+        vectors = embed(["点击按钮", "点击按钮", "读取剪贴板"])
+        assert len(vectors) == 3 and vectors[0] == vectors[1] and len(vectors[0]) == 64
+        
+        for stream in (False, True):
+            caller = OllamaToolCaller(OllamaConfig(base_url=stub.base_url, stream=stream),
+                                      executor=MockToolExecutor())
+            result = caller.chat_with_tool_execution("屏幕多大，鼠标在哪")
+            iterations = result["iterations"]
+            print(f"  stream={stream}: {result['message']['content']}, "
+                  f"轮次={len(iterations)}, 首轮加载={iterations[0]['metrics']['load_duration']}s")
+            assert result["message"]["content"] == script[1]["content"]
+            assert [it["tool_calls"] for it in iterations] == [2, 0]
+            assert iterations[0]["pipelined"] == stream and iterations[1]["metrics"]["eval_count"] > 0
+        assert stub.requests[-1]["body"]["messages"][-1]["role"] == "tool"
+        
+        caller = OllamaToolCaller(OllamaConfig(base_url=stub.base_url), executor=MockToolExecutor())
+        report = run_benchmark(caller, runs=10, concurrency=2)
+        print(f"  基准: {report['runs_per_sec']} 对话/秒, 编排开销P95={report['orchestration_overhead']['p95_ms']}ms")
+        assert report["errors"] == 0 and report["iterations"] == 20
+        assert report["latency"]["p99_ms"] >= report["latency"]["p50_ms"] > 0
+    
+    return True
+
+
+def test_deadline_budget():
+    """
+    测试带时间预算的工具循环
+    """
+    print("\n" + "=" * 60)
+    print("测试24: 时间预算")
+    print("=" * 60)
+    
+    from deadline_budget import DeadlineBudget
+    from ollama_stub_server import OllamaStubServer
+    from ollama_tools import OllamaToolCaller, OllamaConfig
+    from tool_retrieval import ToolRetriever
+    
+    budget = DeadlineBudget(10, min_request_timeout=1.0)
+    assert 3.9 < budget.request_timeout(5, 120) <= 4.0
+    assert budget.request_timeout(1, 3) <= 3 and not budget.should_degrade()
+    body = budget.degrade_request({"model": "a", "options": {"num_predict": 64}})
+    assert body["options"]["num_predict"] == 64
+    
+    # 模型一直要求调用工具：时间预算耗尽前返回部分结果
+    script = [{"content": "", "tool_calls": [{"function": {"name": "screen_get_size", "arguments": {}}}]}]
+    with OllamaStubServer(script=script, models=["qwen3:latest", "qwen3:1.7b"], base_latency=0.1) as stub:
+        caller = OllamaToolCaller(OllamaConfig(base_url=stub.base_url), executor=MockToolExecutor(),
+                                  tool_retriever=ToolRetriever(top_k=6))
+        budget = DeadlineBudget(1.0, min_request_timeout=0.1, degrade_below=0.5,
+                                fallback_model="qwen3:1.7b", degraded_num_predict=128, degraded_top_k=2)
+        result = caller.chat_with_tool_execution("获取屏幕尺寸", max_iterations=12, deadline=budget)
+        report = result["deadline"]
+        iterations = result["iterations"]
+        timeouts = [it["request_timeout"] for it in iterations]
+        print(f"  轮次={len(iterations)}, 降级于第{report['degraded_at']}轮, 阶段={report['phases']}")
+        assert result["partial"] and report["exhausted"] and result["message"] == "Deadline exceeded"
+        assert result["last_message"]["tool_calls"] and 1 < len(iterations) < 12
+        assert timeouts[-1] < timeouts[0] <= 1.0
+        assert report["elapsed"] < 1.0 + 0.3 and report["phases"]["llm"] > 0
+        
+        first = report["degraded_at"]
+        assert first is not None and iterations[first - 1]["degraded"] and not iterations[0]["degraded"]
+        normal, degraded = stub.requests[0]["body"], stub.requests[first - 1]["body"]
+        assert normal["model"] == "qwen3:latest" and "num_predict" not in (normal.get("options") or {})
+        assert degraded["model"] == "qwen3:1.7b" and degraded["options"]["num_predict"] == 128
+        degraded_tools = [tool["function"]["name"] for tool in degraded["tools"]]
+        assert "screen_get_size" in degraded_tools and len(degraded_tools) < len(normal["tools"])
+    
+    # 单次请求超过剩余时间：请求超时后返回部分结果
+    with OllamaStubServer(script=script, base_latency=1.0) as stub:
+        caller = OllamaToolCaller(OllamaConfig(base_url=stub.base_url), executor=MockToolExecutor())
+        result = caller.chat_with_tool_execution(
+            "获取屏幕尺寸", deadline=DeadlineBudget(0.4, min_request_timeout=0.1)
+        )
+        print(f"  超时: {result['message']}, 耗时={result['deadline']['elapsed']}s")
+        assert result["partial"] and result["iterations"] == [] and result["last_message"] is None
+        assert 0.1 < result["deadline"]["elapsed"] < 1.0
+        
+        # 没有时间预算时聊天请求同样不重试读取超时（服务器不会重新开始生成）
+        requests_before = len(stub.requests)
+        caller = OllamaToolCaller(OllamaConfig(base_url=stub.base_url, timeout=0.3), executor=MockToolExecutor())
+        start = time.perf_counter()
+        response = caller.chat_with_tools("获取屏幕尺寸")
+        elapsed = time.perf_counter() - start
+        time.sleep(0.1)
+        assert response["error"] and elapsed < 0.9
+        assert len(stub.requests) - requests_before <= 1
+    
+    # 调度器排队时间计入时间预算：等不到槽位时返回部分结果
+    from request_scheduler import FairScheduler
+    with OllamaStubServer(script=script) as stub:
+        scheduler = FairScheduler(max_concurrent=1)
+        assert scheduler.acquire("other")
+        caller = OllamaToolCaller(OllamaConfig(base_url=stub.base_url), executor=MockToolExecutor(),
+                                  scheduler=scheduler)
+        start = time.perf_counter()
+        result = caller.chat_with_tool_execution(
+            "获取屏幕尺寸", deadline=DeadlineBudget(0.5, min_request_timeout=0.1)
+        )
+        elapsed = time.perf_counter() - start
+        scheduler.release()
+        print(f"  排队超时: {result['message']}, 耗时={elapsed:.2f}s")
+        assert result["partial"] and elapsed < 0.8 and stub.requests == []
+    
+    # 流在中途停顿：读取超时缩短为剩余时间，不会在截止时间后继续等待
+    stalled = [{"content": "好的", "tool_calls": [{"function": {"name": "desktop_type", "arguments": {
+        "text": "这是一段很长的文本" * 10}}}]}]
+    with OllamaStubServer(script=stalled, base_latency=0.3, decode_latency=0.02) as stub:
+        caller = OllamaToolCaller(OllamaConfig(base_url=stub.base_url, stream=True), executor=MockToolExecutor())
+        start = time.perf_counter()
+        result = caller.chat_with_tool_execution(
+            "输入文本", max_iterations=1, deadline=DeadlineBudget(0.8, min_request_timeout=0.1)
+        )
+        elapsed = time.perf_counter() - start
+        print(f"  流停顿: {result['message']}, 耗时={elapsed:.2f}s")
+        assert result["partial"] and elapsed < 1.0
+    
+    return True
+
+
+def test_context_window():
+    """
+    测试按提示词长度选择num_ctx档位
+    """
+    print("\n" + "=" * 60)
+    print("测试25: 上下文窗口档位")
+    print("=" * 60)
+    
+    from context_window import ContextWindowSizer
+    from inference_telemetry import InferenceTelemetry
+    from ollama_stub_server import OllamaStubServer, KV_BYTES_PER_TOKEN
+    from ollama_tools import OllamaToolCaller, OllamaConfig
+    
+    sizer = ContextWindowSizer(buckets=(4096, 1024, 2048), reserve_tokens=256, headroom=1.0)
+    assert sizer.size("m", 500) == 1024 and sizer.size("m", 1500) == 2048
+    assert sizer.size("m", 100) == 2048 and sizer.size("m", 100, num_predict=3000) == 4096
+    assert sizer.size("m", 10000) == 4096 and sizer.current("other") is None
+    sizer.observe("m", 1000, 800)
+    sizer.observe("m", 1000, 1500)
+    stats = sizer.stats()["models"]["m"]
+    assert stats["grows"] == 2 and stats["overflows"] == 1 and stats["ratio"] == 1.5
+    sizer.reset("m")
+    assert sizer.size("m", 500) == 1024 and sizer.stats()["models"]["m"]["ratio"] == 1.0
+    
+    script = [{"content": "好的。"}]
+    with OllamaStubServer(script=script, load_latency=0.5) as stub:
+        telemetry = InferenceTelemetry()
+        sizer = ContextWindowSizer(buckets=(1024, 2048, 4096, 8192), reserve_tokens=256)
+        caller = OllamaToolCaller(OllamaConfig(base_url=stub.base_url), executor=MockToolExecutor(),
+                                  telemetry=telemetry, context_window=sizer)
+        tools = caller.schema_cache.for_names(["screen_get_size"])
+        num_ctx = []
+        for words in (10, 1500, 10, 10):
+            messages = [{"role": "user", "content": "word " * words}]
+            response, _ = caller.run_tool_loop(messages, tools)
+            num_ctx.append(response["metrics"]["num_ctx"])
+        print(f"  num_ctx: {num_ctx}, 档位统计: {sizer.stats()['models']}")
+        assert num_ctx == [1024, 4096, 4096, 4096]
+        assert [r["body"]["options"]["num_ctx"] for r in stub.requests] == num_ctx
+        
+        buckets = telemetry.summary()["context_buckets"]
+        print(f"  遥测: {[(k, v['requests'], v['loads'], v['size']) for k, v in buckets.items()]}")
+        assert list(buckets) == ["1024", "4096"]
+        assert buckets["1024"]["loads"] == 1 and buckets["4096"]["requests"] == 3 and buckets["4096"]["loads"] == 1
+        assert buckets["4096"]["size"] == 4096 * KV_BYTES_PER_TOKEN
+        assert buckets["4096"]["avg_prompt_tokens"] > buckets["1024"]["avg_prompt_tokens"]
+        
+        caller = OllamaToolCaller(OllamaConfig(base_url=stub.base_url, options={"num_ctx": 512}),
+                                  executor=MockToolExecutor(), context_window=ContextWindowSizer())
+        response, _ = caller.run_tool_loop([{"role": "user", "content": "word " * 1500}], tools)
+        assert response["metrics"]["num_ctx"] == 512 and response["metrics"]["prompt_eval_count"] == 512
+    
+    # 档位按实际发送的模型（级联的每一级、降级的备用模型）选择
+    from model_cascade import ModelCascade
+    from deadline_budget import DeadlineBudget
+    small, large = "qwen3:0.6b", "qwen3:1.7b"
+    def responder(body):
+        if body["model"] == small:
+            return {"role": "assistant", "content": ""}
+        return {"role": "assistant", "content": "好的"}
+    with OllamaStubServer(responder=responder, models=[small, large, "qwen3:latest"]) as stub:
+        sizer = ContextWindowSizer()
+        caller = OllamaToolCaller(OllamaConfig(base_url=stub.base_url), executor=MockToolExecutor(),
+                                  context_window=sizer, cascade=ModelCascade([small, large]))
+        caller.chat_with_tool_execution("你好")
+        caller.chat_with_tools("你好")
+        assert set(sizer.stats()["models"]) == {small, large}
+        assert all(r["body"]["options"]["num_ctx"] for r in stub.requests)
+        
+        sizer = ContextWindowSizer()
+        caller = OllamaToolCaller(OllamaConfig(base_url=stub.base_url), executor=MockToolExecutor(),
+                                  context_window=sizer)
+        caller.chat_with_tool_execution("你好", deadline=DeadlineBudget(10, degrade_below=1.0, fallback_model=small))
+        assert stub.requests[-1]["body"]["model"] == small and set(sizer.stats()["models"]) == {small}
+    
+    return True
+
+
+def test_model_cascade():
+    """
+    测试模型级联和回复校验
+    """
+    print("\n" + "=" * 60)
+    print("测试26: 模型级联")
+    print("=" * 60)
+    
+    from tool_validation import validate_response
+    from model_cascade import ModelCascade
+    from model_residency import ModelResidencyManager
+    from ollama_stub_server import OllamaStubServer
+    from ollama_tools import OllamaToolCaller, OllamaConfig
+    
+    registry = create_tool_registry()
+    def call(name, **arguments):
+        return {"tool_calls": [{"function": {"name": name, "arguments": arguments}}]}
+    assert validate_response({"content": "好的"}, registry) == []
+    assert validate_response({"content": "  "}, registry) == ["Empty response"]
+    assert validate_response(call("desktop_clik", x=1, y=2), registry) == ["Unknown tool: desktop_clik"]
+    assert validate_response(call("desktop_click", x=100, y=200), registry) == []
+    assert validate_response(call("desktop_screenshot"), registry) == []
+    errors = validate_response(call("desktop_click", x="100", y=True, z=1), registry)
+    print(f"  参数错误: {errors}")
+    assert errors == ["desktop_click: argument 'y' should be integer"]
+    assert validate_response(call("desktop_move"), registry)
+    # 注册表中的非内置工具不算未知工具；提供了定义时按定义校验参数
+    from tool_definitions import ToolDefinition, ToolParameter
+    from tool_validation import ToolCallValidator
+    custom_registry = dict(registry, custom_tool={"skill_path": "custom", "skill_action": "run", "description": "", "read_only": True})
+    assert validate_response(call("custom_tool", level="3"), custom_registry) == []
+    assert validate_response(call("custom_tool"), registry) == ["Unknown tool: custom_tool"]
+    custom = ToolCallValidator(tools=[ToolDefinition("custom_tool", "自定义工具", [ToolParameter("level", "integer", "级别")])])
+    assert validate_response(call("custom_tool", level=3), custom_registry, custom) == []
+    assert validate_response(call("custom_tool", level=True), custom_registry, custom) == ["custom_tool: argument 'level' should be integer"]
+    assert validate_response(call("custom_tool", level=3), None, custom) == []
+    assert custom.stats()["totals"]["valid"] == 0
+    
+    small, medium, large = "qwen3:0.6b", "qwen3:1.7b", "qwen3:latest"
+    def responder(body):
+        turn = sum(1 for m in body["messages"] if m.get("role") == "assistant")
+        if body["model"] == small:
+            return {"role": "assistant", "content": "", **call("desktop_clik", x=1, y=1)}
+        if body["model"] == medium:
+            if turn == 0:
+                return {"role": "assistant", "content": "", **call("screen_get_size")}
+            return {"role": "assistant", "content": ""}
+        return {"role": "assistant", "content": "屏幕尺寸已获取。"}
+    
+    with OllamaStubServer(responder=responder, models=[small, medium, large]) as stub:
+        cascade = ModelCascade([small, medium, large])
+        residency = ModelResidencyManager(base_url=stub.base_url, max_warm=3)
+        caller = OllamaToolCaller(OllamaConfig(base_url=stub.base_url), executor=MockToolExecutor(),
+                                  cascade=cascade, residency=residency)
+        result = caller.chat_with_tool_execution("屏幕多大")
+        print(f"  模型: {[it['model'] for it in result['iterations']]}, 级联: {result['cascade']}")
+        assert result["message"]["content"] == "屏幕尺寸已获取。"
+        assert [it["model"] for it in result["iterations"]] == [medium, large]
+        assert result["cascade"]["tier"] == 2 and len(result["cascade"]["escalations"]) == 2
+        assert [r["body"]["model"] for r in stub.requests] == [small, medium, small, medium, large]
+        assert stub.requests[2]["body"]["messages"][-1]["role"] == "tool"
+        
+        stats = cascade.stats()
+        tiers = {tier["model"]: tier for tier in stats["tiers"]}
+        print(f"  升级率: {[(m, t['escalation_rate']) for m, t in tiers.items()]}, 节省: {stats['time_saved']}s")
+        assert stats["requests"] == 2 and tiers[small]["escalation_rate"] == 1.0
+        assert tiers[medium]["accepted"] == 1 and tiers[medium]["escalated"] == 1
+        assert tiers[large]["accepted"] == 1 and tiers[large]["escalation_rate"] == 0.0
+        assert tiers[medium]["time_saved"] is not None and tiers[large]["time_saved"] == 0.0
+        # 加载信息记在实际回复的模型上
+        per_model = residency.stats()["per_model"]
+        assert {m: per_model[m]["requests"] for m in (small, medium, large)} == {small: 2, medium: 2, large: 1}
+        
+        response = caller.chat_with_tools("屏幕多大")
+        assert response["cascade"]["model"] == medium and response["cascade"]["errors"] == []
+    
+    # 设置了时间预算时，级联的总耗时不超过预算
+    def invalid(body):
+        return {"role": "assistant", "content": "", **call("desktop_clik", x=1, y=1)}
+    with OllamaStubServer(responder=invalid, models=[small, medium, large], base_latency=1.2) as stub:
+        caller = OllamaToolCaller(OllamaConfig(base_url=stub.base_url), executor=MockToolExecutor(),
+                                  cascade=ModelCascade([small, medium, large]))
+        start = time.perf_counter()
+        result = caller.chat_with_tool_execution("屏幕多大", max_iterations=1, deadline=3.0)
+        elapsed = time.perf_counter() - start
+        print(f"  预算内级联: {elapsed:.2f}s, 请求模型: {[r['body']['model'] for r in stub.requests]}")
+        assert elapsed < 3.0 and result.get("partial")
+        assert len(stub.requests) < 3
+    
+    return True
+
+
+def test_tool_argument_validation():
+    """
+    测试执行前的工具参数修复和拒绝
+    """
+    print("\n" + "=" * 60)
+    print("测试27: 工具参数校验")
+    print("=" * 60)
+    
+    from tool_validation import ToolCallValidator, compiled_validator
+    from ollama_stub_server import OllamaStubServer
+    from ollama_tools import OllamaToolCaller, OllamaConfig
+    
+    assert compiled_validator("desktop_click") is compiled_validator("desktop_click")
+    check = compiled_validator("desktop_click").check('{"x": "100", "y": 200.0, "button": " Right ", "extra": 1}')
+    print(f"  修复: {check.repairs}")
+    assert check.status == "repaired" and len(check.repairs) == 5
+    assert check.arguments == {"x": 100, "y": 200, "button": "right", "clicks": 1, "duration": 0.0}
+    assert compiled_validator("desktop_screenshot").check({}).arguments == {"path": "/tmp/screenshot.png"}
+    check = compiled_validator("desktop_click").check({"x": "左边", "button": "double"})
+    print(f"  拒绝: {check.error_message()}")
+    assert check.status == "rejected" and len(check.errors) == 3 and "'y'" in check.errors[-1]
+    assert compiled_validator("nonexistent") is None
+    
+    class CountingExecutor(MockToolExecutor):
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.executed = []
+        
+        def execute_tool(self, tool_name, arguments, skill_path, skill_action):
+            self.executed.append((tool_name, arguments))
+            return super().execute_tool(tool_name, arguments, skill_path, skill_action)
+    
+    validator = ToolCallValidator()
+    executor = CountingExecutor(validator=validator)
+    registry = create_tool_registry()
+    results = executor.execute_tool_calls([
+        {"function": {"name": "desktop_click", "arguments": {"x": "10", "y": "20"}}},
+        {"function": {"name": "desktop_type", "arguments": {"interval": 0.1}}},
+        {"function": {"name": "desktop_click", "arguments": {"x": 1, "y": 2, "button": "LEFT"}}},
+        {"function": {"name": "screen_get_size", "arguments": {}}},
+    ], registry)
+    assert [r.success for r in results] == [True, False, True, True]
+    assert results[1].error == "Invalid arguments for desktop_type: missing required argument 'text'"
+    assert [name for name, _ in executor.executed] == ["desktop_click", "desktop_click", "screen_get_size"]
+    assert executor.executed[0][1] == {"x": 10, "y": 20, "button": "left", "clicks": 1, "duration": 0.0}
+    stats = validator.stats()
+    print(f"  统计: {stats['tools']}")
+    assert stats["tools"]["desktop_click"] == {"calls": 2, "valid": 0, "repaired": 2, "rejected": 0}
+    assert stats["tools"]["desktop_type"]["rejected"] == 1 and stats["totals"]["valid"] == 1
+    
+    # 可修复的参数在本地修复，不浪费一轮推理
+    script = [
+        {"content": "", "tool_calls": [{"function": {"name": "desktop_click", "arguments": {"x": "100", "y": "200"}}}]},
+        {"content": "已点击。"}
+    ]
+    with OllamaStubServer(script=script) as stub:
+        validator = ToolCallValidator()
+        caller = OllamaToolCaller(OllamaConfig(base_url=stub.base_url), executor=MockToolExecutor(validator=validator))
+        result = caller.chat_with_tool_execution("点击(100, 200)")
+        tool_message = stub.requests[-1]["body"]["messages"][-1]
+        assert result["message"]["content"] == "已点击。" and len(result["iterations"]) == 2
+        assert json.loads(tool_message["content"])["params"]["x"] == 100
+        assert validator.stats()["totals"]["repaired"] == 1
+    
+    # 无法修复的参数直接把简短错误交给模型，不执行工具
+    script = [
+        {"content": "", "tool_calls": [{"function": {"name": "desktop_click", "arguments": {"x": "abc"}}}]},
+        {"content": "参数有误。"}
+    ]
+    with OllamaStubServer(script=script) as stub:
+        executor = CountingExecutor(validator=ToolCallValidator())
+        caller = OllamaToolCaller(OllamaConfig(base_url=stub.base_url), executor=executor)
+        result = caller.chat_with_tool_execution("点击abc")
+        tool_message = stub.requests[-1]["body"]["messages"][-1]
+        print(f"  拒绝后的工具消息: {tool_message['content']}")
+        content = json.loads(tool_message["content"])
+        assert tool_message["role"] == "tool" and content["status"] == "error"
+        assert "argument 'x' should be integer" in content["message"]
+        assert "missing required argument 'y'" in content["message"]
+        assert executor.executed == [] and result["message"]["content"] == "参数有误。"
+    
+    # 同步和异步调用器共用同一份tool消息构建
+    from ollama_tools import AsyncOllamaToolCaller
+    for name in ("_select_tools", "_keep_alive", "_observe_response", "_tool_message"):
+        assert getattr(AsyncOllamaToolCaller, name) is getattr(OllamaToolCaller, name), name
+    
+    return True
+
+
+def test_plan_execution():
+    """
+    测试先规划后执行模式
+    """
+    print("\n" + "=" * 60)
+    print("测试28: 计划执行")
+    print("=" * 60)
+    
+    from tool_plan import parse_plan, resolve_references, execute_plan, PlanReferenceError
+    from ollama_stub_server import OllamaStubServer
+    from ollama_tools import OllamaToolCaller, OllamaConfig
+    from orchestration_benchmark import PLAN_SCRIPT, compare_plan_modes
+    
+    outputs = {"s1": {"center_x": 640, "center_y": 360, "items": ["a", "b"]}}
+    resolved = resolve_references(
+        {"x": "$s1.center_x", "text": "($s1.center_x, $s1.center_y) $s1.items.1", "env": "$HOME.x"},
+        outputs, {"s1", "s2"}
+    )
+    assert resolved == {"x": 640, "text": "(640, 360) b", "env": "$HOME.x"}
+    try:
+        resolve_references("$s2.center_x", outputs, {"s1", "s2"})
+        assert False, "未执行的步骤不能被引用"
+    except PlanReferenceError:
+        pass
+    
+    steps, final, errors = parse_plan(json.dumps({"steps": [
+        {"id": "s1", "tool": "desktop_locate", "arguments": {"image": "icon.png"}},
+        {"tool": "desktop_click", "arguments": {"x": "$s1.center_x", "y": "$s1.center_y"}},
+        {"arguments": {}}
+    ]}))
+    assert [step.id for step in steps] == ["s1", "s2"] and final is None
+    assert errors == ["step 3: missing tool name"]
+    
+    class CountingExecutor(MockToolExecutor):
+        def __init__(self):
+            super().__init__()
+            self.executed = []
+        def execute_tool(self, tool_name, arguments, skill_path, skill_action):
+            self.executed.append((tool_name, arguments))
+            return super().execute_tool(tool_name, arguments, skill_path, skill_action)
+    
+    executor = CountingExecutor()
+    registry = create_tool_registry()
+    report = execute_plan(steps, executor, registry)
+    assert report["stopped"] is None and report["skipped"] == []
+    assert executor.executed[1] == ("desktop_click", {"x": 640, "y": 360})
+    
+    steps, _, _ = parse_plan({"steps": [
+        {"id": "s1", "tool": "screen_get_size", "arguments": {}},
+        {"id": "s2", "tool": "desktop_click", "arguments": {"x": "$s1.center_x", "y": 1}},
+        {"id": "s3", "tool": "browser_open", "arguments": {"url": "https://www.example.com"}}
+    ]})
+    report = execute_plan(steps, executor, registry)
+    print(f"  引用失败: {report['steps'][-1]['error']}")
+    assert report["stopped"] == "failed" and report["skipped"] == ["s3"]
+    steps[0].observe = True
+    report = execute_plan(steps, executor, registry)
+    assert report["stopped"] == "observe" and report["skipped"] == ["s2", "s3"]
+    steps[0].observe = False
+    
+    # 取消和时间预算：在下一步开始前停止
+    import threading
+    from deadline_budget import DeadlineBudget
+    report = execute_plan(steps, executor, registry, budget=DeadlineBudget(0.5, min_request_timeout=1.0))
+    assert report["stopped"] == "deadline" and report["steps"] == [] and report["skipped"] == ["s1", "s2", "s3"]
+    
+    class CancellingExecutor(CountingExecutor):
+        def __init__(self, cancel_event):
+            super().__init__()
+            self.cancel_event = cancel_event
+        def execute_tool(self, tool_name, arguments, skill_path, skill_action):
+            self.cancel_event.set()
+            return super().execute_tool(tool_name, arguments, skill_path, skill_action)
+    
+    cancel_event = threading.Event()
+    executor = CancellingExecutor(cancel_event)
+    report = execute_plan(steps, executor, registry, cancel_event=cancel_event)
+    assert report["stopped"] == "cancelled" and len(executor.executed) == 1 and report["skipped"] == ["s2", "s3"]
+    
+    # 计划全部成功：一次模型请求完成三步操作
+    with OllamaStubServer(script=PLAN_SCRIPT) as stub:
+        caller = OllamaToolCaller(OllamaConfig(base_url=stub.base_url), executor=MockToolExecutor())
+        result = caller.chat_with_tool_execution("点击浏览器图标并打开网页", plan=True)
+        assert len(stub.requests) == 1 and result["plan_completed"]
+        assert result["message"]["content"] == "已点击浏览器图标并打开网页。"
+        assert result["iterations"][0]["plan_steps"] == 3 and result["plans"][0]["stopped"] is None
+        body = stub.requests[0]["body"]
+        assert body["tools"][-1]["function"]["name"] == "run_plan"
+        assert "run_plan" in body["messages"][0]["content"]
+        
+        cancel_event = threading.Event()
+        executor = CancellingExecutor(cancel_event)
+        caller = OllamaToolCaller(OllamaConfig(base_url=stub.base_url), executor=executor)
+        result, _ = caller.run_tool_loop([{"role": "user", "content": "点击浏览器图标"}], plan=True,
+                                         cancel_event=cancel_event)
+        assert result["cancelled"] and result["plans"][0]["stopped"] == "cancelled"
+        assert [name for name, _ in executor.executed] == ["desktop_locate"]
+    
+    # 某一步失败：把已执行步骤的结果交给模型
+    script = [
+        {"content": "", "tool_calls": [{"function": {"name": "run_plan", "arguments": {"steps": [
+            {"id": "s1", "tool": "desktop_locate", "arguments": {"image": "icon.png"}},
+            {"id": "s2", "tool": "desktop_nonexistent", "arguments": {}}
+        ]}}}]},
+        {"content": "第二步失败了。"}
+    ]
+    with OllamaStubServer(script=script) as stub:
+        caller = OllamaToolCaller(OllamaConfig(base_url=stub.base_url), executor=MockToolExecutor())
+        result = caller.chat_with_tool_execution("定位图标", plan=True)
+        tool_message = json.loads(stub.requests[-1]["body"]["messages"][-1]["content"])
+        assert len(stub.requests) == 2 and result["message"]["content"] == "第二步失败了。"
+        assert tool_message["stopped"] == "failed" and tool_message["steps"][0]["result"]["center_x"] == 640
+        assert "plan_completed" not in result
+    
+    comparison = compare_plan_modes(MockToolExecutor(), runs=2)
+    print(f"  往返: 迭代式 {comparison['iterative']['round_trips']}, 计划模式 {comparison['plan']['round_trips']}")
+    assert comparison["iterative"]["round_trips"] == 4 and comparison["plan"]["round_trips"] == 1
+    assert comparison["iterative"]["errors"] == 0 and comparison["plan"]["errors"] == 0
+    
+    return True
+
+
 def run_all_tests():
     """
     运行所有测试
@@ -211,6 +1982,30 @@ def run_all_tests():
         ("工具执行器模块", test_tool_executor),
         ("Ollama核心模块", test_ollama_tools_module),
         ("工具调用流程", test_tool_call_simulation),
+        ("常驻工作进程", test_worker_execution_mode),
+        ("进程内执行", test_inprocess_execution_mode),
+        ("并行调度", test_concurrent_tool_calls),
+        ("异步执行器", test_async_tool_executor),
+        ("fork服务器", test_forkserver_execution_mode),
+        ("结果缓存", test_tool_result_cache),
+        ("批量桌面操作", test_desktop_batch),
+        ("输入稳定检测", test_input_settle_detection),
+        ("流式响应累积", test_stream_accumulator),
+        ("流水线工具调度", test_pipelined_tool_dispatch),
+        ("工具子集检索", test_tool_retrieval),
+        ("工具定义缓存", test_tool_schema_cache),
+        ("模型常驻管理", test_model_residency),
+        ("多实例负载均衡", test_backend_pool),
+        ("对话上下文预算", test_conversation_context),
+        ("模型响应缓存", test_response_cache),
+        ("推理遥测", test_inference_telemetry),
+        ("多会话公平调度", test_session_manager),
+        ("离线Ollama桩服务器", test_ollama_stub_server),
+        ("时间预算", test_deadline_budget),
+        ("上下文窗口档位", test_context_window),
+        ("模型级联", test_model_cascade),
+        ("工具参数校验", test_tool_argument_validation),
+        ("计划执行", test_plan_execution),
     ]
     
     results = []
@@ -0,0 +1,112 @@
+"""
+token_estimator.py - 提示词token数估算模块
+
+在不加载分词器的情况下粗略估算发送给Ollama的token数，用于比较不同提示词方案的
+大小（工具子集、上下文裁剪等）：
+1. 中日韩字符按每字约1个token计
+2. 其他字符按约4个字符1个token计
+3. 相同文本的估算结果会被缓存
+
+估算值只用于相对比较；实际token数以Ollama响应中的prompt_eval_count为准。
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import json
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Iterable
+
+
+CHARS_PER_TOKEN = 4
+
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# 多模态模型中一张图片大致占用的token数
+IMAGE_TOKENS = 768
+
+
+def _is_cjk(char: str) -> bool:
+    """判断字符是否为中日韩文字或全角标点"""
+    code = ord(char)
+    return (
+        0x4E00 <= code <= 0x9FFF
+        or 0x3400 <= code <= 0x4DBF
+        or 0x3000 <= code <= 0x303F
+        or 0xFF00 <= code <= 0xFFEF
+        or 0x3040 <= code <= 0x30FF
+        or 0xAC00 <= code <= 0xD7AF
+    )
+
+
+@lru_cache(maxsize=4096)
+def estimate_tokens(text: str) -> int:
+    """
+    估算一段文本的token数
+
+    Args:
+        text: 文本
+
+    Returns:
+        int: 估算的token数
+    """
+    if not text:
+        return 0
+    cjk = sum(1 for char in text if _is_cjk(char))
+    other = len(text) - cjk
+    return cjk + (other + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def estimate_message_tokens(message: Dict[str, Any]) -> int:
+    """
+    估算单条消息的token数（包含角色等格式开销）
+
+    Args:
+        message: 聊天消息
+
+    Returns:
+        int: 估算的token数
+    """
+    tokens = MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message.get("content") or "")
+    if message.get("thinking"):
+        tokens += estimate_tokens(message["thinking"])
+    if message.get("tool_calls"):
+        tokens += estimate_tokens(json.dumps(message["tool_calls"], ensure_ascii=False, sort_keys=True))
+    tokens += IMAGE_TOKENS * len(message.get("images") or [])
+    return tokens
+
+
+def estimate_tools_tokens(tools: Optional[Iterable[Dict[str, Any]]]) -> int:
+    """
+    估算工具定义的token数
+
+    Args:
+        tools: Ollama格式的工具定义列表，或带有预编码字节(encoded)的ToolSchemaSet
+
+    Returns:
+        int: 估算的token数
+    """
+    if not tools:
+        return 0
+    encoded = getattr(tools, "encoded", None)
+    if encoded is not None:
+        return estimate_tokens(encoded.decode("utf-8"))
+    return sum(estimate_tokens(json.dumps(tool, ensure_ascii=False, sort_keys=True)) for tool in tools)
+
+
+def estimate_prompt_tokens(
+    messages: List[Dict[str, Any]],
+    tools: Optional[Iterable[Dict[str, Any]]] = None
+) -> int:
+    """
+    估算一次聊天请求的提示词token数
+
+    Args:
+        messages: 消息列表
+        tools: 工具定义列表
+
+    Returns:
+        int: 估算的token数
+    """
+    return sum(estimate_message_tokens(message) for message in messages) + estimate_tools_tokens(tools)
@@ -0,0 +1,218 @@
+"""
+tool_cache.py - 只读工具结果缓存模块
+
+在ToolExecutor.execute_tool之前缓存只读工具（鼠标位置、屏幕尺寸、窗口列表、
+剪贴板内容等）的结果：
+1. 按工具名称和规范化后的参数作为缓存键，每个工具单独配置TTL
+2. 任何会改变输入状态的工具执行后自动清空缓存
+3. 相同的并发调用合并为一次实际执行
+4. 统计命中/未命中次数，便于调整TTL
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import dataclasses
+import json
+import threading
+import time
+from typing import Dict, Any, Optional, Callable, Set
+
+from tool_definitions import ALL_TOOLS
+
+
+DEFAULT_TOOL_TTLS: Dict[str, float] = {
+    "desktop_position": 0.5,
+    "screen_get_size": 60.0,
+    "window_list": 2.0,
+    "window_find": 2.0,
+    "clipboard_get": 1.0,
+    "clipboard_paste": 1.0,
+}
+
+
+class _InFlight:
+    """正在执行中的调用，供相同的并发调用等待其结果"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+
+
+class ToolResultCache:
+    """
+    只读工具结果缓存
+
+    只缓存执行成功且TTL大于0的只读工具结果。非只读工具（以及未知工具）
+    执行前后都会使缓存失效，执行期间开始的只读调用结果不会写入缓存。
+    """
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, float]] = None,
+        read_only_tools: Optional[Set[str]] = None,
+        max_entries: int = 256,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        初始化缓存
+
+        Args:
+            ttls: {工具名称: TTL秒数}，为None时使用DEFAULT_TOOL_TTLS
+            read_only_tools: 只读工具名称集合，为None时取ALL_TOOLS中read_only的工具
+            max_entries: 最大缓存条目数
+            clock: 单调时钟（便于测试）
+        """
+        self.ttls = dict(DEFAULT_TOOL_TTLS if ttls is None else ttls)
+        if read_only_tools is None:
+            read_only_tools = {tool.name for tool in ALL_TOOLS if tool.read_only}
+        self.read_only_tools = set(read_only_tools)
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Any] = {}
+        self._expires: Dict[str, float] = {}
+        self._in_flight: Dict[str, _InFlight] = {}
+        self._generation = 0
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(tool_name: str, arguments: Dict[str, Any]) -> str:
+        """
+        生成缓存键
+
+        Args:
+            tool_name: 工具名称
+            arguments: 工具参数
+
+        Returns:
+            str: 工具名称 + 键排序后的紧凑JSON参数
+        """
+        canonical = json.dumps(
+            arguments or {}, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+        )
+        return f"{tool_name}:{canonical}"
+
+    def _count(self, tool_name: str, field: str) -> None:
+        """累加统计计数（调用方需持有self._lock）"""
+        counters = self._stats.setdefault(
+            tool_name, {"hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0}
+        )
+        counters[field] += 1
+
+    def _clear(self) -> None:
+        """清空缓存并推进代数，使执行中的只读调用结果不被写入"""
+        with self._lock:
+            self._entries.clear()
+            self._expires.clear()
+            self._generation += 1
+
+    def invalidate(self) -> None:
+        """
+        清空所有缓存结果
+        """
+        self._clear()
+        with self._lock:
+            self.invalidations += 1
+
+    def _store(self, key: str, result: Any, ttl: float) -> None:
+        """写入缓存条目（调用方需持有self._lock）"""
+        now = self._clock()
+        if len(self._entries) >= self.max_entries:
+            for expired_key in [k for k, t in self._expires.items() if t <= now]:
+                self._entries.pop(expired_key, None)
+                self._expires.pop(expired_key, None)
+            while len(self._entries) >= self.max_entries:
+                oldest = min(self._expires, key=self._expires.get)
+                self._entries.pop(oldest, None)
+                self._expires.pop(oldest, None)
+        self._entries[key] = result
+        self._expires[key] = now + ttl
+
+    def get_or_execute(
+        self,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        execute: Callable[[], Any]
+    ) -> Any:
+        """
+        返回缓存结果，或执行工具并按需缓存
+
+        Args:
+            tool_name: 工具名称
+            arguments: 工具参数
+            execute: 实际执行工具的函数，返回ExecutionResult
+
+        Returns:
+            ExecutionResult: 执行结果；命中缓存时cached为True
+        """
+        if tool_name not in self.read_only_tools:
+            self._clear()
+            try:
+                return execute()
+            finally:
+                self.invalidate()
+
+        ttl = self.ttls.get(tool_name, 0.0)
+        if ttl <= 0:
+            with self._lock:
+                self._count(tool_name, "bypassed")
+            return execute()
+
+        key = self.make_key(tool_name, arguments)
+        with self._lock:
+            if key in self._entries and self._expires[key] > self._clock():
+                self._count(tool_name, "hits")
+                return dataclasses.replace(self._entries[key], cached=True)
+
+            waiting = self._in_flight.get(key)
+            if waiting is None:
+                leader = _InFlight()
+                self._in_flight[key] = leader
+                generation = self._generation
+                self._count(tool_name, "misses")
+            else:
+                self._count(tool_name, "coalesced")
+
+        if waiting is not None:
+            waiting.event.wait()
+            if waiting.result is None:
+                return execute()
+            return dataclasses.replace(waiting.result, cached=True)
+
+        result = None
+        try:
+            result = execute()
+            return result
+        finally:
+            with self._lock:
+                if result is not None and result.success and generation == self._generation:
+                    self._store(key, result, ttl)
+                self._in_flight.pop(key, None)
+            leader.result = result
+            leader.event.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+
+        Returns:
+            Dict: {hits, misses, coalesced, bypassed, hit_rate, entries, invalidations, per_tool}
+        """
+        with self._lock:
+            per_tool = {name: dict(counters) for name, counters in self._stats.items()}
+            entries = len(self._entries)
+        totals = {
+            field: sum(counters[field] for counters in per_tool.values())
+            for field in ("hits", "misses", "coalesced", "bypassed")
+        }
+        lookups = totals["hits"] + totals["misses"] + totals["coalesced"]
+        return {
+            **totals,
+            "hit_rate": (totals["hits"] + totals["coalesced"]) / lookups if lookups else 0.0,
+            "entries": entries,
+            "invalidations": self.invalidations,
+            "per_tool": per_tool
+        }
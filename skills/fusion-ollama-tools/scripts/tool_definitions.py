@@ -63,12 +63,15 @@ class ToolDefinition:
         parameters: 参数列表
         skill_path: 关联的技能脚本路径
         skill_action: 技能动作名称
+        read_only: 是否为只读工具（不改变鼠标、键盘、剪贴板、窗口等输入状态），
+                   只读工具可以与其他只读工具并行执行
     """
     name: str
     description: str
     parameters: List[ToolParameter] = field(default_factory=list)
     skill_path: str = ""
     skill_action: str = ""
+    read_only: bool = False
     
     def to_ollama_format(self) -> Dict[str, Any]:
         """
@@ -108,7 +111,8 @@ DESKTOP_TOOLS: List[ToolDefinition] = [
             ToolParameter("region", "array", "截图区域 [x, y, width, height]，不指定则为全屏", required=False),
         ],
         skill_path="skills/fusion-desktop/scripts/desktop.py",
-        skill_action="screenshot"
+        skill_action="screenshot",
+        read_only=True
     ),
     ToolDefinition(
         name="desktop_move",
@@ -116,7 +120,7 @@ DESKTOP_TOOLS: List[ToolDefinition] = [
         parameters=[
             ToolParameter("x", "integer", "目标X坐标", required=True),
             ToolParameter("y", "integer", "目标Y坐标", required=True),
-            ToolParameter("duration", "number", "移动持续时间(秒)", default=0.2),
+            ToolParameter("duration", "number", "移动持续时间(秒)，0为直接移动", default=0.0),
         ],
         skill_path="skills/fusion-desktop/scripts/desktop.py",
         skill_action="move"
@@ -129,7 +133,7 @@ DESKTOP_TOOLS: List[ToolDefinition] = [
             ToolParameter("y", "integer", "点击位置Y坐标", required=True),
             ToolParameter("button", "string", "鼠标按钮", enum=["left", "right", "middle"], default="left"),
             ToolParameter("clicks", "integer", "点击次数", default=1),
-            ToolParameter("duration", "number", "点击持续时间(秒)", default=0.1),
+            ToolParameter("duration", "number", "移动到点击位置的持续时间(秒)", default=0.0),
         ],
         skill_path="skills/fusion-desktop/scripts/desktop.py",
         skill_action="click"
@@ -160,7 +164,7 @@ DESKTOP_TOOLS: List[ToolDefinition] = [
         parameters=[
             ToolParameter("start", "array", "起点坐标 [x, y]", required=True),
             ToolParameter("end", "array", "终点坐标 [x, y]", required=True),
-            ToolParameter("duration", "number", "拖拽持续时间(秒)", default=0.5),
+            ToolParameter("duration", "number", "按住按键移动到终点的持续时间(秒)，过短时部分程序不会开始拖放", default=0.2),
         ],
         skill_path="skills/fusion-desktop/scripts/desktop.py",
         skill_action="drag"
@@ -182,7 +186,8 @@ DESKTOP_TOOLS: List[ToolDefinition] = [
         description="获取当前鼠标光标位置",
         parameters=[],
         skill_path="skills/fusion-desktop/scripts/desktop.py",
-        skill_action="position"
+        skill_action="position",
+        read_only=True
     ),
     ToolDefinition(
         name="desktop_type",
@@ -220,7 +225,8 @@ DESKTOP_TOOLS: List[ToolDefinition] = [
             ToolParameter("confidence", "number", "匹配置信度(0-1)", default=0.9),
         ],
         skill_path="skills/fusion-desktop/scripts/desktop.py",
-        skill_action="locate"
+        skill_action="locate",
+        read_only=True
     ),
     ToolDefinition(
         name="desktop_locate_and_click",
@@ -232,6 +238,23 @@ DESKTOP_TOOLS: List[ToolDefinition] = [
         skill_path="skills/fusion-desktop/scripts/desktop.py",
         skill_action="locate_and_click"
     ),
+    ToolDefinition(
+        name="desktop_batch",
+        description="按顺序批量执行多个桌面操作（点击、输入、按键等），一次调用完成整个操作序列，如填写表单",
+        parameters=[
+            ToolParameter(
+                "steps", "array",
+                "操作步骤列表，每项形如 {\"action\": \"click\", \"params\": {\"x\": 100, \"y\": 200}}。"
+                "action可选: move, click, double_click, right_click, drag, scroll, type, key, hotkey, "
+                "screenshot, position, locate, locate_and_click，params与对应desktop工具的参数相同",
+                required=True
+            ),
+            ToolParameter("delay", "number", "步骤之间的间隔(秒)", default=0.0),
+            ToolParameter("stop_on_error", "boolean", "某一步失败时是否停止执行后续步骤", default=True),
+        ],
+        skill_path="skills/fusion-desktop/scripts/desktop.py",
+        skill_action="batch"
+    ),
 ]
 
 SCREEN_TOOLS: List[ToolDefinition] = [
@@ -242,7 +265,8 @@ SCREEN_TOOLS: List[ToolDefinition] = [
             ToolParameter("region", "array", "截图区域 [x, y, width, height](可选)", required=False),
         ],
         skill_path="skills/fusion-screen/scripts/screen.py",
-        skill_action="screenshot_base64"
+        skill_action="screenshot_base64",
+        read_only=True
     ),
     ToolDefinition(
         name="screen_ocr",
@@ -252,14 +276,16 @@ SCREEN_TOOLS: List[ToolDefinition] = [
             ToolParameter("lang", "string", "OCR语言，如: chi_sim, eng", default="chi_sim"),
         ],
         skill_path="skills/fusion-screen/scripts/screen.py",
-        skill_action="ocr"
+        skill_action="ocr",
+        read_only=True
     ),
     ToolDefinition(
         name="screen_get_size",
         description="获取屏幕尺寸信息",
         parameters=[],
         skill_path="skills/fusion-screen/scripts/screen.py",
-        skill_action="get_screen_size"
+        skill_action="get_screen_size",
+        read_only=True
     ),
 ]
 
@@ -278,14 +304,16 @@ CLIPBOARD_TOOLS: List[ToolDefinition] = [
         description="从剪贴板粘贴文本",
         parameters=[],
         skill_path="skills/fusion-clipboard/scripts/clipboard.py",
-        skill_action="paste"
+        skill_action="paste",
+        read_only=True
     ),
     ToolDefinition(
         name="clipboard_get",
         description="获取剪贴板当前内容",
         parameters=[],
         skill_path="skills/fusion-clipboard/scripts/clipboard.py",
-        skill_action="get"
+        skill_action="get",
+        read_only=True
     ),
     ToolDefinition(
         name="clipboard_clear",
@@ -302,7 +330,8 @@ WINDOW_TOOLS: List[ToolDefinition] = [
         description="列出所有打开的窗口",
         parameters=[],
         skill_path="skills/fusion-window/scripts/window.py",
-        skill_action="list"
+        skill_action="list",
+        read_only=True
     ),
     ToolDefinition(
         name="window_find",
@@ -311,7 +340,8 @@ WINDOW_TOOLS: List[ToolDefinition] = [
             ToolParameter("title", "string", "窗口标题(支持模糊匹配)", required=True),
         ],
         skill_path="skills/fusion-window/scripts/window.py",
-        skill_action="find"
+        skill_action="find",
+        read_only=True
     ),
     ToolDefinition(
         name="window_activate",
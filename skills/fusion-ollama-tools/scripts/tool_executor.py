@@ -8,14 +8,31 @@ tool_executor.py - 工具执行器模块
 日期: 2026-02-17
 """
 
+import asyncio
 import subprocess
 import json
 import os
 import sys
-from typing import Dict, Any, Optional, List
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, Any, Optional, List, Tuple
 from dataclasses import dataclass
 import time
 
+from skill_worker import (
+    SkillWorkerPool,
+    SkillWorkerError,
+    SkillWorkerTimeout,
+    SkillWorkerUnavailable,
+    load_skill_module
+)
+from skill_forkserver import SkillForkServer, FORK_AVAILABLE
+from tool_cache import ToolResultCache
+from tool_validation import ToolCallValidator
+
+
+EXECUTION_MODES = ("spawn", "worker", "inprocess", "forkserver")
+
 
 @dataclass
 class ExecutionResult:
@@ -28,12 +45,14 @@ class ExecutionResult:
         result: 执行结果数据
         error: 错误信息
         duration: 执行耗时(秒)
+        cached: 是否来自只读工具结果缓存
     """
     success: bool
     tool_name: str
     result: Dict[str, Any]
     error: Optional[str] = None
     duration: float = 0.0
+    cached: bool = False
     
     def to_dict(self) -> Dict[str, Any]:
         """
@@ -47,7 +66,8 @@ class ExecutionResult:
             "tool_name": self.tool_name,
             "result": self.result,
             "error": self.error,
-            "duration": self.duration
+            "duration": self.duration,
+            "cached": self.cached
         }
     
     def to_ollama_tool_response(self) -> Dict[str, Any]:
@@ -64,22 +84,137 @@ class ExecutionResult:
         }
 
 
+def is_read_only_tool(tool_name: str, tool_registry: Dict[str, Dict[str, Any]]) -> bool:
+    """
+    判断工具是否为只读工具
+    
+    Args:
+        tool_name: 工具名称
+        tool_registry: 工具注册表
+        
+    Returns:
+        bool: 只读返回True；未注册或未标注的工具按会改变输入状态处理
+    """
+    return bool(tool_registry.get(tool_name, {}).get("read_only", False))
+
+
+def plan_tool_batches(
+    tool_calls: List[Dict[str, Any]],
+    tool_registry: Dict[str, Dict[str, Any]]
+) -> List[List[int]]:
+    """
+    将一轮工具调用划分为按顺序执行的批次
+    
+    连续的只读调用合并为一个可并行的批次；每个会改变输入状态的调用
+    单独成为一个批次，保证它与前后调用之间的先后顺序不变。
+    
+    Args:
+        tool_calls: Ollama返回的工具调用列表
+        tool_registry: 工具注册表
+        
+    Returns:
+        List[List[int]]: 批次列表，每个批次为tool_calls中的下标列表
+    """
+    batches: List[List[int]] = []
+    read_batch: List[int] = []
+    
+    for index, tool_call in enumerate(tool_calls):
+        tool_name = tool_call.get("function", {}).get("name", "")
+        if is_read_only_tool(tool_name, tool_registry):
+            read_batch.append(index)
+            continue
+        if read_batch:
+            batches.append(read_batch)
+            read_batch = []
+        batches.append([index])
+    
+    if read_batch:
+        batches.append(read_batch)
+    return batches
+
+
+def validate_tool_arguments(
+    validator: Optional[ToolCallValidator],
+    tool_name: str,
+    arguments: Any
+) -> Tuple[Any, Optional[ExecutionResult]]:
+    """
+    执行前校验工具参数
+    
+    Args:
+        validator: 工具参数校验器，为None时不校验
+        tool_name: 工具名称
+        arguments: 模型给出的参数
+        
+    Returns:
+        Tuple: (修复后的参数, 被拒绝时的失败结果或None)
+    """
+    if validator is None:
+        return arguments, None
+    check = validator.validate(tool_name, arguments)
+    if check is None:
+        return arguments, None
+    if check.errors:
+        message = check.error_message()
+        return arguments, ExecutionResult(
+            success=False,
+            tool_name=tool_name,
+            result={"status": "error", "message": message},
+            error=message
+        )
+    return check.arguments, None
+
+
 class ToolExecutor:
     """
     工具执行器类
     
     负责将Ollama工具调用转换为实际的技能脚本执行。
+    
+    执行模式:
+        spawn: 每次调用启动一个新的Python进程（默认）
+        worker: 每个技能脚本一个常驻工作进程，失败时回退到spawn
+        inprocess: 直接导入技能脚本并调用其actions表中的函数（仅用于可信部署）
+        forkserver: 预热导入的服务器为每次调用fork一个子进程，保留进程隔离；
+                    不支持fork的平台或服务器不可用时回退到spawn
     """
     
-    def __init__(self, base_path: str = ""):
+    def __init__(
+        self, 
+        base_path: str = "", 
+        execution_mode: str = "spawn",
+        max_parallel: int = 4,
+        result_cache: Optional[ToolResultCache] = None,
+        validator: Optional[ToolCallValidator] = None
+    ):
         """
         初始化工具执行器
         
         Args:
             base_path: 技能脚本的基础路径前缀
+            execution_mode: Python技能的执行模式，见EXECUTION_MODES
+            max_parallel: 同一轮中只读工具调用的最大并行数，1表示完全串行
+            result_cache: 只读工具结果缓存，为None时不缓存
+            validator: 工具参数校验器；设置后执行前修复可修复的参数，拒绝无法修复的调用
+                       （不启动技能脚本），为None时不校验
         """
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(
+                f"Unknown execution mode: {execution_mode}, "
+                f"expected one of {EXECUTION_MODES}"
+            )
         self.base_path = base_path
+        self.execution_mode = execution_mode
         self._skill_cache: Dict[str, Dict[str, Any]] = {}
+        self._skill_cache_lock = threading.Lock()
+        self._worker_pool: Optional[SkillWorkerPool] = None
+        self._forkserver: Optional[SkillForkServer] = None
+        self._process_lock = threading.Lock()
+        self.result_cache = result_cache
+        self.validator = validator
+        self.max_parallel = max(1, max_parallel)
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._thread_pool_lock = threading.Lock()
     
     def _get_skill_script_path(self, skill_path: str) -> str:
         """
@@ -113,6 +248,165 @@ class ToolExecutor:
             Dict: 执行结果
         """
         full_path = self._get_skill_script_path(script_path)
+        
+        if self.execution_mode == "worker":
+            result = self._execute_in_worker(full_path, action, params)
+            if result is not None:
+                return result
+        elif self.execution_mode == "forkserver" and FORK_AVAILABLE:
+            result = self._execute_in_forkserver(full_path, action, params)
+            if result is not None:
+                return result
+        
+        return self._spawn_python_skill(full_path, action, params)
+    
+    def _get_skill_actions(self, full_path: str) -> Dict[str, Any]:
+        """
+        导入技能脚本并返回其actions表（按路径缓存）
+        
+        Args:
+            full_path: 脚本完整路径
+            
+        Returns:
+            Dict: {动作名称: 动作函数}
+        """
+        key = os.path.abspath(full_path)
+        with self._skill_cache_lock:
+            actions = self._skill_cache.get(key)
+            if actions is None:
+                actions = load_skill_module(key).actions
+                self._skill_cache[key] = actions
+        return actions
+    
+    def _execute_inprocess_skill(
+        self, 
+        script_path: str, 
+        action: str, 
+        params: Dict[str, Any]
+    ) -> Tuple[Dict[str, Any], float]:
+        """
+        在当前进程内直接调用技能动作
+        
+        Args:
+            script_path: 脚本路径
+            action: 动作名称
+            params: 参数字典
+            
+        Returns:
+            Tuple[Dict, float]: (执行结果, 动作本身的耗时(秒))
+        """
+        full_path = self._get_skill_script_path(script_path)
+        
+        try:
+            actions = self._get_skill_actions(full_path)
+        except Exception as e:
+            return {"status": "error", "message": f"Failed to load skill: {e}"}, 0.0
+        
+        func = actions.get(action)
+        if func is None:
+            return {"status": "error", "message": f"Unknown action: {action}"}, 0.0
+        
+        start_time = time.perf_counter()
+        try:
+            result = func(dict(params))
+        except Exception as e:
+            result = {"status": "error", "action": action, "message": str(e)}
+        return result, time.perf_counter() - start_time
+    
+    def _get_worker_pool(self) -> SkillWorkerPool:
+        """
+        获取（必要时创建）常驻工作进程池
+        
+        Returns:
+            SkillWorkerPool: 工作进程池
+        """
+        with self._process_lock:
+            if self._worker_pool is None:
+                self._worker_pool = SkillWorkerPool()
+            return self._worker_pool
+    
+    def _get_forkserver(self) -> SkillForkServer:
+        """
+        获取（必要时创建）fork服务器客户端
+        
+        Returns:
+            SkillForkServer: fork服务器客户端
+        """
+        with self._process_lock:
+            if self._forkserver is None:
+                self._forkserver = SkillForkServer()
+            return self._forkserver
+    
+    def _execute_in_worker(
+        self, 
+        full_path: str, 
+        action: str, 
+        params: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        在常驻工作进程中执行Python技能
+        
+        Args:
+            full_path: 脚本完整路径
+            action: 动作名称
+            params: 参数字典
+            
+        Returns:
+            Dict: 执行结果；工作进程没有收到请求时返回None，由调用方回退到spawn
+                （工作进程在执行中退出时动作可能已部分执行，返回错误而不是再执行一次）
+        """
+        try:
+            return self._get_worker_pool().call(full_path, action, params, timeout=60)
+        except SkillWorkerTimeout:
+            return {"status": "error", "message": "Execution timeout (60s)"}
+        except SkillWorkerUnavailable:
+            return None
+        except SkillWorkerError as e:
+            return {"status": "error", "message": str(e)}
+    
+    def _execute_in_forkserver(
+        self, 
+        full_path: str, 
+        action: str, 
+        params: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        通过fork服务器在独立子进程中执行Python技能
+        
+        Args:
+            full_path: 脚本完整路径
+            action: 动作名称
+            params: 参数字典
+            
+        Returns:
+            Dict: 执行结果；服务器没有收到请求时返回None，由调用方回退到spawn
+        """
+        try:
+            return self._get_forkserver().call(full_path, action, params, timeout=60)
+        except SkillWorkerTimeout:
+            return {"status": "error", "message": "Execution timeout (60s)"}
+        except SkillWorkerUnavailable:
+            return None
+        except SkillWorkerError as e:
+            return {"status": "error", "message": str(e)}
+    
+    def _spawn_python_skill(
+        self, 
+        full_path: str, 
+        action: str, 
+        params: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        在新的Python进程中一次性执行技能脚本
+        
+        Args:
+            full_path: 脚本完整路径
+            action: 动作名称
+            params: 参数字典
+            
+        Returns:
+            Dict: 执行结果
+        """
         params_json = json.dumps(params, ensure_ascii=False)
         
         try:
@@ -193,6 +487,33 @@ class ToolExecutor:
         """
         执行工具调用
         
+        Args:
+            tool_name: 工具名称
+            arguments: 工具参数
+            skill_path: 技能脚本路径
+            skill_action: 技能动作名称
+            
+        Returns:
+            ExecutionResult: 执行结果
+        """
+        if self.result_cache is not None:
+            return self.result_cache.get_or_execute(
+                tool_name,
+                arguments,
+                lambda: self._execute_tool_uncached(tool_name, arguments, skill_path, skill_action)
+            )
+        return self._execute_tool_uncached(tool_name, arguments, skill_path, skill_action)
+    
+    def _execute_tool_uncached(
+        self, 
+        tool_name: str, 
+        arguments: Dict[str, Any],
+        skill_path: str,
+        skill_action: str
+    ) -> ExecutionResult:
+        """
+        执行工具调用（不经过结果缓存）
+        
         Args:
             tool_name: 工具名称
             arguments: 工具参数
@@ -203,9 +524,14 @@ class ToolExecutor:
             ExecutionResult: 执行结果
         """
         start_time = time.time()
+        action_duration = None
         
         try:
-            if skill_path.endswith('.py'):
+            if skill_path.endswith('.py') and self.execution_mode == "inprocess":
+                result, action_duration = self._execute_inprocess_skill(
+                    skill_path, skill_action, arguments
+                )
+            elif skill_path.endswith('.py'):
                 result = self._execute_python_skill(skill_path, skill_action, arguments)
             elif skill_path.endswith('.js'):
                 result = self._execute_node_skill(skill_path, skill_action, arguments)
@@ -213,7 +539,10 @@ class ToolExecutor:
                 result = {"status": "error", "message": f"Unknown script type: {skill_path}"}
             
             success = result.get("status") == "success"
-            duration = time.time() - start_time
+            if action_duration is not None:
+                duration = action_duration
+            else:
+                duration = time.time() - start_time
             
             return ExecutionResult(
                 success=success,
@@ -233,6 +562,60 @@ class ToolExecutor:
                 duration=duration
             )
     
+    def _execute_tool_call(
+        self, 
+        tool_call: Dict[str, Any],
+        tool_registry: Dict[str, Dict[str, Any]]
+    ) -> ExecutionResult:
+        """
+        执行单个Ollama工具调用
+        
+        Args:
+            tool_call: Ollama返回的工具调用
+            tool_registry: 工具注册表
+            
+        Returns:
+            ExecutionResult: 执行结果
+        """
+        func = tool_call.get("function", {})
+        tool_name = func.get("name", "")
+        arguments = func.get("arguments", {})
+        
+        if tool_name not in tool_registry:
+            return ExecutionResult(
+                success=False,
+                tool_name=tool_name,
+                result={},
+                error=f"Unknown tool: {tool_name}"
+            )
+        
+        arguments, rejected = validate_tool_arguments(self.validator, tool_name, arguments)
+        if rejected is not None:
+            return rejected
+        
+        tool_info = tool_registry[tool_name]
+        return self.execute_tool(
+            tool_name=tool_name,
+            arguments=arguments,
+            skill_path=tool_info.get("skill_path", ""),
+            skill_action=tool_info.get("skill_action", "")
+        )
+    
+    def _get_thread_pool(self) -> ThreadPoolExecutor:
+        """
+        获取（必要时创建）并行执行只读工具的线程池
+        
+        Returns:
+            ThreadPoolExecutor: 线程池
+        """
+        with self._thread_pool_lock:
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(
+                    max_workers=self.max_parallel,
+                    thread_name_prefix="tool-call"
+                )
+            return self._thread_pool
+    
     def execute_tool_calls(
         self, 
         tool_calls: List[Dict[str, Any]],
@@ -241,37 +624,375 @@ class ToolExecutor:
         """
         批量执行工具调用
         
+        连续的只读工具调用在线程池中并行执行，会改变输入状态的工具调用
+        按模型给出的顺序逐个执行，并作为前后只读批次之间的屏障。
+        返回结果与tool_calls的顺序一致。
+        
         Args:
             tool_calls: Ollama返回的工具调用列表
-            tool_registry: 工具注册表 {tool_name: {skill_path, skill_action}}
+            tool_registry: 工具注册表 {tool_name: {skill_path, skill_action, read_only}}
             
         Returns:
             List[ExecutionResult]: 执行结果列表
         """
-        results = []
+        results: List[Optional[ExecutionResult]] = [None] * len(tool_calls)
         
-        for tool_call in tool_calls:
-            func = tool_call.get("function", {})
-            tool_name = func.get("name", "")
-            arguments = func.get("arguments", {})
+        for batch in plan_tool_batches(tool_calls, tool_registry):
+            if len(batch) == 1 or self.max_parallel == 1:
+                for index in batch:
+                    results[index] = self._execute_tool_call(tool_calls[index], tool_registry)
+                continue
             
-            if tool_name in tool_registry:
-                tool_info = tool_registry[tool_name]
-                result = self.execute_tool(
-                    tool_name=tool_name,
-                    arguments=arguments,
-                    skill_path=tool_info.get("skill_path", ""),
-                    skill_action=tool_info.get("skill_action", "")
-                )
-            else:
-                result = ExecutionResult(
-                    success=False,
-                    tool_name=tool_name,
-                    result={},
-                    error=f"Unknown tool: {tool_name}"
-                )
+            pool = self._get_thread_pool()
+            futures = [
+                (index, pool.submit(self._execute_tool_call, tool_calls[index], tool_registry))
+                for index in batch
+            ]
+            for index, future in futures:
+                results[index] = future.result()
+        
+        return results
+    
+    def close(self) -> None:
+        """
+        释放执行器持有的常驻进程
+        """
+        with self._process_lock:
+            worker_pool, self._worker_pool = self._worker_pool, None
+            forkserver, self._forkserver = self._forkserver, None
+        if worker_pool is not None:
+            worker_pool.shutdown()
+        if forkserver is not None:
+            forkserver.shutdown()
+        with self._thread_pool_lock:
+            if self._thread_pool is not None:
+                self._thread_pool.shutdown(wait=True)
+                self._thread_pool = None
+
+
+class PipelinedToolDispatcher:
+    """
+    流水线工具调度器
+
+    在模型仍在流式输出时，每收到一个完整的工具调用就立即提交执行:
+    只读调用只需等待之前最后一个会改变输入状态的调用完成；会改变输入状态的调用
+    等待之前所有调用完成后才执行，并成为后续调用的屏障。因此执行顺序与
+    execute_tool_calls的批次划分一致，但第一个工具可以与剩余的生成过程重叠。
+
+    任务提交到执行器的FIFO线程池，每个任务只等待更早提交（因而已被取出执行）
+    的任务，不会因线程池占满而死锁。
+    """
+
+    def __init__(
+        self,
+        executor: ToolExecutor,
+        tool_registry: Dict[str, Dict[str, Any]]
+    ):
+        """
+        初始化调度器
+
+        Args:
+            executor: 工具执行器
+            tool_registry: 工具注册表
+        """
+        self.executor = executor
+        self.tool_registry = tool_registry
+        self.tool_calls: List[Dict[str, Any]] = []
+        self._futures: List[Future] = []
+        self._barrier: Optional[Future] = None
+        self._since_barrier: List[Future] = []
+        self._timings: List[Tuple[float, float]] = []
+        self._lock = threading.Lock()
+
+    def _run(self, index: int, tool_call: Dict[str, Any], wait_for: List[Future]) -> ExecutionResult:
+        """
+        等待依赖的调用完成后执行工具调用，并记录开始/结束时间
+
+        Args:
+            index: 调用序号
+            tool_call: Ollama工具调用
+            wait_for: 需要先完成的调用
+
+        Returns:
+            ExecutionResult: 执行结果
+        """
+        for future in wait_for:
+            future.exception()
+        start = time.perf_counter()
+        try:
+            return self.executor._execute_tool_call(tool_call, self.tool_registry)
+        finally:
+            with self._lock:
+                self._timings[index] = (start, time.perf_counter())
+
+    def submit(self, tool_call: Dict[str, Any]) -> Future:
+        """
+        提交一个工具调用
+
+        Args:
+            tool_call: Ollama返回的工具调用
+
+        Returns:
+            Future: 结果为ExecutionResult的Future
+        """
+        tool_name = tool_call.get("function", {}).get("name", "")
+        index = len(self.tool_calls)
+        self.tool_calls.append(tool_call)
+        with self._lock:
+            self._timings.append((0.0, 0.0))
+
+        read_only = is_read_only_tool(tool_name, self.tool_registry)
+        wait_for = [self._barrier] if self._barrier is not None else []
+        if not read_only:
+            wait_for += self._since_barrier
+
+        future = self.executor._get_thread_pool().submit(self._run, index, tool_call, wait_for)
+
+        if read_only:
+            self._since_barrier.append(future)
+        else:
+            self._barrier = future
+            self._since_barrier = []
+        self._futures.append(future)
+        return future
+
+    def results(self) -> List[ExecutionResult]:
+        """
+        等待所有已提交的调用完成
+
+        Returns:
+            List[ExecutionResult]: 与提交顺序一致的执行结果
+        """
+        return [future.result() for future in self._futures]
+
+    def wait(self) -> None:
+        """
+        等待所有已提交的调用结束（不关心结果），用于请求中途失败时的清理
+        """
+        wait(self._futures)
+
+    def tool_span(self) -> Tuple[float, float]:
+        """
+        获取工具执行的时间跨度
+
+        Returns:
+            Tuple[float, float]: (最早开始时间, 最晚结束时间)，均为perf_counter值；
+                                 没有调用时为(0.0, 0.0)
+        """
+        with self._lock:
+            timings = list(self._timings)
+        if not timings:
+            return (0.0, 0.0)
+        return (min(start for start, _ in timings), max(end for _, end in timings))
+
+
+class AsyncToolExecutor:
+    """
+    异步工具执行器
+    
+    使用asyncio.create_subprocess_exec执行技能脚本，不阻塞事件循环。
+    取消正在等待的execute_tool/execute_tool_calls任务时，对应的技能子进程会被终止。
+    """
+    
+    def __init__(
+        self, 
+        base_path: str = "", 
+        timeout: float = 60,
+        max_parallel: int = 4,
+        validator: Optional[ToolCallValidator] = None
+    ):
+        """
+        初始化异步工具执行器
+        
+        Args:
+            base_path: 技能脚本的基础路径前缀
+            timeout: 单次技能执行的超时时间(秒)
+            max_parallel: 同一轮中只读工具调用的最大并行数
+            validator: 工具参数校验器，见ToolExecutor
+        """
+        self.base_path = base_path
+        self.timeout = timeout
+        self.max_parallel = max(1, max_parallel)
+        self.validator = validator
+    
+    def _get_skill_script_path(self, skill_path: str) -> str:
+        """
+        获取技能脚本的完整路径
+        
+        Args:
+            skill_path: 相对技能路径
             
-            results.append(result)
+        Returns:
+            str: 完整路径
+        """
+        if self.base_path:
+            return os.path.join(self.base_path, skill_path)
+        return skill_path
+    
+    async def _run_skill_process(
+        self, 
+        program: str, 
+        script_path: str, 
+        action: str, 
+        params: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        在子进程中执行技能脚本
+        
+        Args:
+            program: 解释器 (python/node)
+            script_path: 脚本路径
+            action: 动作名称
+            params: 参数字典
+            
+        Returns:
+            Dict: 执行结果
+        """
+        full_path = self._get_skill_script_path(script_path)
+        params_json = json.dumps(params, ensure_ascii=False)
+        
+        try:
+            process = await asyncio.create_subprocess_exec(
+                program, full_path, action, params_json,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+        
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            await self._kill(process)
+            return {"status": "error", "message": f"Execution timeout ({self.timeout}s)"}
+        except asyncio.CancelledError:
+            await self._kill(process)
+            raise
+        
+        if process.returncode != 0:
+            return {
+                "status": "error",
+                "message": stderr.decode("utf-8", errors="replace") or f"Exit code: {process.returncode}"
+            }
+        
+        try:
+            return json.loads(stdout.decode("utf-8"))
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            return {"status": "error", "message": f"JSON parse error: {e}"}
+    
+    @staticmethod
+    async def _kill(process: "asyncio.subprocess.Process") -> None:
+        """终止技能子进程并回收"""
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+        await process.wait()
+    
+    async def execute_tool(
+        self, 
+        tool_name: str, 
+        arguments: Dict[str, Any],
+        skill_path: str,
+        skill_action: str
+    ) -> ExecutionResult:
+        """
+        异步执行工具调用
+        
+        Args:
+            tool_name: 工具名称
+            arguments: 工具参数
+            skill_path: 技能脚本路径
+            skill_action: 技能动作名称
+            
+        Returns:
+            ExecutionResult: 执行结果
+        """
+        start_time = time.time()
+        
+        if skill_path.endswith('.py'):
+            result = await self._run_skill_process("python", skill_path, skill_action, arguments)
+        elif skill_path.endswith('.js'):
+            result = await self._run_skill_process("node", skill_path, skill_action, arguments)
+        else:
+            result = {"status": "error", "message": f"Unknown script type: {skill_path}"}
+        
+        success = result.get("status") == "success"
+        return ExecutionResult(
+            success=success,
+            tool_name=tool_name,
+            result=result,
+            error=None if success else result.get("message"),
+            duration=time.time() - start_time
+        )
+    
+    async def _execute_tool_call(
+        self, 
+        tool_call: Dict[str, Any],
+        tool_registry: Dict[str, Dict[str, Any]]
+    ) -> ExecutionResult:
+        """
+        异步执行单个Ollama工具调用
+        
+        Args:
+            tool_call: Ollama返回的工具调用
+            tool_registry: 工具注册表
+            
+        Returns:
+            ExecutionResult: 执行结果
+        """
+        func = tool_call.get("function", {})
+        tool_name = func.get("name", "")
+        arguments = func.get("arguments", {})
+        
+        if tool_name not in tool_registry:
+            return ExecutionResult(
+                success=False,
+                tool_name=tool_name,
+                result={},
+                error=f"Unknown tool: {tool_name}"
+            )
+        
+        arguments, rejected = validate_tool_arguments(self.validator, tool_name, arguments)
+        if rejected is not None:
+            return rejected
+        
+        tool_info = tool_registry[tool_name]
+        return await self.execute_tool(
+            tool_name=tool_name,
+            arguments=arguments,
+            skill_path=tool_info.get("skill_path", ""),
+            skill_action=tool_info.get("skill_action", "")
+        )
+    
+    async def execute_tool_calls(
+        self, 
+        tool_calls: List[Dict[str, Any]],
+        tool_registry: Dict[str, Dict[str, Any]]
+    ) -> List[ExecutionResult]:
+        """
+        批量异步执行工具调用
+        
+        调度规则与ToolExecutor.execute_tool_calls相同：连续的只读调用并发执行，
+        会改变输入状态的调用按顺序逐个执行。返回结果与tool_calls的顺序一致。
+        
+        Args:
+            tool_calls: Ollama返回的工具调用列表
+            tool_registry: 工具注册表
+            
+        Returns:
+            List[ExecutionResult]: 执行结果列表
+        """
+        results: List[Optional[ExecutionResult]] = [None] * len(tool_calls)
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        
+        async def run(index: int) -> None:
+            async with semaphore:
+                results[index] = await self._execute_tool_call(tool_calls[index], tool_registry)
+        
+        for batch in plan_tool_batches(tool_calls, tool_registry):
+            await asyncio.gather(*(run(index) for index in batch))
         
         return results
 
@@ -281,8 +1002,19 @@ class MockToolExecutor(ToolExecutor):
     模拟工具执行器（用于测试）
     
     不实际执行脚本，返回模拟结果。
+    部分工具的模拟结果带有与真实技能脚本相同的字段（如desktop_locate的center_x/center_y），
+    以便计划中的步骤引用。
     """
     
+    MOCK_OUTPUTS: Dict[str, Dict[str, Any]] = {
+        "desktop_locate": {
+            "found": True, "left": 600, "top": 340, "width": 80, "height": 40,
+            "center_x": 640, "center_y": 360
+        },
+        "desktop_position": {"x": 640, "y": 360},
+        "screen_get_size": {"width": 1920, "height": 1080},
+    }
+    
     def execute_tool(
         self, 
         tool_name: str, 
@@ -309,7 +1041,8 @@ class MockToolExecutor(ToolExecutor):
                 "status": "success",
                 "action": skill_action,
                 "params": arguments,
-                "mock": True
+                "mock": True,
+                **self.MOCK_OUTPUTS.get(tool_name, {})
             },
             error=None,
             duration=0.001
@@ -321,7 +1054,7 @@ def create_tool_registry() -> Dict[str, Dict[str, Any]]:
     创建工具注册表
     
     Returns:
-        Dict: 工具注册表 {tool_name: {skill_path, skill_action}}
+        Dict: 工具注册表 {tool_name: {skill_path, skill_action, description, read_only}}
     """
     from tool_definitions import ALL_TOOLS
     
@@ -330,7 +1063,8 @@ def create_tool_registry() -> Dict[str, Dict[str, Any]]:
         registry[tool.name] = {
             "skill_path": tool.skill_path,
             "skill_action": tool.skill_action,
-            "description": tool.description
+            "description": tool.description,
+            "read_only": tool.read_only
         }
     return registry
 
@@ -0,0 +1,298 @@
+"""
+tool_plan.py - 先规划后执行模块
+
+"截屏→保存→打开浏览器"这样的多步任务在迭代式工具循环中每一步都要一次模型往返。
+规划模式下模型通过run_plan工具一次给出按顺序执行的工具调用计划：
+1. 步骤之间可以引用之前步骤的结果，如 {"x": "$s1.center_x", "y": "$s1.center_y"}
+2. 计划在本地一次执行完，只有某一步失败或步骤要求观察（observe）时才把结果交给模型
+3. 计划全部成功时直接使用计划中的final作为回复，不再请求模型
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import json
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+
+from deadline_budget import DeadlineBudget
+from tool_definitions import ToolDefinition, ToolParameter
+from tool_executor import ToolExecutor
+
+
+PLAN_TOOL_NAME = "run_plan"
+
+PLAN_TOOL = ToolDefinition(
+    name=PLAN_TOOL_NAME,
+    description=(
+        "一次提交按顺序执行的多步工具调用计划，所有步骤在本地连续执行，不需要每一步都等待回复。"
+        "需要多个工具调用才能完成的任务应优先使用本工具"
+    ),
+    parameters=[
+        ToolParameter(
+            "steps", "array",
+            "步骤列表，每项形如 {\"id\": \"s1\", \"tool\": \"desktop_locate\", \"arguments\": {\"image\": \"icon.png\"}}。"
+            "arguments中可以用\"$s1.center_x\"形式引用之前步骤结果中的字段；"
+            "需要先看到某一步的结果才能决定后续操作时，给该步加上\"observe\": true，执行到该步后会把结果返回给你",
+            required=True
+        ),
+        ToolParameter("final", "string", "所有步骤成功后回复用户的话", required=False),
+    ]
+)
+
+PLAN_SYSTEM_PROMPT = (
+    "你可以直接调用工具，也可以调用run_plan一次提交多个步骤的计划。"
+    "多步任务请使用run_plan：步骤按顺序在本地执行，参数中用\"$步骤id.字段\"引用之前步骤的结果"
+    "（例如用\"$s1.center_x\"引用desktop_locate找到的位置）。"
+    "某一步失败或标记了observe时，你会收到已执行步骤的结果，再决定下一步。"
+)
+
+# "$s1.center_x"：步骤id加上一个或多个字段（数组下标用数字）
+REFERENCE_PATTERN = re.compile(r"\$([A-Za-z_]\w*)((?:\.\w+)+)")
+
+
+class PlanReferenceError(ValueError):
+    """计划中的引用无法解析"""
+
+
+@dataclass
+class PlanStep:
+    """
+    计划中的一个步骤
+
+    Attributes:
+        id: 步骤ID，供后续步骤引用
+        tool: 工具名称
+        arguments: 工具参数（可包含引用）
+        observe: 执行完该步后是否把结果交给模型
+    """
+    id: str
+    tool: str
+    arguments: Dict[str, Any] = field(default_factory=dict)
+    observe: bool = False
+
+
+def _loads(value: Any) -> Any:
+    """模型把对象写成JSON字符串时解析它"""
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return value
+    return value
+
+
+def parse_plan(arguments: Any) -> Tuple[List[PlanStep], Optional[str], List[str]]:
+    """
+    解析run_plan的参数
+
+    Args:
+        arguments: run_plan工具调用的参数
+
+    Returns:
+        Tuple: (步骤列表, final, 错误列表)
+    """
+    arguments = _loads(arguments)
+    if not isinstance(arguments, dict):
+        return [], None, ["run_plan arguments must be an object"]
+    raw_steps = _loads(arguments.get("steps"))
+    if not isinstance(raw_steps, list) or not raw_steps:
+        return [], None, ["run_plan requires a non-empty steps list"]
+
+    steps: List[PlanStep] = []
+    errors: List[str] = []
+    for index, raw in enumerate(raw_steps):
+        raw = _loads(raw)
+        if not isinstance(raw, dict) or not isinstance(raw.get("tool"), str):
+            errors.append(f"step {index + 1}: missing tool name")
+            continue
+        step_arguments = _loads(raw.get("arguments")) or {}
+        if not isinstance(step_arguments, dict):
+            errors.append(f"step {index + 1}: arguments must be an object")
+            continue
+        steps.append(PlanStep(
+            id=str(raw.get("id") or f"s{index + 1}"),
+            tool=raw["tool"],
+            arguments=step_arguments,
+            observe=bool(raw.get("observe"))
+        ))
+    final = arguments.get("final")
+    return steps, final if isinstance(final, str) else None, errors
+
+
+def _lookup(step_id: str, fields: str, outputs: Dict[str, Any]) -> Any:
+    """按字段路径取出步骤结果中的值"""
+    value = outputs[step_id]
+    for name in fields.strip(".").split("."):
+        if isinstance(value, dict) and name in value:
+            value = value[name]
+        elif isinstance(value, list) and name.isdigit() and int(name) < len(value):
+            value = value[int(name)]
+        else:
+            raise PlanReferenceError(f"${step_id}{fields} not found in the result of {step_id}")
+    return value
+
+
+def resolve_references(value: Any, outputs: Dict[str, Any], step_ids: Any) -> Any:
+    """
+    把参数中的引用替换为之前步骤的结果
+
+    整个字符串就是一个引用时保留结果的类型（如整数坐标），引用嵌在文本中时按字符串替换。
+    不是计划中步骤ID的"$xxx"保持原样。
+
+    Args:
+        value: 参数值（可以是嵌套的字典和列表）
+        outputs: 已成功执行的步骤ID -> 结果
+        step_ids: 计划中所有步骤的ID
+
+    Returns:
+        Any: 替换后的参数值
+
+    Raises:
+        PlanReferenceError: 引用的步骤尚未成功执行，或结果中没有该字段
+    """
+    if isinstance(value, dict):
+        return {key: resolve_references(item, outputs, step_ids) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve_references(item, outputs, step_ids) for item in value]
+    if not isinstance(value, str) or "$" not in value:
+        return value
+
+    def resolve(match: "re.Match") -> Any:
+        step_id, fields = match.group(1), match.group(2)
+        if step_id not in step_ids:
+            return match.group(0)
+        if step_id not in outputs:
+            raise PlanReferenceError(f"${step_id}{fields} refers to a step that has not run")
+        return _lookup(step_id, fields, outputs)
+
+    whole = REFERENCE_PATTERN.fullmatch(value)
+    if whole is not None:
+        return resolve(whole)
+    return REFERENCE_PATTERN.sub(lambda match: str(resolve(match)), value)
+
+
+def execute_plan(
+    steps: List[PlanStep],
+    executor: ToolExecutor,
+    tool_registry: Dict[str, Dict[str, Any]],
+    cancel_event: Optional[threading.Event] = None,
+    budget: Optional[DeadlineBudget] = None
+) -> Dict[str, Any]:
+    """
+    在本地按顺序执行计划
+
+    某一步失败（包括引用无法解析）时停止；步骤标记了observe时执行完该步后停止。
+    每一步开始前检查取消事件和时间预算，与工具循环一样在下一次工具调用前结束。
+
+    Args:
+        steps: 计划步骤
+        executor: 工具执行器
+        tool_registry: 工具注册表
+        cancel_event: 取消事件，被设置后不再执行后续步骤
+        budget: 时间预算，耗尽后不再执行后续步骤
+
+    Returns:
+        Dict: {steps: [{id, tool, arguments, success, result|error, duration}],
+            stopped: None（全部完成）/"failed"/"observe"/"cancelled"/"deadline",
+            skipped: [未执行的步骤ID], duration}
+    """
+    start = time.perf_counter()
+    step_ids = {step.id for step in steps}
+    outputs: Dict[str, Any] = {}
+    records: List[Dict[str, Any]] = []
+    stopped = None
+    for step in steps:
+        if cancel_event is not None and cancel_event.is_set():
+            stopped = "cancelled"
+            break
+        if budget is not None and budget.expired():
+            stopped = "deadline"
+            break
+        record: Dict[str, Any] = {"id": step.id, "tool": step.tool}
+        records.append(record)
+        try:
+            arguments = resolve_references(step.arguments, outputs, step_ids)
+        except PlanReferenceError as e:
+            record.update(arguments=step.arguments, success=False, error=str(e), duration=0.0)
+            stopped = "failed"
+            break
+        tool_call = {"function": {"name": step.tool, "arguments": arguments}}
+        result = executor.execute_tool_calls([tool_call], tool_registry)[0]
+        record.update(arguments=arguments, success=result.success, duration=round(result.duration, 4))
+        if not result.success:
+            record["error"] = result.error
+            stopped = "failed"
+            break
+        record["result"] = result.result
+        outputs[step.id] = result.result
+        if step.observe:
+            stopped = "observe"
+            break
+    return {
+        "steps": records,
+        "stopped": stopped,
+        "skipped": [step.id for step in steps[len(records):]],
+        "duration": round(time.perf_counter() - start, 4)
+    }
+
+
+def run_plan_call(
+    arguments: Any,
+    executor: ToolExecutor,
+    tool_registry: Dict[str, Dict[str, Any]],
+    cancel_event: Optional[threading.Event] = None,
+    budget: Optional[DeadlineBudget] = None
+) -> Dict[str, Any]:
+    """
+    解析并执行一次run_plan工具调用
+
+    计划无法解析时不执行任何步骤，作为失败交给模型。
+
+    Args:
+        arguments: run_plan工具调用的参数
+        executor: 工具执行器
+        tool_registry: 工具注册表
+        cancel_event: 取消事件
+        budget: 时间预算
+
+    Returns:
+        Dict: execute_plan的返回值，另加final和errors（解析错误）
+    """
+    steps, final, errors = parse_plan(arguments)
+    if errors:
+        return {
+            "steps": [],
+            "stopped": "failed",
+            "skipped": [step.id for step in steps],
+            "duration": 0.0,
+            "final": final,
+            "errors": errors
+        }
+    report = execute_plan(steps, executor, tool_registry, cancel_event, budget)
+    report.update(final=final, errors=[])
+    return report
+
+
+def plan_tool_message(plan_result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    把计划的执行结果转换为交给模型的工具消息
+
+    Args:
+        plan_result: execute_plan的返回值
+
+    Returns:
+        Dict: role为tool的消息
+    """
+    steps = [
+        {key: record[key] for key in ("id", "tool", "success", "result", "error") if key in record}
+        for record in plan_result["steps"]
+    ]
+    content = {"steps": steps, "stopped": plan_result["stopped"], "skipped": plan_result["skipped"]}
+    if plan_result.get("errors"):
+        content["errors"] = plan_result["errors"]
+    return {"role": "tool", "content": json.dumps(content, ensure_ascii=False), "name": PLAN_TOOL_NAME}
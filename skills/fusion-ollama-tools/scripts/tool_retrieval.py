@@ -0,0 +1,429 @@
+"""
+tool_retrieval.py - 工具子集检索模块
+
+不再每次请求都发送ALL_TOOLS中的全部工具定义，而是根据用户消息只挑选最相关的
+top-k个工具，缩短本地模型的prompt eval时间：
+1. 按工具名称、描述和参数描述建立索引
+2. 中英文统一使用字符n-gram（中文）与单词（英文）切分，BM25打分
+3. 可选: 通过本地Ollama /api/embed 计算向量并与BM25分数融合，向量结果会被缓存
+4. 模型引用了未发送的工具时，由调用方把该工具补回
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Any, List, Optional, Callable, Tuple, Iterable
+
+from tool_definitions import ALL_TOOLS, ToolDefinition
+from token_estimator import estimate_prompt_tokens
+
+
+DEFAULT_TOP_K = 6
+
+DEFAULT_EMBED_MODEL = "nomic-embed-text"
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+_CJK_PATTERN = re.compile("[\u3400-\u4dbf\u4e00-\u9fff]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    将中英文混合文本切分为检索词
+
+    英文和数字按单词切分（下划线等符号视为分隔符），
+    连续的中文按单字和相邻双字切分，不依赖分词词典。
+
+    Args:
+        text: 文本
+
+    Returns:
+        List[str]: 检索词列表
+    """
+    text = (text or "").lower()
+    terms = _WORD_PATTERN.findall(text)
+    for run in _CJK_PATTERN.findall(text):
+        terms.extend(run)
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def tool_document(tool: ToolDefinition) -> str:
+    """
+    生成工具的索引文本
+
+    Args:
+        tool: 工具定义
+
+    Returns:
+        str: 名称、描述和参数描述拼接成的文本
+    """
+    parts = [tool.name, tool.name.replace("_", " "), tool.description]
+    for param in tool.parameters:
+        parts.append(param.name)
+        parts.append(param.description)
+        if param.enum:
+            parts.extend(str(value) for value in param.enum)
+    return "\n".join(parts)
+
+
+class OllamaEmbedder:
+    """
+    基于本地Ollama /api/embed 的文本向量化
+
+    向量按(模型, 文本)缓存在内存中，指定cache_path时同时持久化到JSON文件，
+    工具描述的向量只需计算一次。
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://127.0.0.1:11434",
+        model: str = DEFAULT_EMBED_MODEL,
+        cache_path: Optional[str] = None,
+        timeout: float = 30.0
+    ):
+        """
+        初始化向量化器
+
+        Args:
+            base_url: Ollama API基础URL
+            model: 向量模型名称
+            cache_path: 向量缓存文件路径，为None时只缓存在内存中
+            timeout: 请求超时(秒)
+        """
+        self.base_url = base_url
+        self.model = model
+        self.cache_path = cache_path
+        self.timeout = timeout
+        self._cache: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, "r", encoding="utf-8") as f:
+                    self._cache = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self._cache = {}
+
+    def _key(self, text: str) -> str:
+        """生成缓存键"""
+        return hashlib.sha256(f"{self.model}\n{text}".encode("utf-8")).hexdigest()
+
+    def _save(self) -> None:
+        """写入缓存文件"""
+        if not self.cache_path:
+            return
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._cache, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        """
+        计算一组文本的向量（优先使用缓存）
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            List[List[float]]: 与texts顺序一致的向量
+
+        Raises:
+            requests.exceptions.RequestException: 请求失败
+        """
+        from ollama_transport import get_transport
+
+        with self._lock:
+            missing = [text for text in dict.fromkeys(texts) if self._key(text) not in self._cache]
+
+        if missing:
+            response = get_transport(self.base_url).post(
+                "/api/embed",
+                json={"model": self.model, "input": missing},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            embeddings = response.json().get("embeddings", [])
+            with self._lock:
+                for text, embedding in zip(missing, embeddings):
+                    self._cache[self._key(text)] = embedding
+                try:
+                    self._save()
+                except OSError:
+                    pass
+
+        with self._lock:
+            return [self._cache.get(self._key(text), []) for text in texts]
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    """计算余弦相似度"""
+    if not a or not b or len(a) != len(b):
+        return 0.0
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ToolRetriever:
+    """
+    工具子集检索器
+
+    对每条用户消息用BM25（可选融合向量相似度）为工具打分，返回得分最高的
+    top-k个工具。消息与任何工具都不相关时返回全部工具，避免模型无工具可用。
+    """
+
+    def __init__(
+        self,
+        tools: Optional[List[ToolDefinition]] = None,
+        top_k: int = DEFAULT_TOP_K,
+        always_include: Optional[Iterable[str]] = None,
+        embedder: Optional[Callable[[List[str]], List[List[float]]]] = None,
+        embedding_weight: float = 0.5,
+        k1: float = 1.5,
+        b: float = 0.75
+    ):
+        """
+        初始化检索器
+
+        Args:
+            tools: 候选工具，为None时使用ALL_TOOLS
+            top_k: 每次返回的工具数
+            always_include: 总是发送的工具名称
+            embedder: 文本向量化函数（如OllamaEmbedder），为None时只使用BM25
+            embedding_weight: 向量相似度在融合分数中的权重 (0-1)
+            k1: BM25词频饱和参数
+            b: BM25文档长度归一化参数
+        """
+        self.tools = list(ALL_TOOLS if tools is None else tools)
+        self.top_k = top_k
+        self.always_include = set(always_include or [])
+        self.embedder = embedder
+        self.embedding_weight = embedding_weight
+        self.k1 = k1
+        self.b = b
+        self.embedding_errors = 0
+
+        self._documents = [tool_document(tool) for tool in self.tools]
+        self._term_freqs = [Counter(tokenize(doc)) for doc in self._documents]
+        self._lengths = [sum(freqs.values()) for freqs in self._term_freqs]
+        self._avg_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+        doc_freq: Counter = Counter()
+        for freqs in self._term_freqs:
+            doc_freq.update(freqs.keys())
+        count = len(self.tools)
+        self._idf = {
+            term: math.log(1 + (count - df + 0.5) / (df + 0.5))
+            for term, df in doc_freq.items()
+        }
+        self._tool_embeddings: Optional[List[List[float]]] = None
+
+    def _bm25_scores(self, query: str) -> List[float]:
+        """计算查询对每个工具的BM25分数"""
+        query_terms = tokenize(query)
+        scores = []
+        for freqs, length in zip(self._term_freqs, self._lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self._avg_length) if self._avg_length else self.k1
+            for term in query_terms:
+                tf = freqs.get(term)
+                if tf:
+                    score += self._idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(score)
+        return scores
+
+    def _embedding_scores(self, query: str) -> Optional[List[float]]:
+        """计算查询与每个工具的向量相似度，向量服务不可用时返回None"""
+        if self.embedder is None:
+            return None
+        try:
+            if self._tool_embeddings is None:
+                self._tool_embeddings = self.embedder(self._documents)
+            query_embedding = self.embedder([query])[0]
+        except Exception:
+            self.embedding_errors += 1
+            return None
+        return [_cosine(query_embedding, embedding) for embedding in self._tool_embeddings]
+
+    def score(self, query: str) -> List[Tuple[str, float]]:
+        """
+        为所有工具打分
+
+        Args:
+            query: 用户消息
+
+        Returns:
+            List[Tuple[str, float]]: 按分数降序排列的(工具名称, 分数)
+        """
+        scores = self._bm25_scores(query)
+        top = max(scores) if scores else 0.0
+        if top > 0:
+            scores = [score / top for score in scores]
+
+        similarities = self._embedding_scores(query)
+        if similarities is not None:
+            weight = self.embedding_weight
+            scores = [(1 - weight) * s + weight * max(0.0, sim) for s, sim in zip(scores, similarities)]
+
+        ranked = sorted(zip(self.tools, scores), key=lambda item: -item[1])
+        return [(tool.name, score) for tool, score in ranked]
+
+    def select(self, query: str, top_k: Optional[int] = None) -> List[ToolDefinition]:
+        """
+        选出与消息最相关的工具
+
+        Args:
+            query: 用户消息
+            top_k: 返回的工具数，为None时使用self.top_k
+
+        Returns:
+            List[ToolDefinition]: 选中的工具，保持原有的定义顺序
+        """
+        top_k = self.top_k if top_k is None else top_k
+        ranked = self.score(query)
+        if top_k <= 0 or top_k >= len(ranked) or not ranked or ranked[0][1] <= 0:
+            return list(self.tools)
+
+        selected = {name for name, score in ranked[:top_k] if score > 0}
+        selected |= self.always_include
+        return [tool for tool in self.tools if tool.name in selected]
+
+    def select_ollama_format(self, query: str, top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        选出与消息最相关的工具并转换为Ollama格式
+
+        Args:
+            query: 用户消息
+            top_k: 返回的工具数
+
+        Returns:
+            List[Dict]: Ollama工具定义列表
+        """
+        return [tool.to_ollama_format() for tool in self.select(query, top_k)]
+
+
+def _mentions(content: str, name: str) -> bool:
+    """文本中是否以完整名称提到了工具（desktop_click_image不算提到desktop_click）"""
+    # 中文字符也属于\w，工具名紧挨中文时\b不成立，因此只把ASCII标识符字符当作名称的一部分
+    return re.search(rf"(?<![A-Za-z0-9_]){re.escape(name)}(?![A-Za-z0-9_])", content) is not None
+
+
+def find_referenced_tools(
+    message: Dict[str, Any],
+    sent_names: Iterable[str],
+    candidates: Iterable[str]
+) -> List[str]:
+    """
+    找出模型引用了但本次没有发送的工具
+
+    包括工具调用中使用的工具名称，以及回复文本中提到的工具名称。
+
+    Args:
+        message: 模型回复的消息
+        sent_names: 本次请求发送的工具名称
+        candidates: 所有已注册的工具名称
+
+    Returns:
+        List[str]: 需要补回的工具名称
+    """
+    sent = set(sent_names)
+    missing = [name for name in candidates if name not in sent]
+    if not missing:
+        return []
+
+    called = {
+        (tool_call.get("function") or {}).get("name", "")
+        for tool_call in message.get("tool_calls") or []
+    }
+    content = message.get("content") or ""
+    return [name for name in missing if name in called or _mentions(content, name)]
+
+
+class ToolSelection:
+    """
+    一次对话中的工具子集
+
+    记录发送给模型的工具、模型引用后补回的工具，以及与发送全部工具相比
+    估算的提示词token数。
+    """
+
+    def __init__(
+        self,
+        retriever: ToolRetriever,
+        user_message: str,
+        all_tools: Optional[List[Dict[str, Any]]] = None
+    ):
+        """
+        根据用户消息选出工具子集
+
+        Args:
+            retriever: 工具检索器
+            user_message: 用户消息
+            all_tools: 不做检索时会发送的全部工具（Ollama格式），为None时取检索器的全部候选工具
+        """
+        self.all_tools = all_tools if all_tools is not None else [
+            tool.to_ollama_format() for tool in retriever.tools
+        ]
+        self.tools = retriever.select_ollama_format(user_message)
+        self.added_back: List[str] = []
+        self.requests = 0
+        self.prompt_tokens_all = 0
+        self.prompt_tokens_selected = 0
+
+    @property
+    def names(self) -> List[str]:
+        """当前发送的工具名称"""
+        return [tool["function"]["name"] for tool in self.tools]
+
+    def record_request(self, messages: List[Dict[str, Any]]) -> None:
+        """
+        记录一次请求的估算token数
+
+        Args:
+            messages: 本次请求的消息列表
+        """
+        self.requests += 1
+        self.prompt_tokens_all += estimate_prompt_tokens(messages, self.all_tools)
+        self.prompt_tokens_selected += estimate_prompt_tokens(messages, self.tools)
+
+    def add_referenced(self, message: Dict[str, Any]) -> List[str]:
+        """
+        把模型引用了但未发送的工具加入子集
+
+        Args:
+            message: 模型回复的消息
+
+        Returns:
+            List[str]: 本次补回的工具名称
+        """
+        by_name = {tool["function"]["name"]: tool for tool in self.all_tools}
+        added = find_referenced_tools(message, self.names, by_name)
+        for name in added:
+            self.tools.append(by_name[name])
+            self.added_back.append(name)
+        return added
+
+    def report(self) -> Dict[str, Any]:
+        """
+        生成工具选择报告
+
+        Returns:
+            Dict: {selected, added_back, total_tools, requests,
+                   prompt_tokens_all, prompt_tokens_selected, prompt_tokens_saved}
+        """
+        return {
+            "selected": self.names,
+            "added_back": list(self.added_back),
+            "total_tools": len(self.all_tools),
+            "requests": self.requests,
+            "prompt_tokens_all": self.prompt_tokens_all,
+            "prompt_tokens_selected": self.prompt_tokens_selected,
+            "prompt_tokens_saved": self.prompt_tokens_all - self.prompt_tokens_selected
+        }
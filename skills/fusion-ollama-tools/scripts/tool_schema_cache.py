@@ -0,0 +1,200 @@
+"""
+tool_schema_cache.py - 预序列化工具定义缓存模块
+
+每个工具集合的Ollama工具定义只构建和JSON编码一次：
+1. 工具按ALL_TOOLS中的定义顺序排列，相同集合得到完全相同的字节
+2. 每个集合带有内容哈希，编码后的字节直接拼接进请求体，不再每轮重新编码
+3. 跟踪"系统提示词 + 工具定义"前缀，前缀变化（Ollama无法复用KV缓存）时记录下来
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import hashlib
+import json
+import threading
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Tuple, FrozenSet
+
+from tool_definitions import ALL_TOOLS, ToolDefinition
+
+
+def _encode(value: Any) -> bytes:
+    """紧凑、键有序的JSON编码"""
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+class ToolSchemaSet:
+    """
+    不可变的预编码工具集合
+
+    tools中的字典与其他请求共享，不要修改；需要可修改的副本时使用to_list()。
+    可以像列表一样迭代和取长度。
+    """
+
+    __slots__ = ("names", "tools", "encoded", "digest")
+
+    def __init__(self, tools: Iterable[Dict[str, Any]]):
+        """
+        编码工具集合
+
+        Args:
+            tools: Ollama格式的工具定义，按给定顺序编码
+        """
+        tools = tuple(tools)
+        encoded = _encode(list(tools))
+        object.__setattr__(self, "tools", tools)
+        object.__setattr__(self, "names", tuple(tool.get("function", {}).get("name", "") for tool in tools))
+        object.__setattr__(self, "encoded", encoded)
+        object.__setattr__(self, "digest", hashlib.sha256(encoded).hexdigest()[:16])
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("ToolSchemaSet is immutable")
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.tools)
+
+    def __len__(self) -> int:
+        return len(self.tools)
+
+    def __repr__(self) -> str:
+        return f"ToolSchemaSet({len(self.tools)} tools, digest={self.digest})"
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """
+        获取可修改的工具定义副本
+
+        Returns:
+            List[Dict]: Ollama工具定义列表
+        """
+        return json.loads(self.encoded.decode("utf-8"))
+
+
+def encode_chat_request(request_body: Dict[str, Any]) -> bytes:
+    """
+    编码聊天请求体
+
+    tools为ToolSchemaSet时直接拼接其预编码字节，其余字段正常编码。
+
+    Args:
+        request_body: 请求体
+
+    Returns:
+        bytes: JSON请求体
+    """
+    tools = request_body.get("tools")
+    if not isinstance(tools, ToolSchemaSet):
+        return json.dumps(request_body, ensure_ascii=False).encode("utf-8")
+
+    rest = {key: value for key, value in request_body.items() if key != "tools"}
+    head = json.dumps(rest, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    separator = b"," if rest else b""
+    return head[:-1] + separator + b'"tools":' + tools.encoded + b"}"
+
+
+class ToolSchemaCache:
+    """
+    工具定义缓存
+
+    按工具名称集合缓存ToolSchemaSet，并跟踪请求前缀（系统提示词 + 工具定义）
+    的变化次数。
+    """
+
+    def __init__(self, tools: Optional[List[ToolDefinition]] = None):
+        """
+        初始化缓存
+
+        Args:
+            tools: 候选工具定义，为None时使用ALL_TOOLS
+        """
+        self._definitions = list(ALL_TOOLS if tools is None else tools)
+        self._order = {tool.name: index for index, tool in enumerate(self._definitions)}
+        self._by_name = {tool.name: tool for tool in self._definitions}
+        self._sets: Dict[FrozenSet[str], ToolSchemaSet] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.prefix_changes = 0
+        self.last_prefix: Optional[str] = None
+
+    def for_names(self, names: Iterable[str]) -> ToolSchemaSet:
+        """
+        获取指定工具集合的预编码定义
+
+        Args:
+            names: 工具名称，未知名称会被忽略
+
+        Returns:
+            ToolSchemaSet: 按定义顺序排列的工具集合
+        """
+        key = frozenset(name for name in names if name in self._by_name)
+        with self._lock:
+            schema = self._sets.get(key)
+            if schema is not None:
+                self.hits += 1
+                return schema
+            self.misses += 1
+
+        ordered = sorted(key, key=self._order.get)
+        schema = ToolSchemaSet(self._by_name[name].to_ollama_format() for name in ordered)
+        with self._lock:
+            return self._sets.setdefault(key, schema)
+
+    def all_tools(self) -> ToolSchemaSet:
+        """
+        获取全部工具的预编码定义
+
+        Returns:
+            ToolSchemaSet: 全部工具
+        """
+        return self.for_names(self._order)
+
+    def for_tools(self, tools: Any) -> ToolSchemaSet:
+        """
+        获取调用方给出的工具定义对应的预编码集合
+
+        Args:
+            tools: ToolSchemaSet或Ollama格式的工具定义列表（保持给定顺序）
+
+        Returns:
+            ToolSchemaSet: 工具集合
+        """
+        if isinstance(tools, ToolSchemaSet):
+            return tools
+        return ToolSchemaSet(tools)
+
+    def observe_prefix(self, messages: List[Dict[str, Any]], schema: ToolSchemaSet) -> Tuple[str, bool]:
+        """
+        记录一次请求的前缀
+
+        Args:
+            messages: 本次请求的消息列表
+            schema: 本次请求的工具集合
+
+        Returns:
+            Tuple[str, bool]: (前缀哈希, 与上一次请求相比是否变化)
+        """
+        system = messages[0].get("content", "") if messages and messages[0].get("role") == "system" else ""
+        prefix = hashlib.sha256(system.encode("utf-8") + b"\0" + schema.digest.encode("ascii")).hexdigest()[:16]
+        with self._lock:
+            changed = self.last_prefix is not None and prefix != self.last_prefix
+            if changed:
+                self.prefix_changes += 1
+            self.last_prefix = prefix
+        return prefix, changed
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+
+        Returns:
+            Dict: {schema_sets, hits, misses, prefix_changes, last_prefix}
+        """
+        with self._lock:
+            return {
+                "schema_sets": len(self._sets),
+                "hits": self.hits,
+                "misses": self.misses,
+                "prefix_changes": self.prefix_changes,
+                "last_prefix": self.last_prefix
+            }
@@ -0,0 +1,393 @@
+"""
+tool_validation.py - 模型响应和工具参数校验模块
+
+检查模型给出的回复是否可以直接使用：
+1. 回复不能为空（既没有文本也没有工具调用）
+2. 工具调用的名称必须在工具注册表中
+3. 工具参数按ToolParameter定义校验。每个ToolDefinition只编译一次校验器（类型转换函数、
+   枚举值表、必需参数和默认值），无害的不匹配在本地修复（"100"→100、"Left"→"left"、
+   JSON字符串形式的参数、未定义的参数、有默认值的必需参数），无法修复的调用
+   （缺少必需参数、类型无法转换、枚举值不存在）在执行前拒绝并给出简短的错误信息
+
+模型级联用validate_response决定是否升级模型；ToolExecutor用ToolCallValidator在执行前
+修复或拒绝工具调用，并按工具统计有效、已修复和被拒绝的调用数。
+
+作者: AI Assistant
+版本: 1.0.0
+日期: 2026-02-17
+"""
+
+import json
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Callable, Iterable, Tuple
+
+from tool_definitions import ALL_TOOLS, ToolDefinition, get_tool_by_name
+
+
+_TRUE_STRINGS = ("true", "yes", "1", "on")
+_FALSE_STRINGS = ("false", "no", "0", "off")
+
+
+def _to_integer(value: Any) -> int:
+    """转换为整数（接受"100"、100.0）"""
+    if isinstance(value, bool):
+        raise TypeError("boolean is not an integer")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = float(value.strip())
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    raise TypeError("not an integer")
+
+
+def _to_number(value: Any) -> float:
+    """转换为数字（接受"1.5"）"""
+    if isinstance(value, bool):
+        raise TypeError("boolean is not a number")
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        number = float(value.strip())
+        return int(number) if number.is_integer() and "." not in value else number
+    raise TypeError("not a number")
+
+
+def _to_boolean(value: Any) -> bool:
+    """转换为布尔值（接受"true"、"no"、0、1等）"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in _TRUE_STRINGS:
+            return True
+        if text in _FALSE_STRINGS:
+            return False
+    raise TypeError("not a boolean")
+
+
+def _to_string(value: Any) -> str:
+    """转换为字符串（接受数字）"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise TypeError("not a string")
+
+
+def _to_json_type(expected: type) -> Callable[[Any], Any]:
+    """生成数组/对象的转换函数（接受JSON字符串）"""
+    def coerce(value: Any) -> Any:
+        if isinstance(value, str):
+            value = json.loads(value)
+        if isinstance(value, tuple) and expected is list:
+            value = list(value)
+        if not isinstance(value, expected):
+            raise TypeError(f"not {expected.__name__}")
+        return value
+    return coerce
+
+
+# ToolParameter.param_type对应的类型转换函数：返回转换后的值，无法转换时抛出异常
+COERCERS: Dict[str, Callable[[Any], Any]] = {
+    "string": _to_string,
+    "integer": _to_integer,
+    "number": _to_number,
+    "boolean": _to_boolean,
+    "array": _to_json_type(list),
+    "object": _to_json_type(dict),
+}
+
+
+@dataclass
+class ArgumentCheck:
+    """
+    一次参数校验的结果
+
+    Attributes:
+        tool_name: 工具名称
+        arguments: 修复后的参数（errors不为空时不完整）
+        repairs: 在本地完成的修复
+        errors: 无法修复的问题
+    """
+    tool_name: str
+    arguments: Dict[str, Any] = field(default_factory=dict)
+    repairs: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def status(self) -> str:
+        """valid、repaired或rejected"""
+        if self.errors:
+            return "rejected"
+        return "repaired" if self.repairs else "valid"
+
+    def error_message(self) -> str:
+        """
+        返回给模型的简短错误信息
+
+        Returns:
+            str: 如 "Invalid arguments for desktop_click: missing required argument 'y'"
+        """
+        return f"Invalid arguments for {self.tool_name}: " + "; ".join(self.errors)
+
+
+class CompiledToolValidator:
+    """
+    由ToolDefinition编译的参数校验器
+    """
+
+    __slots__ = ("tool_name", "_params", "_required", "_defaults")
+
+    def __init__(self, tool: ToolDefinition):
+        """
+        编译校验器
+
+        Args:
+            tool: 工具定义
+        """
+        self.tool_name = tool.name
+        # 参数名 -> (类型, 转换函数, 规范化枚举值 -> 枚举值)
+        self._params: Dict[str, Tuple[str, Callable[[Any], Any], Optional[Dict[str, Any]]]] = {}
+        for param in tool.parameters:
+            enum = {self._normalize(value): value for value in param.enum} if param.enum else None
+            self._params[param.name] = (param.param_type, COERCERS.get(param.param_type, lambda v: v), enum)
+        self._required = tuple(p.name for p in tool.parameters if p.required and p.default is None)
+        self._defaults = {p.name: p.default for p in tool.parameters if p.required and p.default is not None}
+
+    @staticmethod
+    def _normalize(value: Any) -> Any:
+        """枚举值比较时忽略大小写和首尾空白"""
+        return value.strip().lower() if isinstance(value, str) else value
+
+    def check(self, arguments: Any) -> ArgumentCheck:
+        """
+        校验并修复参数
+
+        Args:
+            arguments: 模型给出的参数（字典，或JSON字符串）
+
+        Returns:
+            ArgumentCheck: 校验结果
+        """
+        result = ArgumentCheck(self.tool_name)
+        if isinstance(arguments, str):
+            try:
+                arguments = json.loads(arguments) if arguments.strip() else {}
+            except json.JSONDecodeError:
+                result.errors.append("arguments are not valid JSON")
+                return result
+            result.repairs.append("parsed arguments from JSON string")
+        if arguments is None:
+            arguments = {}
+        if not isinstance(arguments, dict):
+            result.errors.append("arguments must be an object")
+            return result
+
+        invalid = set()
+        for name, value in arguments.items():
+            spec = self._params.get(name)
+            if spec is None:
+                result.repairs.append(f"dropped unexpected argument '{name}'")
+                continue
+            if value is None:
+                continue
+            param_type, coerce, enum = spec
+            try:
+                coerced = coerce(value)
+            except (TypeError, ValueError):
+                result.errors.append(f"argument '{name}' should be {param_type}")
+                invalid.add(name)
+                continue
+            if enum is not None:
+                canonical = enum.get(self._normalize(coerced), enum.get(coerced))
+                if canonical is None:
+                    result.errors.append(f"argument '{name}' must be one of {list(enum.values())}")
+                    invalid.add(name)
+                    continue
+                coerced = canonical
+            if type(coerced) is not type(value) or coerced != value:
+                result.repairs.append(f"argument '{name}': {value!r} -> {coerced!r}")
+            result.arguments[name] = coerced
+
+        for name in self._required:
+            if name not in result.arguments and name not in invalid:
+                result.errors.append(f"missing required argument '{name}'")
+        for name, default in self._defaults.items():
+            result.arguments.setdefault(name, default)
+        return result
+
+
+@lru_cache(maxsize=None)
+def compiled_validator(tool_name: str) -> Optional[CompiledToolValidator]:
+    """
+    获取内置工具的编译校验器（每个工具只编译一次）
+
+    Args:
+        tool_name: 工具名称
+
+    Returns:
+        Optional[CompiledToolValidator]: 校验器，工具不存在时为None
+    """
+    tool = get_tool_by_name(tool_name)
+    return CompiledToolValidator(tool) if tool is not None else None
+
+
+class ToolCallValidator:
+    """
+    执行前的工具调用校验和修复，按工具统计结果
+
+    用法:
+        validator = ToolCallValidator()
+        executor = ToolExecutor(validator=validator)
+        ...
+        print(validator.stats())
+    """
+
+    def __init__(self, tools: Optional[Iterable[ToolDefinition]] = None):
+        """
+        初始化校验器
+
+        Args:
+            tools: 工具定义，为None时使用全部内置工具
+        """
+        if tools is None:
+            self._validators = {tool.name: compiled_validator(tool.name) for tool in ALL_TOOLS}
+        else:
+            self._validators = {tool.name: CompiledToolValidator(tool) for tool in tools}
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def validator_for(self, tool_name: str) -> Optional[CompiledToolValidator]:
+        """
+        获取工具的编译校验器（不记录统计）
+
+        Args:
+            tool_name: 工具名称
+
+        Returns:
+            Optional[CompiledToolValidator]: 校验器，工具没有定义时为None
+        """
+        return self._validators.get(tool_name)
+
+    def validate(self, tool_name: str, arguments: Any) -> Optional[ArgumentCheck]:
+        """
+        校验一次工具调用的参数并记录结果
+
+        Args:
+            tool_name: 工具名称
+            arguments: 模型给出的参数
+
+        Returns:
+            Optional[ArgumentCheck]: 校验结果，工具没有定义时为None
+        """
+        validator = self._validators.get(tool_name)
+        if validator is None:
+            return None
+        check = validator.check(arguments)
+        with self._lock:
+            counts = self._counts.setdefault(tool_name, {"calls": 0, "valid": 0, "repaired": 0, "rejected": 0})
+            counts["calls"] += 1
+            counts[check.status] += 1
+        return check
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取统计
+
+        Returns:
+            Dict: {"tools": {工具名: {calls, valid, repaired, rejected}}, "totals": {同上}}
+        """
+        with self._lock:
+            tools = {name: dict(counts) for name, counts in self._counts.items()}
+        totals = {"calls": 0, "valid": 0, "repaired": 0, "rejected": 0}
+        for counts in tools.values():
+            for key in totals:
+                totals[key] += counts[key]
+        return {"tools": tools, "totals": totals}
+
+    def reset(self) -> None:
+        """
+        清空统计
+        """
+        with self._lock:
+            self._counts.clear()
+
+
+def validate_arguments(tool: ToolDefinition, arguments: Any) -> List[str]:
+    """
+    校验工具参数（可以在本地修复的问题不算错误）
+
+    Args:
+        tool: 工具定义
+        arguments: 模型给出的参数（字典，或JSON字符串）
+
+    Returns:
+        List[str]: 错误列表，为空表示可以执行
+    """
+    if get_tool_by_name(tool.name) is tool:
+        validator = compiled_validator(tool.name)
+    else:
+        validator = CompiledToolValidator(tool)
+    return [f"{tool.name}: {error}" for error in validator.check(arguments).errors]
+
+
+def validate_tool_call(
+    tool_call: Dict[str, Any],
+    tool_registry: Optional[Dict[str, Dict[str, Any]]] = None,
+    tool_validator: Optional[ToolCallValidator] = None
+) -> List[str]:
+    """
+    校验单个工具调用
+
+    工具是否存在以工具注册表为准；参数按tool_validator中的定义校验，没有时按内置工具定义校验。
+    注册表中有、但没有参数定义的工具（非内置工具）只检查名称。
+
+    Args:
+        tool_call: Ollama格式的工具调用
+        tool_registry: 工具注册表，为None时只检查工具定义是否存在
+        tool_validator: 工具调用校验器（如ToolCallValidator(tools=自定义工具)）
+
+    Returns:
+        List[str]: 错误列表，为空表示通过
+    """
+    func = tool_call.get("function") or {}
+    name = func.get("name") or ""
+    validator = tool_validator.validator_for(name) if tool_validator is not None else None
+    if validator is None:
+        validator = compiled_validator(name)
+    known = name in tool_registry if tool_registry is not None else validator is not None
+    if not known:
+        return [f"Unknown tool: {name}"]
+    if validator is None:
+        return []
+    return [f"{name}: {error}" for error in validator.check(func.get("arguments")).errors]
+
+
+def validate_response(
+    message: Dict[str, Any],
+    tool_registry: Optional[Dict[str, Dict[str, Any]]] = None,
+    tool_validator: Optional[ToolCallValidator] = None
+) -> List[str]:
+    """
+    校验模型的一条回复
+
+    Args:
+        message: 助手消息（response["message"]）
+        tool_registry: 工具注册表
+        tool_validator: 工具调用校验器，见validate_tool_call
+
+    Returns:
+        List[str]: 错误列表，为空表示可以直接使用
+    """
+    tool_calls = message.get("tool_calls") or []
+    if not tool_calls and not (message.get("content") or "").strip():
+        return ["Empty response"]
+    errors = []
+    for tool_call in tool_calls:
+        errors.extend(validate_tool_call(tool_call, tool_registry, tool_validator))
+    return errors
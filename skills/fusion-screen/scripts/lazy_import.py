@@ -0,0 +1,38 @@
+"""
+lazy_import.py - 延迟导入
+
+screen.py通过LazyModule使用pyautogui/PIL，加载脚本时不导入这些依赖；
+依赖缺失时只有实际用到它的动作失败。
+"""
+
+import importlib
+import threading
+
+
+class LazyModule:
+    """首次访问属性时才导入的模块代理，避免加载脚本时就导入pyautogui/PIL"""
+
+    def __init__(self, name, on_load=None):
+        self._name = name
+        self._on_load = on_load
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                module = importlib.import_module(self._name)
+                if self._on_load:
+                    self._on_load(module)
+                self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        module = self._module or self._load()
+        return getattr(module, attr)
+
+    def __setattr__(self, attr, value):
+        if attr.startswith('_'):
+            object.__setattr__(self, attr, value)
+        else:
+            setattr(self._module or self._load(), attr, value)
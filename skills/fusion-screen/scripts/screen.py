@@ -1,16 +1,23 @@
-import pyautogui
 import json
 import sys
 import os
 import platform
 import subprocess
-from PIL import Image
 import io
 import base64
+import threading
+
+_LAZY_IMPORT_DIR = os.path.dirname(os.path.abspath(__file__))
+if _LAZY_IMPORT_DIR not in sys.path:
+    sys.path.insert(0, _LAZY_IMPORT_DIR)
+from lazy_import import LazyModule
+
+pyautogui = LazyModule('pyautogui')
+Image = LazyModule('PIL.Image')
 
 def _take_screenshot(region=None):
     if platform.system() == 'Linux':
-        path = '/tmp/scrot_screenshot.png'
+        path = f'/tmp/scrot_screenshot_{os.getpid()}_{threading.get_ident()}.png'
         try:
             if region:
                 x, y, w, h = region
@@ -168,6 +175,16 @@ def pixel_at(params):
     except Exception as e:
         return {'status': 'error', 'action': 'pixel_at', 'message': str(e)}
 
+actions = {
+    'screenshot_base64': screenshot_base64,
+    'ocr': ocr,
+    'find_image': find_image,
+    'find_all': find_all,
+    'analyze': analyze,
+    'get_screen_size': get_screen_size,
+    'pixel_at': pixel_at
+}
+
 def main():
     if len(sys.argv) < 2:
         print(json.dumps({'status': 'error', 'message': 'Usage: python screen.py <action> [params]'}))
@@ -185,16 +202,6 @@ def main():
         except:
             params = {}
     
-    actions = {
-        'screenshot_base64': screenshot_base64,
-        'ocr': ocr,
-        'find_image': find_image,
-        'find_all': find_all,
-        'analyze': analyze,
-        'get_screen_size': get_screen_size,
-        'pixel_at': pixel_at
-    }
-    
     if action in actions:
         result = actions[action](params)
     else:
@@ -192,6 +192,18 @@ def get_monitors(params):
     except Exception as e:
         return {'status': 'error', 'action': 'monitors', 'message': str(e)}
 
+actions = {
+    'list': list_windows,
+    'find': find_window,
+    'activate': activate_window,
+    'move': move_window,
+    'resize': resize_window,
+    'close': close_window,
+    'minimize': minimize_window,
+    'maximize': maximize_window,
+    'monitors': get_monitors
+}
+
 def main():
     if len(sys.argv) < 2:
         print(json.dumps({'status': 'error', 'message': 'Usage: python window.py <action> [params]'}))
@@ -209,18 +221,6 @@ def main():
         except:
             params = {}
     
-    actions = {
-        'list': list_windows,
-        'find': find_window,
-        'activate': activate_window,
-        'move': move_window,
-        'resize': resize_window,
-        'close': close_window,
-        'minimize': minimize_window,
-        'maximize': maximize_window,
-        'monitors': get_monitors
-    }
-    
     if action in actions:
         result = actions[action](params)
     else: